@@ -0,0 +1,36 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from openai import NotFoundError
+from services.archivo_service import ArchivoService
+from utils.admision import AdmisionRechazada
+
+router = APIRouter(
+    prefix="/files",
+    tags=["Archivos"]
+)
+
+# El contenido de un file_id no cambia: el navegador puede guardarlo sin revalidar
+CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+@router.get("/{file_id}")
+async def read_archivo(file_id: str, request: Request):
+    """
+    Sirve un archivo generado por el asistente (ej. gráficos del intérprete de código)
+    desde la caché en disco. Soporta `If-None-Match` y pedidos parciales con `Range`.
+    """
+    try:
+        entrada = await ArchivoService().obtener(file_id)
+    except (ValueError, NotFoundError):
+        raise HTTPException(status_code=404, detail=f"Archivo con id {file_id} no encontrado")
+    except AdmisionRechazada:
+        raise
+    except Exception as e:
+        print(f"Error al obtener el archivo {file_id}: {e}")
+        raise HTTPException(status_code=502, detail="No se pudo obtener el archivo.")
+
+    etag = f'"{entrada.digest}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(entrada.ruta, media_type=entrada.media_type, headers=headers)
@@ -5,6 +5,7 @@ from schemas.asistente_schema import AsistenteDBOut, AsistenteUpdate, AsistenteO
 from services.asistente_service import AsistenteService
 from config.db_config import get_db
 from utils.dependencies import get_current_user
+from utils.admision import AdmisionRechazada
 
 router = APIRouter(
     prefix="/asistentes",
@@ -65,5 +66,7 @@ async def generar_prompt(
 ):
     try:
         return await svc.generar_prompt_draft(asistente_id=asistente_id, data=data)
+    except AdmisionRechazada:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends
+from services.cache_calificacion import cache_calificacion
+from services.cache_clasificacion import cache_clasificacion
+from services.prefetch_evaluacion import prefetch_evaluaciones
+from services.vector_store_gateway import vector_store_gateway
+from utils.admision import admision
+from utils.cache_archivos import cache_archivos
+from utils.dependencies import get_current_user
+from utils.metricas import metricas
+
+router = APIRouter(
+    prefix="/metricas",
+    tags=["Métricas"]
+)
+
+
+@router.get("/")
+async def read_metricas(current_user: dict = Depends(get_current_user)):
+    return {
+        "admision": admision.estado(),
+        "cache_archivos": cache_archivos.estado(),
+        "cache_calificacion": cache_calificacion.estado(),
+        "cache_clasificacion": cache_clasificacion.estado(),
+        "prefetch_evaluacion": prefetch_evaluaciones.estado(),
+        "vector_stores": vector_store_gateway.estado(),
+        **metricas.snapshot(),
+    }
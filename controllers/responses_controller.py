@@ -1,9 +1,11 @@
 # controller/chat_controller.py
 from fastapi import APIRouter, Request, Depends
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from services.responses_service import ChatServiceStream
 from config.db_config import get_db
 from sqlalchemy.ext.asyncio import AsyncSession
+from utils.admision import admision
 import asyncio
 import async_timeout  # <--- 1. IMPORTAR LA BIBLIOTECA
 
@@ -14,12 +16,13 @@ router = APIRouter(
     tags=["Responses"]
 )
 
-_sem = asyncio.Semaphore(6)
-
 @router.get("/chat/stream")
-async def chat_stream(request: Request, thread_id: str, texto: str, asistente_id: str, estudiante_id: int, db: AsyncSession = Depends(get_db), limiter = _sem):
+async def chat_stream(request: Request, thread_id: str, texto: str, asistente_id: str, estudiante_id: int, db: AsyncSession = Depends(get_db)):
+
+    svc = ChatServiceStream(db=db)
 
-    svc = ChatServiceStream(db=db, semaphore=limiter)
+    # Se adquiere el lugar antes de abrir el stream para poder responder 429 si no hay capacidad.
+    ticket = await admision.adquirir(asistente_id=asistente_id, estudiante_id=estudiante_id)
 
     async def gen():
         try:
@@ -30,10 +33,11 @@ async def chat_stream(request: Request, thread_id: str, texto: str, asistente_id
                 estudiante_id=estudiante_id,
             )
             async with async_timeout.timeout(180.0):
-                async for delta in iterador_stream:
-                    if await request.is_disconnected():
-                        break
-                    yield f"data: {delta}\n\n"
+                with admision.admitido():
+                    async for delta in iterador_stream:
+                        if await request.is_disconnected():
+                            break
+                        yield f"data: {delta}\n\n"
                 
                 yield "event: done\ndata: {}\n\n"
                 
@@ -42,5 +46,8 @@ async def chat_stream(request: Request, thread_id: str, texto: str, asistente_id
             yield f"event: error\ndata: El asistente está tardando demasiado. Por favor, volvé a intentar en unos segundos."
         except Exception as e:
             yield f"event: error\ndata: {str(e)}\n\n"
+        finally:
+            admision.liberar(ticket)
 
-    return StreamingResponse(gen(), media_type="text/event-stream")
\ No newline at end of file
+    # `liberar` es idempotente: la tarea de fondo cubre el caso en que el generador nunca llega a ejecutarse.
+    return StreamingResponse(gen(), media_type="text/event-stream", background=BackgroundTask(admision.liberar, ticket))
\ No newline at end of file
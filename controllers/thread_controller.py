@@ -1,18 +1,26 @@
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
-from fastapi.responses import JSONResponse
+import asyncio
+import json
+from contextlib import suppress
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
 from schemas.thread_schema import ThreadOut
 from services.thread_service import ThreadService
+from services.job_queue_service import cola_trabajos
 from schemas.mensaje_schema import MensajeOut
 from config.db_config import get_db
 from utils.dependencies import get_current_user
+from utils.admision import AdmisionRechazada
 
 router = APIRouter(
     prefix="/threads",
     tags=["Threads"]
 )
 
+# Intervalo de los comentarios keep-alive del canal SSE, para que proxies no corten la conexión
+SSE_HEARTBEAT = 15.0
+
 def get_thread_service(db: AsyncSession = Depends(get_db)) -> ThreadService:
     return ThreadService(db)
 
@@ -73,10 +81,21 @@ async def delete_thread(
 @router.get("/{id}/messages", response_model=List[MensajeOut])
 async def read_thread_messages(
     id: str,
+    limit: int = Query(30, ge=1, le=100),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
     svc: ThreadService = Depends(get_thread_service)
 ):
+    """
+    Historial del thread leído de la copia local. `before`/`after` reciben el id de un
+    mensaje y devuelven la página anterior/posterior, para el scroll infinito.
+    """
     try:
-        return await svc.get_mensajes(thread_id=id)
+        return await svc.get_mensajes(thread_id=id, limit=limit, before=before, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except AdmisionRechazada:
+        raise
     except Exception as e:
         print(f"Error al obtener mensajes para el thread {id}: {e}")
         raise HTTPException(status_code=500, detail="Error al obtener los mensajes.")
@@ -85,12 +104,13 @@ async def read_thread_messages(
 async def enviar_mensaje_asincrono(
     id: str,
     mensaje_data: dict,
-    background_tasks: BackgroundTasks,
     svc: ThreadService = Depends(get_thread_service)
 ):
     """
     Inicia la generación de la respuesta del asistente en segundo plano.
-    NO espera a que se complete. Responde inmediatamente.
+    NO espera a que se complete. Responde inmediatamente; el run lo conduce
+    el motor de runs a partir del stream de eventos y queda registrado como job
+    `procesar_run` para retomarlo si el proceso se reinicia antes de terminar.
     """
     try:
         await svc.cancelar_runs_pendientes(thread_id=id)
@@ -102,19 +122,19 @@ async def enviar_mensaje_asincrono(
             estudiante_id=mensaje_data["estudiante_id"],
         )
 
-
-        background_tasks.add_task(
-            svc.procesar_run_en_background,
-            id=id,
-            run_id=run_id,
-            asistente_id=mensaje_data["asistente_id"],
-            estudiante_id=mensaje_data["estudiante_id"]
-        )
+        await cola_trabajos.encolar("procesar_run", {
+            "thread_id": id,
+            "run_id": run_id,
+            "asistente_id": mensaje_data["asistente_id"],
+            "estudiante_id": mensaje_data["estudiante_id"],
+        }, ejecutar_local=True)
 
         return JSONResponse(
             status_code=status.HTTP_202_ACCEPTED,
             content={"status": "processing_started", "run_id": run_id, "thread_id": id}
         )
+    except AdmisionRechazada:
+        raise
     except Exception as e:
         print(f"Error inesperado al iniciar el run para el thread {id}: {e}")
         raise HTTPException(status_code=500, detail="No se pudo iniciar la solicitud.")
@@ -125,10 +145,55 @@ async def enviar_mensaje_asincrono(
 async def get_run_status(thread_id: str, run_id: str, svc: ThreadService = Depends(get_thread_service)):
     """
     Endpoint para que el frontend consulte el estado de un run.
-    Es una llamada muy rápida y ligera, protegida con reintentos.
+    Lee el registro en memoria del motor de runs, sin llamar a OpenAI.
     """
     try:
-        run = await svc._retrieve_run_with_retry(thread_id=thread_id, run_id=run_id)
-        return {"status": run.status, "run_id": run.id}
+        return await svc.get_estado_run(thread_id=thread_id, run_id=run_id)
     except Exception:
         raise HTTPException(status_code=404, detail="Run no encontrado.")
+
+
+@router.get("/{id}/runs/{run_id}/events")
+async def stream_run_events(
+    id: str,
+    run_id: str,
+    request: Request,
+    svc: ThreadService = Depends(get_thread_service)
+):
+    """
+    Canal Server-Sent Events que empuja las transiciones de estado del run
+    (queued, in_progress, requires_action, completed, failed...) a medida que ocurren.
+    Reemplaza el polling del frontend sobre `/runs/{run_id}/status`. Si el run dejó una
+    evaluación calificándose, el canal sigue abierto hasta emitir `evaluacion_calificada`.
+    """
+
+    async def gen():
+        eventos = svc.eventos_run(thread_id=id, run_id=run_id).__aiter__()
+        siguiente = asyncio.ensure_future(anext(eventos))
+        try:
+            while True:
+                done, _ = await asyncio.wait({siguiente}, timeout=SSE_HEARTBEAT)
+                if await request.is_disconnected():
+                    break
+                if not done:
+                    yield ": ping\n\n"
+                    continue
+                try:
+                    evento = siguiente.result()
+                except StopAsyncIteration:
+                    break
+                yield f"event: {evento['evento']}\ndata: {json.dumps(evento)}\n\n"
+                siguiente = asyncio.ensure_future(anext(eventos))
+
+            yield "event: done\ndata: {}\n\n"
+
+        except Exception as e:
+            print(f"Error en el canal de eventos del run {run_id}: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        finally:
+            siguiente.cancel()
+            with suppress(asyncio.CancelledError, Exception):
+                await siguiente
+            await eventos.aclose()
+
+    return StreamingResponse(gen(), media_type="text/event-stream")
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Request
+from fastapi.responses import JSONResponse
 from controllers.alumno_controller import router as alumno_router
 from controllers.asistente_controller import router as asistente_router
 from controllers.evaluacion_controller import router as evaluacion_router
@@ -11,10 +12,19 @@ from controllers.unidad_controller import router as unidad_router
 from controllers.auth_controller import router as auth_router
 from controllers.sesion_controller import router as sesion_router
 from controllers.responses_controller import router as responses_router
+from controllers.metricas_controller import router as metricas_router
+from controllers.archivo_controller import router as archivo_router
 from fastapi.middleware.cors import CORSMiddleware
 from config.db_config import Base, engine
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+from utils.admision import AdmisionRechazada
+from services.job_queue_service import cola_trabajos
+from services.thread_pool_service import pool_threads
+from services.clasificador_lexico import clasificador_lexico
+from services.banco_preguntas import banco_preguntas
+import services.job_handlers  # registra los handlers de la cola de trabajos
+import services.tool_handlers  # registra las tools de los asistentes
 
 load_dotenv()
 
@@ -23,9 +33,33 @@ async def lifespan(app: FastAPI):
     print("Iniciando aplicación y creando tablas de la base de datos...")
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+
+    print("Iniciando workers de la cola de trabajos...")
+    await cola_trabajos.iniciar()
+
+    print("Iniciando reposición del pool de threads...")
+    await pool_threads.iniciar()
+
+    print("Armando clasificador léxico de temas...")
+    try:
+        await clasificador_lexico.construir_todos()
+    except Exception as e:
+        print(f"No se pudo armar el clasificador léxico, se arma al primer uso: {e}")
+
+    print("Cargando banco local de preguntas...")
+    try:
+        await banco_preguntas.cargar()
+    except Exception as e:
+        print(f"No se pudo cargar el banco de preguntas, se carga al primer uso: {e}")
     
     yield
 
+    print("Deteniendo reposición del pool de threads...")
+    await pool_threads.detener()
+
+    print("Deteniendo workers de la cola de trabajos...")
+    await cola_trabajos.detener()
+
     print("Cerrando pool de conexiones de la base de datos...")
     await engine.dispose()
 
@@ -41,6 +75,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(AdmisionRechazada)
+async def admision_rechazada_handler(request: Request, exc: AdmisionRechazada):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 @app.get("/ping")
 async def ping():
     return {"status": "ok"}
@@ -59,6 +101,8 @@ api_router.include_router(unidad_router)
 api_router.include_router(auth_router)
 api_router.include_router(sesion_router)
 api_router.include_router(responses_router)
+api_router.include_router(metricas_router)
+api_router.include_router(archivo_router)
 
 app.include_router(api_router)
 
@@ -0,0 +1,20 @@
+from config.db_config import Base
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from datetime import datetime, timezone
+
+
+class CalificacionCache(Base):
+    """
+    Resultados de las llamadas al LLM de calificación, por hash de las preguntas y
+    respuestas normalizadas y de la versión del prompt.
+    """
+    __tablename__ = "calificacion_cache"
+
+    clave = Column(String(64), primary_key=True)
+    resultado = Column(JSON, nullable=False)
+    aciertos = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    usado_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), index=True)
+
+    def __repr__(self):
+        return f"<CalificacionCache(clave='{self.clave}', aciertos={self.aciertos})>"
@@ -10,13 +10,15 @@ class Evaluacion(Base):
     evaluacion_id = Column(Integer, primary_key=True, index=True)
     nota = Column(Float, nullable=False)
     evaluacion_fecha = Column(DateTime(timezone=True),
-                              default=datetime.now(timezone.utc))
+                              default=lambda: datetime.now(timezone.utc))
     subtema_id = Column(Integer, ForeignKey("subtema.subtema_id"), nullable=False)
     estudiante_id = Column(Integer, ForeignKey("estudiante.estudiante_id"), nullable=False)
     asistente_id = Column(String, ForeignKey("asistente.asistente_id"), nullable=False)
     pendiente = Column(Boolean, nullable=False, default=True)
 
     subtema = relationship("Subtema", back_populates="evaluaciones")
+    # Los ítems se borran en la DB (ON DELETE CASCADE), sin cargarlos
+    items = relationship("EvaluacionItem", order_by="EvaluacionItem.orden", passive_deletes=True)
 
     def __repr__(self):
         return f"<Evaluacion(evaluacion_id={self.evaluacion_id}, nota={self.nota})>"
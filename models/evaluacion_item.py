@@ -0,0 +1,27 @@
+from config.db_config import Base
+from sqlalchemy import Column, Integer, String, Text, Float, JSON, ForeignKey
+
+
+class EvaluacionItem(Base):
+    """
+    Preguntas que se le presentaron al estudiante en una evaluación, en orden.
+    """
+    __tablename__ = "evaluacion_item"
+
+    id = Column(Integer, primary_key=True)
+    evaluacion_id = Column(Integer, ForeignKey("evaluacion.evaluacion_id", ondelete="CASCADE"),
+                           nullable=False, index=True)
+    orden = Column(Integer, nullable=False)
+    # Id de la pregunta en el banco, el pool o el vector store (si lo tiene)
+    pregunta_id = Column(String(100), nullable=True)
+    texto = Column(Text, nullable=False)
+    # Solo en ítems de opciones (single_choice/multiple_choice) con clave de respuestas
+    tipo = Column(String(30), nullable=True)
+    opciones = Column(JSON, nullable=True)
+    clave = Column(JSON, nullable=True)             # índices (desde 0) de las opciones correctas
+    # Resultado de la calificación: puntaje de 0 a 1 y, si se corrigió localmente, las opciones elegidas
+    puntaje = Column(Float, nullable=True)
+    respuesta = Column(JSON, nullable=True)
+
+    def __repr__(self):
+        return f"<EvaluacionItem(evaluacion_id={self.evaluacion_id}, orden={self.orden})>"
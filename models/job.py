@@ -0,0 +1,27 @@
+from config.db_config import Base
+from sqlalchemy import Column, Integer, String, DateTime, Text, JSON
+from datetime import datetime, timezone
+
+
+class Job(Base):
+    __tablename__ = "job"
+
+    job_id = Column(Integer, primary_key=True, index=True)
+    tipo = Column(String(100), nullable=False, index=True)
+    payload = Column(JSON, nullable=False)
+    estado = Column(String(20), nullable=False, default="pendiente", index=True)
+    intentos = Column(Integer, nullable=False, default=0)
+    max_intentos = Column(Integer, nullable=False, default=5)
+    disponible_en = Column(DateTime(timezone=True), nullable=False,
+                           default=lambda: datetime.now(timezone.utc))
+    lease_hasta = Column(DateTime(timezone=True), nullable=True)
+    worker_id = Column(String(100), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True),
+                        default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime(timezone=True),
+                        default=lambda: datetime.now(timezone.utc),
+                        onupdate=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<Job(job_id={self.job_id}, tipo='{self.tipo}', estado='{self.estado}')>"
@@ -0,0 +1,21 @@
+from config.db_config import Base
+from sqlalchemy import Column, Integer, String, ForeignKey, JSON
+
+
+class Mensaje(Base):
+    """
+    Copia local de los mensajes de un thread de OpenAI. `id` respeta el orden en que
+    se sincronizaron (ascendente), y es el que se usa para paginar.
+    """
+    __tablename__ = "mensaje"
+
+    id = Column(Integer, primary_key=True, index=True)
+    mensaje_id = Column(String(100), nullable=False, unique=True)
+    thread_id = Column(String(100), ForeignKey("thread.id", ondelete="CASCADE"), nullable=False, index=True)
+    run_id = Column(String(255), nullable=True)
+    rol = Column(String(20), nullable=False)
+    partes = Column(JSON, nullable=False)
+    created_at = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<Mensaje(mensaje_id={self.mensaje_id}, rol='{self.rol}')>"
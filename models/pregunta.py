@@ -1,5 +1,5 @@
 from config.db_config import Base
-from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, String
+from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, String, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 
@@ -10,7 +10,7 @@ class Pregunta(Base):
     pregunta_id = Column(Integer, primary_key=True, index=True)
     contenido = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True),
-                        default=datetime.now(timezone.utc))
+                        default=lambda: datetime.now(timezone.utc))
     subtema_id = Column(Integer, ForeignKey("subtema.subtema_id"), nullable=False)
     unidad_id = Column(Integer, ForeignKey("unidad.unidad_id"), nullable=False)
     estudiante_id = Column(Integer, ForeignKey("estudiante.estudiante_id"), nullable=False)
@@ -19,5 +19,10 @@ class Pregunta(Base):
 
     asistente = relationship("Asistente", back_populates="preguntas")
 
+    __table_args__ = (
+        # Última pregunta de un estudiante (contexto para clasificar la siguiente)
+        Index("ix_pregunta_estudiante_id_pregunta_id", "estudiante_id", "pregunta_id"),
+    )
+
     def __repr__(self):
         return f"<Pregunta(pregunta_id={self.pregunta_id}, contenido='{self.contenido[:20]}...')>"
@@ -0,0 +1,25 @@
+from config.db_config import Base
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, UniqueConstraint, Index
+from datetime import datetime, timezone
+
+
+class PreguntaGenerada(Base):
+    """
+    Preguntas de evaluación generadas de antemano y todavía sin usar, por subtema.
+    """
+    __tablename__ = "pregunta_generada"
+
+    id = Column(Integer, primary_key=True)
+    subtema_id = Column(Integer, ForeignKey("subtema.subtema_id"), nullable=False)
+    # Id estable del texto normalizado (el mismo que usa el banco de preguntas)
+    hash = Column(String(40), nullable=False)
+    texto = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        UniqueConstraint("subtema_id", "hash", name="uq_pregunta_generada_subtema_hash"),
+        Index("ix_pregunta_generada_subtema_id_id", "subtema_id", "id"),
+    )
+
+    def __repr__(self):
+        return f"<PreguntaGenerada(id={self.id}, subtema_id={self.subtema_id})>"
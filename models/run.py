@@ -1,5 +1,5 @@
 from config.db_config import Base
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
 from datetime import datetime, timezone
 
 class Run(Base):
@@ -8,5 +8,16 @@ class Run(Base):
 
     run_id = Column(String(255), primary_key=True)
     status =  Column(String(255), nullable=False)
-    created_at = Column(DateTime(timezone=True), default=datetime.now(timezone.utc))
-    last_error = Column(String(255), nullable=True)
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    last_error = Column(String(255), nullable=True)
+    thread_id = Column(String(100), ForeignKey("thread.id", ondelete="SET NULL"), nullable=True, index=True)
+    estudiante_id = Column(Integer, ForeignKey("estudiante.estudiante_id"), nullable=True, index=True)
+    asistente_id = Column(String(100), ForeignKey("asistente.asistente_id"), nullable=True)
+    primer_token_at = Column(DateTime(timezone=True), nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    total_tokens = Column(Integer, nullable=True)
+
+    def __repr__(self):
+        return f"<Run(run_id={self.run_id}, status='{self.status}')>"
@@ -0,0 +1,17 @@
+from config.db_config import Base
+from sqlalchemy import Column, String, DateTime
+from datetime import datetime, timezone
+
+
+class ThreadPool(Base):
+    """
+    Threads de OpenAI ya creados y todavía sin asignar a ningún estudiante.
+    """
+    __tablename__ = "thread_pool"
+
+    id = Column(String(100), primary_key=True)
+    created_at = Column(DateTime(timezone=True),
+                        default=lambda: datetime.now(timezone.utc), index=True)
+
+    def __repr__(self):
+        return f"<ThreadPool(id={self.id})>"
@@ -1,3 +1,21 @@
-from openai import AsyncOpenAI
+import os
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 
-client = AsyncOpenAI()
\ No newline at end of file
+load_dotenv()
+
+# Pool de conexiones keep-alive compartido por todas las llamadas a OpenAI del proceso
+OPENAI_MAX_CONEXIONES = int(os.getenv("OPENAI_MAX_CONEXIONES", "50"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_KEEPALIVE_SEGUNDOS = float(os.getenv("OPENAI_KEEPALIVE_SEGUNDOS", "60"))
+
+client = AsyncOpenAI(
+    http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONEXIONES,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_SEGUNDOS,
+        )
+    )
+)
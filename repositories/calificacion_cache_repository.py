@@ -0,0 +1,54 @@
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.calificacion_cache import CalificacionCache
+
+
+class CalificacionCacheRepository:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def usar(self, clave: str) -> Optional[dict]:
+        """
+        Devuelve el resultado guardado para la clave y registra el acierto.
+        """
+        result = await self.db.execute(
+            update(CalificacionCache)
+            .where(CalificacionCache.clave == clave)
+            .values(aciertos=CalificacionCache.aciertos + 1, usado_at=datetime.now(timezone.utc))
+            .returning(CalificacionCache.resultado)
+        )
+        resultado = result.scalar_one_or_none()
+        await self.db.commit()
+        return resultado
+
+    async def guardar(self, clave: str, resultado: dict):
+        await self.db.execute(
+            insert(CalificacionCache)
+            .values(clave=clave, resultado=resultado)
+            .on_conflict_do_nothing(index_elements=[CalificacionCache.clave])
+        )
+        await self.db.commit()
+
+    async def contar(self) -> int:
+        result = await self.db.execute(select(func.count()).select_from(CalificacionCache))
+        return result.scalar_one()
+
+    async def recortar(self, max_entradas: int) -> int:
+        """
+        Deja solo las `max_entradas` entradas usadas más recientemente. Devuelve cuántas borró.
+        """
+        sobrantes = (
+            select(CalificacionCache.clave)
+            .order_by(CalificacionCache.usado_at.desc())
+            .offset(max_entradas)
+        )
+        result = await self.db.execute(
+            delete(CalificacionCache)
+            .where(CalificacionCache.clave.in_(sobrantes))
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.commit()
+        return result.rowcount
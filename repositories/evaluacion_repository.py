@@ -1,5 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from models.evaluacion import Evaluacion
+from models.evaluacion_item import EvaluacionItem
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 from models.subtema import Subtema
@@ -53,6 +54,30 @@ class EvaluacionRepository:
         await self.db.refresh(nueva_evaluacion)
         return nueva_evaluacion
 
+    async def create_con_items(self, evaluacion_data: dict, preguntas: List[dict]) -> Evaluacion:
+        """
+        Crea la evaluación junto con sus ítems ({"id", "text"} y, en los de opciones, "tipo",
+        "opciones" y "clave") en una sola transacción.
+        """
+        nueva_evaluacion = Evaluacion(**evaluacion_data)
+        nueva_evaluacion.items = [
+            EvaluacionItem(orden=i, pregunta_id=p.get("id"), texto=p["text"], tipo=p.get("tipo"),
+                           opciones=p.get("opciones"), clave=p.get("clave"))
+            for i, p in enumerate(preguntas, start=1)
+        ]
+        self.db.add(nueva_evaluacion)
+        await self.db.commit()
+        await self.db.refresh(nueva_evaluacion)
+        return nueva_evaluacion
+
+    async def get_items(self, evaluacion_id: int) -> List[EvaluacionItem]:
+        result = await self.db.execute(
+            select(EvaluacionItem)
+            .where(EvaluacionItem.evaluacion_id == evaluacion_id)
+            .order_by(EvaluacionItem.orden)
+        )
+        return list(result.scalars().all())
+
     async def update(self, evaluacion: Evaluacion, update_data: dict) -> Evaluacion:
         for key, value in update_data.items():
             setattr(evaluacion, key, value)
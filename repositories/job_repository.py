@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.job import Job
+
+
+class JobRepository:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_by_id(self, job_id: int) -> Optional[Job]:
+        result = await self.db.execute(select(Job).where(Job.job_id == job_id))
+        return result.scalars().first()
+
+    async def create(self, job_data: dict) -> Job:
+        nuevo_job = Job(**job_data)
+        self.db.add(nuevo_job)
+        await self.db.commit()
+        await self.db.refresh(nuevo_job)
+        return nuevo_job
+
+    async def reclamar(self, tipos: List[str], worker_id: str, lease_segundos: float, limite: int = 1) -> List[Job]:
+        """
+        Toma hasta `limite` jobs disponibles de los tipos indicados: pendientes cuyo
+        `disponible_en` ya pasó, o en curso cuyo lease venció (worker caído) y que todavía
+        tienen intentos.
+        `FOR UPDATE SKIP LOCKED` evita que dos workers tomen el mismo job.
+        """
+        ahora = datetime.now(timezone.utc)
+        disponibles = (
+            select(Job.job_id)
+            .where(
+                Job.tipo.in_(tipos),
+                or_(
+                    and_(Job.estado == "pendiente", Job.disponible_en <= ahora),
+                    and_(Job.estado == "en_curso", Job.lease_hasta < ahora, Job.intentos < Job.max_intentos),
+                )
+            )
+            .order_by(Job.job_id)
+            .limit(limite)
+            .with_for_update(skip_locked=True)
+        )
+        result = await self.db.execute(
+            update(Job)
+            .where(Job.job_id.in_(disponibles.scalar_subquery()))
+            .values(
+                estado="en_curso",
+                worker_id=worker_id,
+                lease_hasta=ahora + timedelta(seconds=lease_segundos),
+                intentos=Job.intentos + 1,
+            )
+            .returning(Job)
+            .execution_options(synchronize_session=False)
+        )
+        jobs = result.scalars().all()
+        await self.db.commit()
+        return jobs
+
+    async def renovar_lease(self, job_ids: List[int], worker_id: str, lease_segundos: float) -> None:
+        await self.db.execute(
+            update(Job)
+            .where(Job.job_id.in_(job_ids), Job.worker_id == worker_id, Job.estado == "en_curso")
+            .values(lease_hasta=datetime.now(timezone.utc) + timedelta(seconds=lease_segundos))
+        )
+        await self.db.commit()
+
+    async def completar(self, job_ids: List[int]) -> None:
+        await self.db.execute(
+            update(Job)
+            .where(Job.job_id.in_(job_ids))
+            .values(estado="completado", lease_hasta=None, last_error=None)
+        )
+        await self.db.commit()
+
+    async def fallar(self, job_id: int, error: str, reintentar_en: float) -> None:
+        job = await self.get_by_id(job_id)
+        if not job:
+            return
+        job.last_error = error
+        job.lease_hasta = None
+        if job.intentos >= job.max_intentos:
+            job.estado = "fallido"
+        else:
+            job.estado = "pendiente"
+            job.disponible_en = datetime.now(timezone.utc) + timedelta(seconds=reintentar_en)
+        await self.db.commit()
+
+    async def liberar_vencidos(self) -> int:
+        """
+        Devuelve a `pendiente` los jobs en curso cuyo lease venció y que todavía tienen
+        intentos, para que se retomen apenas arrancan los workers.
+        """
+        result = await self.db.execute(
+            update(Job)
+            .where(Job.estado == "en_curso", Job.lease_hasta < datetime.now(timezone.utc),
+                   Job.intentos < Job.max_intentos)
+            .values(estado="pendiente", lease_hasta=None, worker_id=None)
+        )
+        await self.db.commit()
+        return result.rowcount
+
+    async def agotar_vencidos(self) -> List[Job]:
+        """
+        Marca como fallidos los jobs en curso cuyo lease venció en el último intento (el
+        worker se cayó o se colgó ejecutándolos) y los devuelve.
+        """
+        result = await self.db.execute(
+            update(Job)
+            .where(Job.estado == "en_curso", Job.lease_hasta < datetime.now(timezone.utc),
+                   Job.intentos >= Job.max_intentos)
+            .values(estado="fallido", lease_hasta=None, worker_id=None,
+                    last_error="El lease venció en el último intento (worker caído o colgado)")
+            .returning(Job)
+            .execution_options(synchronize_session=False)
+        )
+        jobs = result.scalars().all()
+        await self.db.commit()
+        return jobs
+
+    async def purgar_completados(self, antes_de: datetime) -> int:
+        result = await self.db.execute(
+            delete(Job)
+            .where(Job.estado == "completado", Job.updated_at < antes_de)
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.commit()
+        return result.rowcount
+
+    async def liberar_de_worker(self, worker_id: str) -> int:
+        """
+        Libera los leases de un worker que se apaga ordenadamente, para que otro proceso
+        los tome sin esperar a que venzan.
+        """
+        result = await self.db.execute(
+            update(Job)
+            .where(Job.estado == "en_curso", Job.worker_id == worker_id)
+            .values(estado="pendiente", lease_hasta=None, worker_id=None)
+        )
+        await self.db.commit()
+        return result.rowcount
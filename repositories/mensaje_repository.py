@@ -0,0 +1,64 @@
+from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.mensaje import Mensaje
+
+
+class MensajeRepository:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_by_mensaje_id(self, mensaje_id: str) -> Optional[Mensaje]:
+        result = await self.db.execute(
+            select(Mensaje).where(Mensaje.mensaje_id == mensaje_id)
+        )
+        return result.scalars().first()
+
+    async def get_ultimo(self, thread_id: str) -> Optional[Mensaje]:
+        result = await self.db.execute(
+            select(Mensaje)
+            .where(Mensaje.thread_id == thread_id)
+            .order_by(Mensaje.id.desc())
+            .limit(1)
+        )
+        return result.scalars().first()
+
+    async def get_by_thread(self, thread_id: str, limit: int, antes_de: Optional[int] = None,
+                            despues_de: Optional[int] = None) -> List[Mensaje]:
+        """
+        Devuelve hasta `limit` mensajes en orden ascendente. Sin cursores, los más recientes;
+        con `antes_de`/`despues_de` (ids locales), los inmediatamente anteriores/posteriores.
+        """
+        query = select(Mensaje).where(Mensaje.thread_id == thread_id)
+        if despues_de is not None:
+            query = query.where(Mensaje.id > despues_de).order_by(Mensaje.id.asc())
+        else:
+            if antes_de is not None:
+                query = query.where(Mensaje.id < antes_de)
+            query = query.order_by(Mensaje.id.desc())
+        result = await self.db.execute(query.limit(limit))
+        mensajes = result.scalars().all()
+        return sorted(mensajes, key=lambda m: m.id)
+
+    async def get_by_rol_posteriores(self, thread_id: str, rol: str, desde: int) -> List[Mensaje]:
+        """
+        Mensajes de `rol` del thread creados después del segundo `desde` (unix), en orden.
+        """
+        result = await self.db.execute(
+            select(Mensaje)
+            .where(Mensaje.thread_id == thread_id, Mensaje.rol == rol, Mensaje.created_at > desde)
+            .order_by(Mensaje.id.asc())
+        )
+        return list(result.scalars().all())
+
+    async def upsert_many(self, mensajes: List[dict]) -> None:
+        if not mensajes:
+            return
+        stmt = insert(Mensaje).values(mensajes)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Mensaje.mensaje_id],
+            set_={"partes": stmt.excluded.partes, "run_id": stmt.excluded.run_id},
+        )
+        await self.db.execute(stmt)
+        await self.db.commit()
@@ -0,0 +1,61 @@
+from typing import Dict, List
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.pregunta_generada import PreguntaGenerada
+
+
+class PreguntaGeneradaRepository:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def contar(self, subtema_id: int) -> int:
+        result = await self.db.execute(
+            select(func.count()).select_from(PreguntaGenerada).where(PreguntaGenerada.subtema_id == subtema_id)
+        )
+        return result.scalar_one()
+
+    async def get_hashes(self, subtema_id: int) -> List[str]:
+        result = await self.db.execute(
+            select(PreguntaGenerada.hash).where(PreguntaGenerada.subtema_id == subtema_id)
+        )
+        return list(result.scalars().all())
+
+    async def agregar(self, subtema_id: int, preguntas: Dict[str, str]) -> int:
+        """
+        Agrega preguntas {hash: texto} al pool del subtema; las repetidas se ignoran.
+        Devuelve la cantidad insertada.
+        """
+        if not preguntas:
+            return 0
+        result = await self.db.execute(
+            insert(PreguntaGenerada)
+            .values([{"subtema_id": subtema_id, "hash": h, "texto": t} for h, t in preguntas.items()])
+            .on_conflict_do_nothing(constraint="uq_pregunta_generada_subtema_hash")
+            .returning(PreguntaGenerada.id)
+        )
+        insertadas = len(result.scalars().all())
+        await self.db.commit()
+        return insertadas
+
+    async def tomar(self, subtema_id: int, n: int) -> List[PreguntaGenerada]:
+        """
+        Quita del pool las `n` preguntas más antiguas del subtema y las devuelve. `SKIP LOCKED`
+        evita que dos evaluaciones simultáneas reciban las mismas.
+        """
+        disponibles = (
+            select(PreguntaGenerada.id)
+            .where(PreguntaGenerada.subtema_id == subtema_id)
+            .order_by(PreguntaGenerada.id)
+            .limit(n)
+            .with_for_update(skip_locked=True)
+        )
+        result = await self.db.execute(
+            delete(PreguntaGenerada)
+            .where(PreguntaGenerada.id.in_(disponibles))
+            .returning(PreguntaGenerada)
+            .execution_options(synchronize_session=False)
+        )
+        tomadas = sorted(result.scalars().all(), key=lambda p: p.id)
+        await self.db.commit()
+        return tomadas
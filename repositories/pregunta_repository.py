@@ -1,7 +1,8 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import insert, select
 from sqlalchemy.orm import selectinload
-from typing import List, Optional
+from datetime import datetime
+from typing import List, Optional, Tuple
 from models.pregunta import Pregunta
 from models.tema import Tema
 from models.unidad import Unidad
@@ -28,14 +29,37 @@ class PreguntaRepository:
         await self.db.refresh(nueva_pregunta)
         return nueva_pregunta
 
+    async def insert_many(self, preguntas: List[dict]) -> None:
+        """
+        Inserta varias preguntas con un único INSERT multi-fila. No hace commit: lo confirma
+        quien llama, junto con el resto de su transacción.
+        """
+        if preguntas:
+            await self.db.execute(insert(Pregunta).values(preguntas))
+
     async def get_ultima_pregunta_by_estudiante(self, estudiante_id: int) -> Pregunta:
         result = await self.db.execute(
             select(Pregunta)
             .where(Pregunta.estudiante_id == estudiante_id)
             .order_by(Pregunta.pregunta_id.desc())
+            .limit(1)
         )
         return result.scalars().first()
 
+    async def get_ultimo_contexto_by_estudiante(self, estudiante_id: int) -> Optional[Tuple[int, int, datetime]]:
+        """
+        Devuelve (subtema_id, unidad_id, created_at) de la última pregunta del estudiante,
+        leyendo solo esas columnas (usa el índice de estudiante_id, pregunta_id).
+        """
+        result = await self.db.execute(
+            select(Pregunta.subtema_id, Pregunta.unidad_id, Pregunta.created_at)
+            .where(Pregunta.estudiante_id == estudiante_id)
+            .order_by(Pregunta.pregunta_id.desc())
+            .limit(1)
+        )
+        fila = result.first()
+        return tuple(fila) if fila else None
+
     async def update(self, pregunta: Pregunta, update_data: dict) -> Pregunta:
         for key, value in update_data.items():
             setattr(pregunta, key, value)
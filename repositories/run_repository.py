@@ -1,3 +1,6 @@
+from typing import Optional
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
 from models.run import Run
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -6,9 +9,32 @@ class RunRepository:
     def __init__(self, db: AsyncSession):
         self.db = db
 
+    async def get_by_id(self, run_id: str) -> Optional[Run]:
+        result = await self.db.execute(
+            select(Run).where(Run.run_id == run_id)
+        )
+        return result.scalars().first()
+
     async def create_run(self, data: dict):
         nueva_run = Run(**data)
         self.db.add(nueva_run)
         await self.db.commit()
         await self.db.refresh(nueva_run)
         return nueva_run
+
+    async def upsert(self, run_id: str, data: dict) -> None:
+        """
+        Inserta el run o, si ya existe (ej. un run retomado), actualiza sus columnas.
+        """
+        actualizables = {k: v for k, v in data.items() if k != "created_at"}
+        stmt = insert(Run).values(run_id=run_id, **data).on_conflict_do_update(
+            index_elements=[Run.run_id], set_=actualizables
+        )
+        await self.db.execute(stmt)
+        await self.db.commit()
+
+    async def update_campos(self, run_id: str, data: dict) -> None:
+        await self.db.execute(
+            update(Run).where(Run.run_id == run_id).values(**data)
+        )
+        await self.db.commit()
@@ -0,0 +1,34 @@
+from typing import List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.asistente import Asistente
+from models.subtema import Subtema
+from models.tema import Tema
+from models.unidad import Unidad
+
+
+class SubtemaRepository:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_taxonomia_by_vector_store(self, vector_store_id: str) -> List[Tuple[int, str, str, int]]:
+        """
+        Devuelve (subtema_id, nombre del subtema, nombre del tema, unidad_id) de las materias
+        de los asistentes que usan el vector store de temas indicado.
+        """
+        materias = select(Asistente.materia_id).where(Asistente.vs_temas_id == vector_store_id)
+        result = await self.db.execute(
+            select(Subtema.subtema_id, Subtema.nombre, Tema.nombre, Tema.unidad_id)
+            .join(Tema, Subtema.tema_id == Tema.tema_id)
+            .join(Unidad, Tema.unidad_id == Unidad.unidad_id)
+            .where(Unidad.materia_id.in_(materias))
+        )
+        return [tuple(fila) for fila in result.all()]
+
+    async def get_nombre(self, subtema_id: int) -> Optional[str]:
+        result = await self.db.execute(select(Subtema.nombre).where(Subtema.subtema_id == subtema_id))
+        return result.scalar_one_or_none()
+
+    async def get_vector_stores_temas(self) -> List[str]:
+        result = await self.db.execute(select(Asistente.vs_temas_id).distinct())
+        return list(result.scalars().all())
@@ -0,0 +1,43 @@
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.thread_pool import ThreadPool
+
+
+class ThreadPoolRepository:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def contar(self) -> int:
+        result = await self.db.execute(select(func.count()).select_from(ThreadPool))
+        return result.scalar_one()
+
+    async def agregar(self, thread_ids: List[str]) -> None:
+        self.db.add_all([ThreadPool(id=thread_id) for thread_id in thread_ids])
+        await self.db.commit()
+
+    async def reclamar(self) -> Optional[str]:
+        """
+        Quita del pool el thread más antiguo y devuelve su id. No hace commit: quien lo
+        reclama confirma la transacción junto con el alta del thread, así un error en el
+        alta lo devuelve al pool. `SKIP LOCKED` evita que dos solicitudes tomen el mismo.
+        """
+        disponible = (
+            select(ThreadPool.id)
+            .order_by(ThreadPool.created_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        result = await self.db.execute(
+            delete(ThreadPool).where(ThreadPool.id == disponible).returning(ThreadPool.id)
+        )
+        return result.scalar_one_or_none()
+
+    async def descartar_anteriores(self, fecha: datetime) -> List[str]:
+        result = await self.db.execute(
+            delete(ThreadPool).where(ThreadPool.created_at < fecha).returning(ThreadPool.id)
+        )
+        await self.db.commit()
+        return list(result.scalars().all())
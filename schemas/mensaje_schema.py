@@ -9,7 +9,8 @@ class ParteTexto(BaseModel):
 
 class ParteImagen(BaseModel):
     type: Literal["image"] = "image"
-    data_url: str          # data:image/png;base64,AAAB...
+    file_id: str
+    url: str               # /api/v2/files/{file_id}
 
 ContentPart = ParteTexto | ParteImagen
 
@@ -0,0 +1,87 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+from openai_client import client
+from utils.admision import admision
+from utils.cache_archivos import cache_archivos, EntradaCache
+from utils.metricas import metricas
+
+load_dotenv()
+
+# Ruta pública del endpoint que sirve los archivos cacheados (ver archivo_controller)
+URL_ARCHIVOS = os.getenv("URL_ARCHIVOS", "/api/v2/files")
+# Descargas simultáneas por precarga y tiempo máximo por archivo (en segundos)
+ARCHIVOS_CONCURRENCIA = int(os.getenv("ARCHIVOS_CONCURRENCIA", "4"))
+ARCHIVOS_TIMEOUT = float(os.getenv("ARCHIVOS_TIMEOUT", "10"))
+
+# Firmas de los formatos de imagen que genera el intérprete de código
+_FIRMAS = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+)
+
+
+def url_archivo(file_id: str) -> str:
+    return f"{URL_ARCHIVOS}/{file_id}"
+
+
+class ArchivoService:
+    def __init__(self, concurrencia: int = ARCHIVOS_CONCURRENCIA, timeout: float = ARCHIVOS_TIMEOUT):
+        self.concurrencia = concurrencia
+        self.timeout = timeout
+
+    async def obtener(self, file_id: str) -> EntradaCache:
+        """
+        Devuelve el contenido de un archivo generado por un asistente, desde la caché en
+        disco o descargándolo de OpenAI. Solo se sirven archivos de salida de asistentes.
+        """
+        return await cache_archivos.obtener(file_id, lambda: self._descargar(file_id))
+
+    async def precargar(self, file_ids: list[str]) -> dict[str, bool]:
+        """
+        Asegura que los archivos estén en la caché descargando los que falten en paralelo,
+        con a lo sumo `concurrencia` descargas a la vez y `timeout` segundos por archivo.
+        Devuelve, por file_id, si quedó disponible; un archivo que falla no afecta al resto.
+        """
+        disponibles = {file_id: True for file_id in file_ids}
+        faltantes = [f for f in disponibles if cache_archivos.obtener_local(f) is None]
+        if not faltantes:
+            return disponibles
+
+        limite = asyncio.Semaphore(self.concurrencia)
+
+        async def precargar_uno(file_id: str):
+            async with limite:
+                try:
+                    async with asyncio.timeout(self.timeout):
+                        await self.obtener(file_id)
+                except Exception as e:
+                    print(f"ERROR: No se pudo precargar el file_id {file_id}. Error: {e!r}")
+                    disponibles[file_id] = False
+
+        async with asyncio.TaskGroup() as tg:
+            for file_id in faltantes:
+                tg.create_task(precargar_uno(file_id))
+        return disponibles
+
+    async def _descargar(self, file_id: str) -> tuple[bytes, str]:
+        with metricas.medir("archivos.descarga_s"):
+            return await self._descargar_openai(file_id)
+
+    async def _descargar_openai(self, file_id: str) -> tuple[bytes, str]:
+        async with admision.slot():
+            archivo = await client.files.retrieve(file_id)
+            if archivo.purpose != "assistants_output":
+                raise ValueError(f"Archivo con id {file_id} no encontrado")
+            raw = await client.files.content(file_id)
+        contenido = raw.content
+        return contenido, self._media_type(contenido, raw.response.headers.get("content-type"))
+
+    def _media_type(self, contenido: bytes, declarado: str | None) -> str:
+        for firma, media_type in _FIRMAS:
+            if contenido.startswith(firma):
+                return media_type
+        if contenido[:4] == b"RIFF" and contenido[8:12] == b"WEBP":
+            return "image/webp"
+        return declarado or "application/octet-stream"
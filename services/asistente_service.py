@@ -4,6 +4,7 @@ from models.asistente import Asistente
 from typing import Dict, Any, List
 from sqlalchemy.ext.asyncio import AsyncSession
 from openai_client import client
+from utils.admision import admision
 
 class AsistenteService:
     def __init__(self, db: AsyncSession):
@@ -16,9 +17,10 @@ class AsistenteService:
 
         print("ASISTENTE ID")
         print(asistente_id)
-        asistente = await client.beta.assistants.retrieve(
-            assistant_id=asistente_id
-        )
+        async with admision.slot(asistente_id=asistente_id):
+            asistente = await client.beta.assistants.retrieve(
+                assistant_id=asistente_id
+            )
         if not asistente:
             raise ValueError(f"Asistente con el id {asistente_id} no encontrado")
         return asistente
@@ -31,11 +33,12 @@ class AsistenteService:
     # Este método se encarga de actualizar tanto el objeto Asistente de la DB como el de la API.
     async def update_asistente(self, asistente_id: str, update_data: Dict[str, Any]) -> dict:
         # 1. Actualizar en OpenAI de forma no bloqueante
-        asistente_api = await client.beta.assistants.update(
-            assistant_id=asistente_id,
-            instructions=update_data.get("instructions"),
-            name=update_data.get("nombre")
-        )
+        async with admision.slot(asistente_id=asistente_id):
+            asistente_api = await client.beta.assistants.update(
+                assistant_id=asistente_id,
+                instructions=update_data.get("instructions"),
+                name=update_data.get("nombre")
+            )
 
         # 2. Actualizar en base de datos de forma asíncrona
         asistente_db = await self.asistente_repo.get_by_id(asistente_id)
@@ -60,9 +63,10 @@ class AsistenteService:
     async def generar_prompt_draft(self, asistente_id: str, data: dict):
         # La implementación original ya era 'async' pero las llamadas eran bloqueantes.
         # Ahora se ejecutan en hilos separados.
-        a = await client.beta.assistants.retrieve(
-            assistant_id=asistente_id
-        )
+        async with admision.slot(asistente_id=asistente_id):
+            a = await client.beta.assistants.retrieve(
+                assistant_id=asistente_id
+            )
         prompt_base = a.instructions.strip()
 
         msg_system = {
@@ -76,11 +80,12 @@ class AsistenteService:
 
         msg_user = self.construir_prompt_usuario({**data, "base_prompt": prompt_base})
 
-        rsp = await client.chat.completions.create(
-            model="gpt-4o",
-            messages=[msg_system, msg_user],
-            temperature=0.3
-        )
+        async with admision.slot(asistente_id=asistente_id):
+            rsp = await client.chat.completions.create(
+                model="gpt-4o",
+                messages=[msg_system, msg_user],
+                temperature=0.3
+            )
 
         return {"draft": rsp.choices[0].message.content.strip()}
 
@@ -0,0 +1,173 @@
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+from services.calificador_local import es_cerrado
+from utils.metricas import metricas
+from utils.texto import normalizar_texto
+
+load_dotenv()
+
+# JSONL de preguntas de evaluación (los mismos que se cargan a los vector stores de evaluaciones)
+BANCO_PREGUNTAS_PATRONES = os.getenv(
+    "BANCO_PREGUNTAS_PATRONES",
+    "utils/embeddings/*/preguntas/preguntas*.jsonl,embeddings/preguntas/*/preguntas*.jsonl",
+).split(",")
+# Cada cuánto se revisa si cambiaron los archivos
+BANCO_PREGUNTAS_INTERVALO_REVISION = float(os.getenv("BANCO_PREGUNTAS_INTERVALO_REVISION", "10"))
+# Cantidad de estudiantes de los que se recuerdan las preguntas ya servidas
+BANCO_PREGUNTAS_MAX_ESTUDIANTES = int(os.getenv("BANCO_PREGUNTAS_MAX_ESTUDIANTES", "20000"))
+
+
+@dataclass(frozen=True)
+class PreguntasSubtema:
+    ids: Tuple[str, ...]
+    textos: Tuple[str, ...]
+    # {"tipo", "opciones", "clave"} de los ítems de opciones con clave de respuestas; None en el resto
+    cerradas: Tuple[Optional[dict], ...]
+
+
+def item_cerrado(metadata: dict) -> Optional[dict]:
+    """
+    Lee de la metadata de una pregunta `question_type`, `options` y `answer_key` (índices
+    desde 0 de las opciones correctas). Devuelve None si no es un ítem que se pueda
+    corregir localmente.
+    """
+    tipo, opciones, clave = metadata.get("question_type"), metadata.get("options"), metadata.get("answer_key")
+    if not es_cerrado(tipo, opciones, clave):
+        return None
+    return {"tipo": tipo, "opciones": list(opciones), "clave": [int(i) for i in clave]}
+
+
+def id_pregunta(texto: str, metadata: dict) -> str:
+    # Los JSONL no siempre traen question_id: se usa un hash estable del texto normalizado.
+    if metadata.get("question_id"):
+        return str(metadata["question_id"])
+    return "q-" + hashlib.sha1(normalizar_texto(texto).encode("utf-8")).hexdigest()[:16]
+
+
+class BancoPreguntas:
+    """
+    Preguntas de evaluación por subtopic_id cargadas desde los JSONL del repo, para armar
+    evaluaciones sin buscar en el vector store. Se recargan si los archivos cambian y se
+    recuerdan las preguntas que ya se le sirvieron a cada estudiante para no repetirlas.
+    Las preguntas de opciones con clave de respuestas se devuelven con "tipo", "opciones"
+    y "clave", para corregirlas sin LLM.
+    """
+
+    def __init__(self, patrones: List[str], intervalo_revision: float, max_estudiantes: int):
+        self.patrones = patrones
+        self.intervalo_revision = intervalo_revision
+        self.max_estudiantes = max_estudiantes
+        self._por_subtema: Dict[int, PreguntasSubtema] = {}
+        self._firma: Optional[FrozenSet[Tuple[str, float]]] = None
+        self._proxima_revision = 0.0
+        self._lock = asyncio.Lock()
+        self._servidas: "OrderedDict[int, Set[str]]" = OrderedDict()
+
+    def _firma_actual(self) -> FrozenSet[Tuple[str, float]]:
+        rutas = {ruta for patron in self.patrones for ruta in glob.glob(patron.strip())}
+        return frozenset((ruta, os.stat(ruta).st_mtime) for ruta in rutas)
+
+    def _cargar(self, firma: FrozenSet[Tuple[str, float]]) -> Dict[int, PreguntasSubtema]:
+        por_subtema: Dict[int, Dict[str, Tuple[str, Optional[dict]]]] = {}
+        for ruta, _ in sorted(firma):
+            with open(ruta, encoding="utf-8") as f:
+                for linea in f:
+                    if not linea.strip():
+                        continue
+                    entrada = json.loads(linea)
+                    metadata = entrada.get("metadata", {})
+                    try:
+                        subtema_id = int(float(metadata["subtopic_id"]))
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                    # Un mismo texto en dos archivos cuenta una sola vez.
+                    por_subtema.setdefault(subtema_id, {})[id_pregunta(entrada["text"], metadata)] = (
+                        entrada["text"], item_cerrado(metadata)
+                    )
+        return {
+            subtema_id: PreguntasSubtema(
+                ids=tuple(preguntas),
+                textos=tuple(texto for texto, _ in preguntas.values()),
+                cerradas=tuple(cerrada for _, cerrada in preguntas.values()),
+            )
+            for subtema_id, preguntas in por_subtema.items()
+        }
+
+    async def _revisar(self):
+        ahora = time.monotonic()
+        if ahora < self._proxima_revision:
+            return
+        async with self._lock:
+            if time.monotonic() < self._proxima_revision:
+                return
+            firma = await asyncio.to_thread(self._firma_actual)
+            if firma != self._firma:
+                self._por_subtema = await asyncio.to_thread(self._cargar, firma)
+                self._firma = firma
+                print(f"[banco_preguntas] {sum(len(p.ids) for p in self._por_subtema.values())} preguntas "
+                      f"cargadas de {len(firma)} archivos ({len(self._por_subtema)} subtemas).")
+            self._proxima_revision = time.monotonic() + self.intervalo_revision
+
+    async def cargar(self):
+        self._proxima_revision = 0.0
+        await self._revisar()
+
+    async def cantidad(self, subtema_id: int) -> int:
+        await self._revisar()
+        preguntas = self._por_subtema.get(subtema_id)
+        return len(preguntas.ids) if preguntas else 0
+
+    async def ids(self, subtema_id: int) -> FrozenSet[str]:
+        await self._revisar()
+        preguntas = self._por_subtema.get(subtema_id)
+        return frozenset(preguntas.ids) if preguntas else frozenset()
+
+    async def muestrear(self, subtema_id: int, n: int, estudiante_id: Optional[int] = None,
+                        repetir: bool = True, excluir: FrozenSet[str] = frozenset(),
+                        marcar: bool = True) -> List[Dict]:
+        """
+        Devuelve hasta `n` preguntas distintas del subtema, priorizando las que el estudiante
+        todavía no recibió. Con `repetir`, si no alcanzan se completa con preguntas ya servidas.
+        Sin `marcar` no se registran como servidas (ej. una búsqueda especulativa).
+        """
+        await self._revisar()
+        preguntas = self._por_subtema.get(subtema_id)
+        if preguntas is None or n <= 0:
+            return []
+
+        servidas = self._servidas.get(estudiante_id, set()) if estudiante_id is not None else set()
+        nuevas = [i for i, qid in enumerate(preguntas.ids) if qid not in servidas and qid not in excluir]
+        elegidas = random.sample(nuevas, min(n, len(nuevas)))
+        if len(elegidas) < n and repetir:
+            repetidas = [i for i, qid in enumerate(preguntas.ids) if qid in servidas and qid not in excluir]
+            elegidas += random.sample(repetidas, min(n - len(elegidas), len(repetidas)))
+            metricas.contador("banco_preguntas.repetidas").incrementar()
+
+        if estudiante_id is not None and marcar:
+            self.marcar_servidas(estudiante_id, [preguntas.ids[i] for i in elegidas])
+        return [
+            {"id": preguntas.ids[i], "text": preguntas.textos[i], **(preguntas.cerradas[i] or {})}
+            for i in elegidas
+        ]
+
+    def marcar_servidas(self, estudiante_id: int, ids: List[str]):
+        self._servidas.setdefault(estudiante_id, set()).update(ids)
+        self._servidas.move_to_end(estudiante_id)
+        while len(self._servidas) > self.max_estudiantes:
+            self._servidas.popitem(last=False)
+
+
+banco_preguntas = BancoPreguntas(
+    patrones=BANCO_PREGUNTAS_PATRONES,
+    intervalo_revision=BANCO_PREGUNTAS_INTERVALO_REVISION,
+    max_estudiantes=BANCO_PREGUNTAS_MAX_ESTUDIANTES,
+)
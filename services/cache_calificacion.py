@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+from typing import Optional
+from dotenv import load_dotenv
+from config.db_config import AsyncSessionLocal
+from repositories.calificacion_cache_repository import CalificacionCacheRepository
+from utils.metricas import metricas
+
+load_dotenv()
+
+CACHE_CALIFICACION_MAX = int(os.getenv("CACHE_CALIFICACION_MAX", "50000"))
+# Cada cuántas entradas nuevas se recorta la tabla a CACHE_CALIFICACION_MAX
+CACHE_CALIFICACION_RECORTE_CADA = int(os.getenv("CACHE_CALIFICACION_RECORTE_CADA", "100"))
+
+
+class CacheCalificacion:
+    """
+    Caché persistida en Postgres (tabla `calificacion_cache`) de los resultados del LLM de
+    calificación, que se llama con temperatura 0. La clave es un hash de las preguntas y
+    respuestas normalizadas y de la versión del prompt, así un estudiante que reenvía las
+    mismas respuestas no paga otra llamada. Se conservan las `max_entradas` usadas más
+    recientemente. Un error de la caché no impide calificar: se trata como un fallo.
+    """
+
+    def __init__(self, max_entradas: int, recorte_cada: int):
+        self.max_entradas = max_entradas
+        self.recorte_cada = recorte_cada
+        self._nuevas = 0
+
+    @staticmethod
+    def clave(*partes) -> str:
+        serializado = json.dumps(partes, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(serializado.encode("utf-8")).hexdigest()
+
+    async def obtener(self, clave: str) -> Optional[dict]:
+        try:
+            async with AsyncSessionLocal() as db:
+                resultado = await CalificacionCacheRepository(db).usar(clave)
+        except Exception as e:
+            print(f"[cache_calificacion] No se pudo leer la caché: {e}")
+            resultado = None
+        metricas.contador("cache_calificacion.aciertos" if resultado is not None
+                          else "cache_calificacion.fallos").incrementar()
+        return resultado
+
+    async def guardar(self, clave: str, resultado: dict):
+        try:
+            async with AsyncSessionLocal() as db:
+                repo = CalificacionCacheRepository(db)
+                await repo.guardar(clave, resultado)
+                self._nuevas += 1
+                if self._nuevas >= self.recorte_cada:
+                    self._nuevas = 0
+                    borradas = await repo.recortar(self.max_entradas)
+                    metricas.contador("cache_calificacion.descartadas").incrementar(borradas)
+        except Exception as e:
+            print(f"[cache_calificacion] No se pudo guardar en la caché: {e}")
+
+    def estado(self) -> dict:
+        aciertos = metricas.contador("cache_calificacion.aciertos").valor
+        fallos = metricas.contador("cache_calificacion.fallos").valor
+        return {
+            "max_entradas": self.max_entradas,
+            "tasa_aciertos": round(aciertos / (aciertos + fallos), 4) if aciertos + fallos else None,
+        }
+
+
+cache_calificacion = CacheCalificacion(
+    max_entradas=CACHE_CALIFICACION_MAX,
+    recorte_cada=CACHE_CALIFICACION_RECORTE_CADA,
+)
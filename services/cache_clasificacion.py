@@ -0,0 +1,79 @@
+import os
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from dotenv import load_dotenv
+from services.clasificador_local import ruta_indice
+from utils.metricas import metricas
+from utils.texto import normalizar_texto
+
+load_dotenv()
+
+CACHE_CLASIFICACION_MAX = int(os.getenv("CACHE_CLASIFICACION_MAX", "10000"))
+CACHE_CLASIFICACION_TTL = float(os.getenv("CACHE_CLASIFICACION_TTL", "86400"))
+
+
+class CacheClasificacion:
+    """
+    Guarda el [subtema_id, unidad_id] que devolvió la búsqueda vectorial para cada
+    consulta, con clave (vector_store_id, texto normalizado). Las entradas vencen a los
+    `ttl` segundos y, si se supera `max_entradas`, se descartan las menos usadas.
+
+    Los temas se recargan con scripts que corren en otro proceso, así que cada entrada
+    guarda el mtime del snapshot de temas del vector store (el que regenera
+    `construir_indice_temas.py`) y deja de valer si el snapshot cambió. Los vector stores
+    sin snapshot local solo se renuevan por `ttl`.
+    """
+
+    def __init__(self, max_entradas: int, ttl: float):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._entradas: "OrderedDict[Tuple[str, str], Tuple[float, Optional[float], List[int]]]" = OrderedDict()
+
+    @staticmethod
+    def _version(vector_store_id: str) -> Optional[float]:
+        try:
+            return os.stat(ruta_indice(vector_store_id)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def obtener(self, vector_store_id: str, texto: str) -> Optional[List[int]]:
+        clave = (vector_store_id, normalizar_texto(texto))
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            metricas.contador("cache_clasificacion.fallos").incrementar()
+            return None
+        vence, version, ids = entrada
+        if vence < time.monotonic():
+            del self._entradas[clave]
+            metricas.contador("cache_clasificacion.vencidos").incrementar()
+            metricas.contador("cache_clasificacion.fallos").incrementar()
+            return None
+        if version != self._version(vector_store_id):
+            self.invalidar(vector_store_id)
+            metricas.contador("cache_clasificacion.fallos").incrementar()
+            return None
+        self._entradas.move_to_end(clave)
+        metricas.contador("cache_clasificacion.aciertos").incrementar()
+        return list(ids)
+
+    def guardar(self, vector_store_id: str, texto: str, ids: List[int]):
+        clave = (vector_store_id, normalizar_texto(texto))
+        self._entradas[clave] = (time.monotonic() + self.ttl, self._version(vector_store_id), list(ids))
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+
+    def invalidar(self, vector_store_id: str):
+        """
+        Descarta las clasificaciones de un vector store (ej. porque se recargaron sus temas).
+        """
+        for clave in [c for c in self._entradas if c[0] == vector_store_id]:
+            del self._entradas[clave]
+        metricas.contador("cache_clasificacion.invalidaciones").incrementar()
+
+    def estado(self) -> dict:
+        return {"entradas": len(self._entradas), "max_entradas": self.max_entradas, "ttl": self.ttl}
+
+
+cache_clasificacion = CacheClasificacion(max_entradas=CACHE_CLASIFICACION_MAX, ttl=CACHE_CLASIFICACION_TTL)
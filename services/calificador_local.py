@@ -0,0 +1,83 @@
+import re
+from typing import Dict, List, Optional, Set
+
+# Tipos de ítem que se corrigen sin LLM cuando tienen clave de respuestas
+TIPOS_CERRADOS = {"single_choice", "multiple_choice"}
+LETRAS = "abcdefghij"
+
+# "2) b", "2. a, c", "3: a y d", "pregunta 1 - c"
+_RESPUESTA_NUMERADA = re.compile(
+    r"(?<![\w.])(?:pregunta\s*)?(\d{1,2})\s*[\)\.\-:=]\s*((?:[a-j](?![a-z0-9])(?:\s*(?:,|y|e|/)?\s*))+)"
+    # Las letras tienen que cerrar la respuesta: "1) a mi me da..." no es elegir la opción a.
+    r"(?=$|[.;]|(?:pregunta\s*)?\d{1,2}\s*[\)\.\-:=])",
+    re.MULTILINE,
+)
+_SOLO_LETRAS = re.compile(r"^\s*((?:[a-j](?![a-z0-9])(?:\s*(?:,|y|e|/)?\s*))+)\s*[.!]?\s*$")
+
+
+def letra(indice: int) -> str:
+    return LETRAS[indice]
+
+
+def es_cerrado(tipo: Optional[str], opciones, clave) -> bool:
+    return tipo in TIPOS_CERRADOS and bool(opciones) and clave is not None
+
+
+_TOKEN_RESPUESTA = re.compile(r"[a-j]|y|[,/]")
+
+
+def _letras_a_indices(texto: str, cantidad_opciones: int) -> Set[int]:
+    # "e" también es conector ("b e i"): lo es cuando está entre dos letras sin coma ni barra.
+    tokens = _TOKEN_RESPUESTA.findall(texto)
+    indices = set()
+    for i, token in enumerate(tokens):
+        if token in ",/y":
+            continue
+        if (token == "e" and 0 < i < len(tokens) - 1
+                and tokens[i - 1] not in ",/y" and tokens[i + 1] not in ",/y"):
+            continue
+        if LETRAS.index(token) < cantidad_opciones:
+            indices.add(LETRAS.index(token))
+    return indices
+
+
+def extraer_elecciones(mensajes: List[str], opciones_por_orden: Dict[int, int]) -> Dict[int, Set[int]]:
+    """
+    Busca en los mensajes del estudiante las opciones elegidas para cada ítem cerrado
+    (`opciones_por_orden`: número de ítem -> cantidad de opciones). Reconoce respuestas
+    numeradas ("2) b", "3: a y c") y, si hay un único ítem cerrado, un mensaje que solo
+    tiene letras. La última respuesta a un ítem reemplaza a las anteriores.
+    """
+    elecciones: Dict[int, Set[int]] = {}
+    for mensaje in mensajes:
+        texto = mensaje.lower()
+        for numero, letras in _RESPUESTA_NUMERADA.findall(texto):
+            orden = int(numero)
+            if orden in opciones_por_orden:
+                indices = _letras_a_indices(letras, opciones_por_orden[orden])
+                if indices:
+                    elecciones[orden] = indices
+        if len(opciones_por_orden) == 1:
+            solo = _SOLO_LETRAS.match(texto)
+            if solo:
+                orden, cantidad = next(iter(opciones_por_orden.items()))
+                indices = _letras_a_indices(solo.group(1), cantidad)
+                if indices:
+                    elecciones[orden] = indices
+    return elecciones
+
+
+def puntaje(tipo: str, clave: List[int], elegidas: Set[int]) -> float:
+    """
+    Puntaje de 0 a 1. En `single_choice` vale la opción exacta; en `multiple_choice` cada
+    opción correcta suma y cada incorrecta resta en la misma proporción (como en Moodle),
+    sin bajar de 0.
+    """
+    correctas = set(clave)
+    if tipo == "single_choice":
+        return 1.0 if elegidas == correctas else 0.0
+    if not correctas:
+        return 1.0 if not elegidas else 0.0
+    aciertos = len(elegidas & correctas)
+    errores = len(elegidas - correctas)
+    return max(0.0, (aciertos - errores) / len(correctas))
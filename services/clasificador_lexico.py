@@ -0,0 +1,207 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from config.db_config import AsyncSessionLocal
+from repositories.subtema_repository import SubtemaRepository
+from services.clasificador_local import IndiceTemas, clasificador_local
+from utils.metricas import metricas
+from utils.texto import tokenizar
+
+Candidato = Tuple[int, int]  # (subtema_id, unidad_id)
+
+# Palabras que no alcanzan para identificar un tema por sí solas
+STOPWORDS = {
+    "de", "del", "la", "las", "el", "los", "y", "e", "o", "u", "en", "a", "al", "un", "una",
+    "por", "para", "con", "sin", "su", "sus", "que", "se", "como", "entre", "sobre",
+}
+MIN_CARACTERES_PATRON = 4
+
+
+@dataclass(frozen=True)
+class Patron:
+    longitud: int
+    candidatos: FrozenSet[Candidato]
+    es_subtema: bool
+
+
+class AutomataTokens:
+    """
+    Autómata de Aho-Corasick sobre tokens: encuentra en una sola pasada todas las
+    apariciones de cualquiera de los patrones (secuencias de tokens) en el texto.
+    """
+
+    def __init__(self):
+        self._hijos: List[Dict[str, int]] = [{}]
+        self._falla: List[int] = [0]
+        self._salidas: List[List[Patron]] = [[]]
+
+    def agregar(self, tokens: List[str], patron: Patron):
+        nodo = 0
+        for token in tokens:
+            siguiente = self._hijos[nodo].get(token)
+            if siguiente is None:
+                siguiente = len(self._hijos)
+                self._hijos[nodo][token] = siguiente
+                self._hijos.append({})
+                self._falla.append(0)
+                self._salidas.append([])
+            nodo = siguiente
+        self._salidas[nodo].append(patron)
+
+    def compilar(self):
+        # Los hijos de la raíz fallan a la raíz; el resto se resuelve por niveles (BFS).
+        cola = deque(self._hijos[0].values())
+        while cola:
+            nodo = cola.popleft()
+            for token, hijo in self._hijos[nodo].items():
+                falla = self._falla[nodo]
+                while falla and token not in self._hijos[falla]:
+                    falla = self._falla[falla]
+                self._falla[hijo] = self._hijos[falla].get(token, 0) if nodo else 0
+                self._salidas[hijo] = self._salidas[hijo] + self._salidas[self._falla[hijo]]
+                cola.append(hijo)
+
+    def buscar(self, tokens: List[str]) -> List[Tuple[int, int, Patron]]:
+        """
+        Devuelve las coincidencias como (inicio, fin, patrón), con `fin` exclusivo.
+        """
+        coincidencias = []
+        nodo = 0
+        for i, token in enumerate(tokens):
+            while nodo and token not in self._hijos[nodo]:
+                nodo = self._falla[nodo]
+            nodo = self._hijos[nodo].get(token, 0)
+            for patron in self._salidas[nodo]:
+                coincidencias.append((i + 1 - patron.longitud, i + 1, patron))
+        return coincidencias
+
+
+def _es_patron_valido(tokens: Tuple[str, ...]) -> bool:
+    significativos = [t for t in tokens if t not in STOPWORDS]
+    return bool(significativos) and sum(len(t) for t in significativos) >= MIN_CARACTERES_PATRON
+
+
+def armar_automata(taxonomia: Iterable[Tuple[int, str, Optional[str], int]]) -> AutomataTokens:
+    """
+    Arma el autómata a partir de filas (subtema_id, nombre_subtema, nombre_tema, unidad_id).
+    `nombre_tema` puede ser None cuando la fila solo aporta el nombre del subtema.
+    """
+    subtemas: Dict[Tuple[str, ...], Set[Candidato]] = {}
+    temas: Dict[Tuple[str, ...], Set[Candidato]] = {}
+    for subtema_id, nombre_subtema, nombre_tema, unidad_id in taxonomia:
+        subtemas.setdefault(tuple(tokenizar(nombre_subtema)), set()).add((subtema_id, unidad_id))
+        if nombre_tema is not None:
+            temas.setdefault(tuple(tokenizar(nombre_tema)), set()).add((subtema_id, unidad_id))
+
+    automata = AutomataTokens()
+    for tokens, candidatos in subtemas.items():
+        if _es_patron_valido(tokens):
+            automata.agregar(list(tokens), Patron(len(tokens), frozenset(candidatos), es_subtema=True))
+    for tokens, candidatos in temas.items():
+        # Un nombre que también es de subtema se interpreta como subtema.
+        if tokens not in subtemas and _es_patron_valido(tokens):
+            automata.agregar(list(tokens), Patron(len(tokens), frozenset(candidatos), es_subtema=False))
+    automata.compilar()
+    return automata
+
+
+def resolver(automata: AutomataTokens, texto: str) -> Tuple[Optional[Candidato], str]:
+    """
+    Devuelve el candidato que nombra el texto (o None) y el resultado de la búsqueda:
+    "aciertos", "ambiguos" o "sin_coincidencias".
+    """
+    coincidencias = automata.buscar(tokenizar(texto))
+    # Se descartan las coincidencias contenidas en otra más larga ("límite" dentro de "límite lateral").
+    maximas = [
+        (ini, fin, p) for ini, fin, p in coincidencias
+        if not any(i2 <= ini and fin <= f2 and (f2 - i2) > (fin - ini) for i2, f2, _ in coincidencias)
+    ]
+    if not maximas:
+        return None, "sin_coincidencias"
+
+    por_subtema = set().union(*(p.candidatos for _, _, p in maximas if p.es_subtema))
+    por_tema = [p.candidatos for _, _, p in maximas if not p.es_subtema]
+    if por_subtema:
+        candidatos = por_subtema if all(por_subtema <= c for c in por_tema) else set()
+    else:
+        candidatos = set.intersection(*map(set, por_tema))
+
+    if len(candidatos) != 1:
+        return None, "ambiguos"
+    return next(iter(candidatos)), "aciertos"
+
+
+class ClasificadorLexico:
+    """
+    Clasifica sin llamadas de red las consultas que nombran literalmente un subtema (o un
+    tema con un único subtema). Hay un autómata por vector store de temas, armado con los
+    nombres de la taxonomía en la DB y los `subtopic_name` del snapshot local de temas.
+    Si la consulta menciona temas distintos la clasificación se considera ambigua.
+    """
+
+    def __init__(self):
+        self._automatas: Dict[str, Tuple[AutomataTokens, Optional[float]]] = {}
+        self._lock = asyncio.Lock()
+        self._version = 0
+
+    def invalidar(self):
+        """
+        Se llama al modificar la taxonomía: los autómatas se rearman en el próximo uso.
+        """
+        self._version += 1
+        self._automatas.clear()
+
+    async def construir_todos(self):
+        async with AsyncSessionLocal() as db:
+            vector_stores = await SubtemaRepository(db).get_vector_stores_temas()
+        for vector_store_id in vector_stores:
+            await self._obtener(vector_store_id)
+
+    async def _obtener(self, vector_store_id: str) -> AutomataTokens:
+        # El snapshot local aporta nombres de subtemas: si se recarga, se rearma el autómata.
+        indice = await clasificador_local.obtener_indice(vector_store_id)
+        mtime = indice.mtime if indice is not None else None
+        guardado = self._automatas.get(vector_store_id)
+        if guardado is not None and guardado[1] == mtime:
+            return guardado[0]
+        async with self._lock:
+            guardado = self._automatas.get(vector_store_id)
+            if guardado is not None and guardado[1] == mtime:
+                return guardado[0]
+            version = self._version
+            automata = await self._construir(vector_store_id, indice)
+            # Si la taxonomía cambió mientras se armaba, se usa pero no se guarda.
+            if version == self._version:
+                self._automatas[vector_store_id] = (automata, mtime)
+            return automata
+
+    async def _construir(self, vector_store_id: str, indice: Optional[IndiceTemas]) -> AutomataTokens:
+        async with AsyncSessionLocal() as db:
+            taxonomia = list(await SubtemaRepository(db).get_taxonomia_by_vector_store(vector_store_id))
+        if indice is not None and indice.subtopic_names is not None:
+            taxonomia += [
+                (int(subtema_id), str(nombre), None, int(unidad_id))
+                for nombre, subtema_id, unidad_id in zip(indice.subtopic_names, indice.subtopic_ids, indice.unit_ids)
+            ]
+        automata = armar_automata(taxonomia)
+        print(f"[clasificador_lexico] Autómata de {vector_store_id} armado ({len(taxonomia)} entradas de taxonomía).")
+        return automata
+
+    async def clasificar(self, texto: str, vector_store_id: str) -> Optional[Candidato]:
+        """
+        Devuelve (subtema_id, unidad_id) si la consulta nombra un único subtema sin
+        ambigüedad; si no, None para seguir con la búsqueda vectorial.
+        """
+        try:
+            automata = await self._obtener(vector_store_id)
+        except Exception as e:
+            print(f"[clasificador_lexico] No se pudo armar el autómata de {vector_store_id}: {e}")
+            return None
+
+        candidato, resultado = resolver(automata, texto)
+        metricas.contador(f"clasificador_lexico.{resultado}").incrementar()
+        return candidato
+
+
+clasificador_lexico = ClasificadorLexico()
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from openai_client import client
+from utils.admision import admision
+from utils.metricas import metricas
+from utils.texto import normalizar_texto
+
+load_dotenv()
+
+# Directorio con un snapshot `<vector_store_id>.npz` por vector store de temas
+INDICES_TEMAS_DIR = os.getenv("INDICES_TEMAS_DIR", "embeddings/indices")
+MODELO_EMBEDDINGS = "text-embedding-3-small"
+# Cantidad de embeddings de consultas que se guardan en memoria
+MAX_EMBEDDINGS_CACHE = int(os.getenv("MAX_EMBEDDINGS_CACHE", "4096"))
+TOP_K = 3
+
+
+def ruta_indice(vector_store_id: str) -> str:
+    return os.path.join(INDICES_TEMAS_DIR, f"{vector_store_id}.npz")
+
+
+def guardar_indice(ruta: str, vectores: np.ndarray, subtopic_ids: np.ndarray, unit_ids: np.ndarray,
+                   textos: np.ndarray, modelo: str, subtopic_names: Optional[np.ndarray] = None):
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    normas = np.linalg.norm(vectores, axis=1, keepdims=True)
+    extras = {} if subtopic_names is None else {"subtopic_names": subtopic_names}
+    np.savez(ruta, vectores=(vectores / np.maximum(normas, 1e-12)).astype(np.float32),
+             subtopic_ids=subtopic_ids.astype(np.int64), unit_ids=unit_ids.astype(np.int64),
+             textos=textos, modelo=np.array(modelo), **extras)
+
+
+@dataclass
+class IndiceTemas:
+    vectores: np.ndarray        # (n, d) normalizados
+    subtopic_ids: np.ndarray
+    unit_ids: np.ndarray
+    textos: np.ndarray
+    modelo: str
+    mtime: float
+    subtopic_names: Optional[np.ndarray] = None
+
+    def buscar(self, consulta: np.ndarray, k: int = TOP_K) -> list[Tuple[int, int, float]]:
+        """
+        Devuelve hasta `k` resultados (subtopic_id, unit_id, score) por similitud coseno.
+        """
+        scores = self.vectores @ consulta
+        k = min(k, len(scores))
+        mejores = np.argpartition(-scores, k - 1)[:k]
+        mejores = mejores[np.argsort(-scores[mejores])]
+        return [(int(self.subtopic_ids[i]), int(self.unit_ids[i]), float(scores[i])) for i in mejores]
+
+
+class ClasificadorLocal:
+    """
+    Clasifica consultas contra los subtemas de un vector store usando snapshots de sus
+    embeddings en disco, sin pasar por `vector_stores.search`. Los índices se cargan en
+    memoria la primera vez y se recargan si el archivo cambia. Los embeddings de las
+    consultas se guardan en una caché LRU.
+    """
+
+    def __init__(self, directorio: str, max_cache: int):
+        self.directorio = directorio
+        self.max_cache = max_cache
+        self._indices: Dict[str, IndiceTemas] = {}
+        self._embeddings: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+
+    def _cargar(self, ruta: str, mtime: float) -> IndiceTemas:
+        with np.load(ruta) as datos:
+            return IndiceTemas(
+                vectores=datos["vectores"], subtopic_ids=datos["subtopic_ids"],
+                unit_ids=datos["unit_ids"], textos=datos["textos"],
+                modelo=str(datos["modelo"]), mtime=mtime,
+                subtopic_names=datos["subtopic_names"] if "subtopic_names" in datos.files else None,
+            )
+
+    async def obtener_indice(self, vector_store_id: str) -> Optional[IndiceTemas]:
+        ruta = os.path.join(self.directorio, f"{vector_store_id}.npz")
+        try:
+            mtime = os.stat(ruta).st_mtime
+        except FileNotFoundError:
+            return None
+        indice = self._indices.get(vector_store_id)
+        if indice is None or indice.mtime != mtime:
+            indice = await asyncio.to_thread(self._cargar, ruta, mtime)
+            self._indices[vector_store_id] = indice
+            print(f"[clasificador_local] Índice de {vector_store_id} cargado ({len(indice.subtopic_ids)} subtemas).")
+        return indice
+
+    async def embedding(self, texto: str, modelo: str = MODELO_EMBEDDINGS) -> np.ndarray:
+        clave = (modelo, normalizar_texto(texto))
+        vector = self._embeddings.get(clave)
+        if vector is not None:
+            self._embeddings.move_to_end(clave)
+            metricas.contador("clasificador_local.embeddings_cache_aciertos").incrementar()
+            return vector
+
+        metricas.contador("clasificador_local.embeddings_cache_fallos").incrementar()
+        with metricas.medir("clasificador_local.embedding_s"):
+            async with admision.slot():
+                resp = await client.embeddings.create(model=modelo, input=texto)
+        vector = np.asarray(resp.data[0].embedding, dtype=np.float32)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+
+        self._embeddings[clave] = vector
+        if len(self._embeddings) > self.max_cache:
+            self._embeddings.popitem(last=False)
+        return vector
+
+    async def clasificar(self, texto: str, vector_store_id: str) -> Optional[Tuple[int, int, float]]:
+        """
+        Devuelve (subtopic_id, unit_id, score) del subtema más parecido, o None si no hay
+        un índice local para el vector store o no se pudo calcular el embedding.
+        """
+        try:
+            indice = await self.obtener_indice(vector_store_id)
+            if indice is None:
+                return None
+            consulta = await self.embedding(texto, indice.modelo)
+        except Exception as e:
+            print(f"[clasificador_local] No se pudo clasificar localmente: {e}")
+            return None
+
+        inicio = time.perf_counter()
+        resultados = indice.buscar(consulta)
+        metricas.histograma("clasificador_local.busqueda_s").observar(time.perf_counter() - inicio)
+        return resultados[0] if resultados else None
+
+
+clasificador_local = ClasificadorLocal(directorio=INDICES_TEMAS_DIR, max_cache=MAX_EMBEDDINGS_CACHE)
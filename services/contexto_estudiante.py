@@ -0,0 +1,82 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Optional
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+from repositories.pregunta_repository import PreguntaRepository
+from utils.metricas import metricas
+
+load_dotenv()
+
+CONTEXTO_MAX_ESTUDIANTES = int(os.getenv("CONTEXTO_MAX_ESTUDIANTES", "50000"))
+# Vencimiento de cada entrada: acota el desfasaje si otro proceso registra preguntas del mismo estudiante
+CONTEXTO_TTL = float(os.getenv("CONTEXTO_TTL", "300"))
+
+
+def _utc(fecha: Optional[datetime]) -> Optional[datetime]:
+    # La columna created_at no guarda zona horaria; se comparan siempre como UTC.
+    if fecha is not None and fecha.tzinfo is None:
+        return fecha.replace(tzinfo=timezone.utc)
+    return fecha
+
+
+@dataclass
+class Contexto:
+    subtema_id: Optional[int]
+    unidad_id: Optional[int]
+    fecha: Optional[datetime]
+    vence: float
+
+
+class ContextoEstudiantes:
+    """
+    Caché en memoria del último subtema/unidad de cada estudiante, que usan los fallbacks
+    de `clasificar_consulta`. Se actualiza con cada pregunta registrada y, si el estudiante
+    no está en memoria, se carga con una consulta `LIMIT 1`. También recuerda a los
+    estudiantes sin preguntas, para no volver a consultar la DB por ellos.
+    """
+
+    def __init__(self, max_estudiantes: int, ttl: float):
+        self.max_estudiantes = max_estudiantes
+        self.ttl = ttl
+        self._contextos: "OrderedDict[int, Contexto]" = OrderedDict()
+
+    async def obtener(self, db: AsyncSession, estudiante_id: int) -> Optional[List[int]]:
+        contexto = self._contextos.get(estudiante_id)
+        if contexto is not None and contexto.vence >= time.monotonic():
+            self._contextos.move_to_end(estudiante_id)
+            metricas.contador("contexto_estudiante.aciertos").incrementar()
+        else:
+            metricas.contador("contexto_estudiante.fallos").incrementar()
+            ultimo = await PreguntaRepository(db).get_ultimo_contexto_by_estudiante(estudiante_id)
+            contexto = self._guardar(estudiante_id, *(ultimo or (None, None, None)))
+        if contexto.subtema_id is None:
+            return None
+        return [contexto.subtema_id, contexto.unidad_id]
+
+    def actualizar(self, estudiante_id: int, subtema_id: int, unidad_id: int, fecha: datetime):
+        fecha = _utc(fecha)
+        actual = self._contextos.get(estudiante_id)
+        # Las preguntas de un lote pueden llegar desordenadas respecto de las ya vistas.
+        if actual is not None and actual.fecha is not None and fecha < actual.fecha:
+            return
+        self._guardar(estudiante_id, subtema_id, unidad_id, fecha)
+
+    def invalidar(self, estudiante_id: int):
+        self._contextos.pop(estudiante_id, None)
+
+    def _guardar(self, estudiante_id: int, subtema_id: Optional[int], unidad_id: Optional[int],
+                 fecha: Optional[datetime]) -> Contexto:
+        contexto = Contexto(subtema_id=subtema_id, unidad_id=unidad_id, fecha=_utc(fecha),
+                            vence=time.monotonic() + self.ttl)
+        self._contextos[estudiante_id] = contexto
+        self._contextos.move_to_end(estudiante_id)
+        while len(self._contextos) > self.max_estudiantes:
+            self._contextos.popitem(last=False)
+        return contexto
+
+
+contexto_estudiantes = ContextoEstudiantes(max_estudiantes=CONTEXTO_MAX_ESTUDIANTES, ttl=CONTEXTO_TTL)
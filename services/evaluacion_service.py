@@ -3,13 +3,34 @@ from sqlalchemy import select
 from typing import Dict, Any, List
 from models.asistente import Asistente
 from models.evaluacion import Evaluacion
+from models.evaluacion_item import EvaluacionItem
 from repositories.asistente_repository import AsistenteRepository
 from repositories.evaluacion_repository import EvaluacionRepository
+from repositories.mensaje_repository import MensajeRepository
+from services.cache_calificacion import cache_calificacion
+from services.calificador_local import es_cerrado, extraer_elecciones, letra, puntaje
+from services.banco_preguntas import banco_preguntas
+from services.mensaje_service import sincronizador_mensajes
+from services.prefetch_evaluacion import prefetch_evaluaciones
 from services.vector_store_service import VectorService
 import asyncio
+from datetime import datetime, timezone
+import os
 import re
 import json
+from dotenv import load_dotenv
 from openai_client import client
+from utils.admision import admision
+from utils.metricas import metricas
+from utils.texto import normalizar_texto
+
+load_dotenv()
+
+# Calificaciones en segundo plano que se ejecutan a la vez en este proceso
+CALIFICACION_CONCURRENCIA = int(os.getenv("CALIFICACION_CONCURRENCIA", "4"))
+_calificaciones = asyncio.Semaphore(CALIFICACION_CONCURRENCIA)
+# Forma parte de la clave de la caché de calificaciones: incrementarla al cambiar los prompts
+VERSION_PROMPT_CALIFICACION = 1
 
 
 class EvaluacionService:
@@ -60,9 +81,13 @@ class EvaluacionService:
         2. Si no se especifica el tema, se retorna un error.
         3. Se valida que el asistente exista en la base de datos; si no, se lanza una excepción.
         4. Se clasifica el tema con `VectorService.clasificar_consulta` y se obtienen las preguntas
-        relacionadas con `VectorService.obtener_preguntas`.
+        relacionadas con `VectorService.obtener_preguntas` (desde el banco local de preguntas si el
+        subtema está cargado, sin buscar en el vector store). Si el mensaje del estudiante ya
+        disparó la preparación especulativa de la evaluación (`prefetch_evaluaciones`) y es del
+        mismo subtema, se usan esas preguntas; si no, se descartan.
         5. Si ocurre un error al obtener las preguntas, se retorna el error.
-        6. Se crea una nueva evaluación en la base de datos con la información obtenida.
+        6. Se crea una nueva evaluación en la base de datos con la información obtenida, junto
+        con las preguntas presentadas (`evaluacion_item`), que luego se usan para calificar.
         7. Finalmente, se devuelve el ID de la evaluación junto con las preguntas.
 
         Si todo es exitoso, la evaluación se marca como pendiente.
@@ -83,10 +108,26 @@ class EvaluacionService:
         vs_id = asistente_db.vs_evaluaciones_id
 
         vector_service = VectorService(self.db)
-
-        subtema_id, unidad_id = await vector_service.clasificar_consulta(subtema_nombre, vs_id, estudiante_id)
-
-        preguntas = await vector_service.obtener_preguntas(subtema=subtema_nombre, subtema_id=subtema_id, n=num_q, vector_store_id=vs_id)
+        especulacion = await prefetch_evaluaciones.tomar(estudiante_id, asistente_id)
+
+        async with admision.slot(asistente_id=asistente_id, estudiante_id=estudiante_id):
+            if (especulacion and especulacion.subtema_nombre
+                    and normalizar_texto(especulacion.subtema_nombre) == normalizar_texto(subtema_nombre)):
+                subtema_id, unidad_id = especulacion.subtema_id, especulacion.unidad_id
+            else:
+                subtema_id, unidad_id = await vector_service.clasificar_consulta(subtema_nombre, vs_id, estudiante_id)
+
+            if especulacion and especulacion.subtema_id == subtema_id and len(especulacion.preguntas) >= num_q:
+                prefetch_evaluaciones.registrar_resultado(acierto=True)
+                preguntas = especulacion.preguntas[:num_q]
+                banco_preguntas.marcar_servidas(estudiante_id, [p["id"] for p in preguntas if p.get("id")])
+            else:
+                if especulacion:
+                    prefetch_evaluaciones.registrar_resultado(
+                        acierto=False, insuficiente=especulacion.subtema_id == subtema_id
+                    )
+                preguntas = await vector_service.obtener_preguntas(subtema=subtema_nombre, subtema_id=subtema_id, n=num_q, vector_store_id=vs_id,
+                                                                 estudiante_id=estudiante_id)
 
         if isinstance(preguntas, dict) and "error" in preguntas:
             return preguntas
@@ -96,17 +137,29 @@ class EvaluacionService:
             "subtema_id": subtema_id,
             "estudiante_id": estudiante_id,
             "asistente_id": asistente_id,
-            "pendiente": True
+            "pendiente": True,
+            # Las respuestas del estudiante son sus mensajes posteriores a esta fecha
+            "evaluacion_fecha": datetime.now(timezone.utc),
         }
 
-        evaluacion_db = await self.create_evaluacion(evaluacion_data)
+        evaluacion_db = await self.evaluacion_repo.create_con_items(evaluacion_data, preguntas)
 
         print(preguntas)
 
-        return {
+        # La clave de respuestas queda en la DB: al asistente solo llegan enunciado y opciones.
+        questions = [
+            {"id": p.get("id"), "text": p["text"],
+             **({"options": [f"{letra(i)}) {o}" for i, o in enumerate(p["opciones"])]} if p.get("clave") is not None else {})}
+            for p in preguntas
+        ]
+        salida = {
             "evaluation_id": evaluacion_db.evaluacion_id,
-            "questions": preguntas
+            "questions": questions
         }
+        if any("options" in q for q in questions):
+            salida["instructions"] = ("Numerá las preguntas y pedí que las de opciones se respondan con el número "
+                                      "y la letra o letras elegidas, por ejemplo: 2) b, d")
+        return salida
     
 
     def extraer_texto_de_mensaje(self, msg) -> str:
@@ -129,14 +182,19 @@ class EvaluacionService:
 
     async def calificar_evaluacion(self, thread_id: str, evaluation_id: int) -> dict:
         """
-        Esta función tiene como objetivo calificar una evaluación basada en el historial de una conversación.
-
-        1. Se obtiene el historial de mensajes de una conversación, limitando el número de mensajes a 5.
-        2. Se construye un prompt que se utiliza para hacer una llamada stateless a la API de Chat Completions,
-        en donde se le pide al modelo que analice las preguntas y respuestas del historial de la conversación y
-        proporcione una calificación (nota final) del 0 al 10 junto con un comentario general sobre el desempeño del estudiante.
-        3. Se realiza una llamada a la API de Chat Completions para obtener la calificación y el comentario basado en el
-        historial de la conversación.
+        Esta función tiene como objetivo calificar una evaluación a partir de sus preguntas y
+        de las respuestas del estudiante.
+
+        1. Se leen las preguntas guardadas al iniciar la evaluación (`evaluacion_item`).
+        2. Se sincroniza la copia local de los mensajes del thread (solo los nuevos) y se toman
+        como respuestas los mensajes del estudiante posteriores al inicio de la evaluación.
+        Las evaluaciones anteriores a que se guardaran los ítems se califican, como antes, con
+        los últimos 10 mensajes del thread en OpenAI.
+        3. Los ítems de opciones con clave de respuestas se corrigen localmente si la respuesta
+        del estudiante se puede leer ("2) b, d"). El resto se califica con una sola llamada
+        stateless a la API de Chat Completions con un prompt compacto (preguntas numeradas y
+        respuestas), pidiendo un puntaje de 0 a 1 por pregunta y un comentario general; si todos
+        se corrigieron localmente no se llama al LLM. La nota es el promedio de los puntajes, del 0 al 10.
         4. Si la llamada a la API es exitosa, la calificación obtenida se utiliza para actualizar el estado de la evaluación
         en la base de datos, marcándola como "no pendiente".
         5. Finalmente, la función devuelve el estado de la evaluación junto con la calificación final.
@@ -144,51 +202,177 @@ class EvaluacionService:
         En caso de error en la llamada a la API, se captura la excepción y se retorna un mensaje de error.
         """
         try:
-            messages_response = await client.beta.threads.messages.list(
-                thread_id=thread_id,
-                limit=10
-            )
-            # Construye el historial solo con bloques de texto
-            lines = []
-            for msg in reversed(messages_response.data):
-                texto = self.extraer_texto_de_mensaje(msg)
-                if texto:
-                    lines.append(f"{msg.role}: {texto}")
-            conversation_history = "\n".join(lines)
-
-            prompt_calificacion = f"""
-            Eres un experto evaluador de materias universitarias. A continuación te proporciono el historial de una conversación.
-            Tu tarea es identificar las preguntas de la evaluación y las respuestas proporcionadas por el 'user'.
-            Basado en esto, proporciona una nota final del 0 al 10.
-
-            Historial de la Conversación:
-            ---
-            {conversation_history}
-            ---
-
-            Basado en el historial, devuelve EXCLUSIVAMENTE un objeto JSON con la siguiente estructura:
-            {{
-            "nota_final": <un número entero o flotante del 0 al 10>,
-            "feedback_general": "Un breve comentario sobre el desempeño del estudiante."
-            }}
-            """.strip()
-
-            response = await client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "system", "content": prompt_calificacion}],
-                response_format={"type": "json_object"},
-                temperature=0.0
-            )
-            contenido = response.choices[0].message.content
-            # content será un string JSON (con response_format=json_object)
-            resultado_json = json.loads(contenido)
-            nota_final = resultado_json.get("nota_final", 0)
-
-            ev_svc = EvaluacionService(db=self.db)
-            await ev_svc.update_evaluacion(evaluation_id, {"nota": nota_final, "pendiente": False})
-
-            return {"status": "calificado", "nota": nota_final}
+            evaluacion = await self.get_evaluacion_by_id(evaluation_id)
+            items = await self.evaluacion_repo.get_items(evaluation_id)
+            if not items:
+                nota_final = await self._calificar_desde_historial(thread_id)
+                await self.evaluacion_repo.update(evaluacion, {"nota": nota_final, "pendiente": False})
+                return {"status": "calificado", "nota": nota_final}
+
+            respuestas = await self._respuestas_estudiante(thread_id, evaluacion)
+
+            # Los ítems de opciones con respuesta reconocible se corrigen localmente; el resto
+            # (abiertos o con respuestas en texto libre) va en una sola llamada al LLM.
+            cerrados = {item.orden: item for item in items if es_cerrado(item.tipo, item.opciones, item.clave)}
+            elecciones = extraer_elecciones(respuestas, {orden: len(item.opciones) for orden, item in cerrados.items()})
+            for orden, elegidas in elecciones.items():
+                item = cerrados[orden]
+                item.puntaje = puntaje(item.tipo, item.clave, elegidas)
+                item.respuesta = sorted(elegidas)
+            pendientes = [item for item in items if item.orden not in elecciones]
+            metricas.contador("evaluaciones.items_locales").incrementar(len(elecciones))
+            metricas.contador("evaluaciones.items_llm").incrementar(len(pendientes))
+
+            feedback = None
+            if pendientes:
+                prompt_calificacion = self._prompt_desde_items(pendientes, respuestas)
+                clave = cache_calificacion.clave(
+                    VERSION_PROMPT_CALIFICACION, "items",
+                    [[item.orden, normalizar_texto(item.texto),
+                      [normalizar_texto(o) for o in item.opciones or []], item.clave] for item in pendientes],
+                    [normalizar_texto(r) for r in respuestas],
+                )
+                resultado_json = await self._llamar_calificador(prompt_calificacion, clave)
+                puntajes = resultado_json.get("puntajes", {}) or {}
+                for item in pendientes:
+                    item.puntaje = self._puntaje_valido(puntajes.get(str(item.orden)))
+                feedback = resultado_json.get("feedback_general")
+            else:
+                metricas.contador("evaluaciones.sin_llm").incrementar()
+
+            nota_final = round(10 * sum(item.puntaje for item in items) / len(items), 2)
+            # Confirma también los puntajes de los ítems (misma sesión).
+            await self.evaluacion_repo.update(evaluacion, {"nota": nota_final, "pendiente": False})
+
+            salida = {"status": "calificado", "nota": nota_final}
+            if cerrados:
+                salida["correctas"] = sum(1 for orden in cerrados if cerrados[orden].puntaje == 1.0)
+                salida["de_opciones"] = len(cerrados)
+            if feedback:
+                salida["feedback"] = feedback
+            return salida
 
         except Exception as e:
             # Log detallado y retorno controlado
             return {"error": f"Hubo un problema al procesar la calificación: {type(e).__name__}: {e}"}
+
+    async def calificar_en_segundo_plano(self, thread_id: str, evaluation_id: int) -> dict:
+        """
+        Califica una evaluación desde el job `calificar_evaluacion`, con a lo sumo
+        CALIFICACION_CONCURRENCIA calificaciones a la vez. Si la evaluación ya fue calificada
+        (un reintento del job) devuelve la nota guardada; un error se relanza para que el job
+        se reintente.
+        """
+        async with _calificaciones:
+            evaluacion = await self.get_evaluacion_by_id(evaluation_id)
+            if not evaluacion.pendiente:
+                return {"status": "calificado", "nota": evaluacion.nota}
+            with metricas.medir("evaluaciones.calificacion_job_s"):
+                salida = await self.calificar_evaluacion(thread_id=thread_id, evaluation_id=evaluation_id)
+        if "error" in salida:
+            raise RuntimeError(salida["error"])
+        return salida
+
+    async def _llamar_calificador(self, prompt_calificacion: str, clave: str) -> dict:
+        # Misma clave, mismo resultado: la llamada es con temperatura 0.
+        resultado = await cache_calificacion.obtener(clave)
+        if resultado is not None:
+            return resultado
+        with metricas.medir("evaluaciones.calificacion_s"):
+            async with admision.slot():
+                response = await client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[{"role": "system", "content": prompt_calificacion}],
+                    response_format={"type": "json_object"},
+                    temperature=0.0
+                )
+        # content será un string JSON (con response_format=json_object)
+        resultado = json.loads(response.choices[0].message.content)
+        await cache_calificacion.guardar(clave, resultado)
+        return resultado
+
+    def _puntaje_valido(self, valor) -> float:
+        try:
+            return min(1.0, max(0.0, float(valor)))
+        except (TypeError, ValueError):
+            return 0.0
+
+    async def _respuestas_estudiante(self, thread_id: str, evaluacion: Evaluacion) -> List[str]:
+        # La última respuesta puede no estar todavía en la copia local: se traen solo los
+        # mensajes posteriores al último guardado.
+        await sincronizador_mensajes.esperar(thread_id)
+        await sincronizador_mensajes.sincronizar(self.db, thread_id)
+        # `created_at` de OpenAI tiene resolución de segundos: el mensaje que pidió la
+        # evaluación puede caer en el mismo segundo que `evaluacion_fecha`, así que se toman
+        # los mensajes de los segundos siguientes.
+        desde = int(evaluacion.evaluacion_fecha.timestamp())
+        mensajes = await MensajeRepository(self.db).get_by_rol_posteriores(thread_id, "user", desde)
+        respuestas = []
+        for m in mensajes:
+            texto = " ".join(p["text"] if p["type"] == "text" else "[imagen]" for p in m.partes)
+            if texto.strip():
+                respuestas.append(texto.strip())
+        return respuestas
+
+    def _prompt_desde_items(self, items: List[EvaluacionItem], respuestas: List[str]) -> str:
+        preguntas = []
+        for item in items:
+            preguntas.append(f"{item.orden}. {item.texto}")
+            if item.opciones:
+                preguntas.extend(f"   {letra(i)}) {o}" for i, o in enumerate(item.opciones))
+            if item.clave is not None:
+                preguntas.append(f"   Correctas: {', '.join(letra(i) for i in item.clave)}")
+        lineas = [
+            "Eres un experto evaluador de materias universitarias. Califica las respuestas de un estudiante "
+            "a las preguntas de una evaluación. Las respuestas son los mensajes del estudiante, en orden; "
+            "pueden referirse a las preguntas por su número o responderlas en secuencia. "
+            "Ignora las respuestas a preguntas que no estén en la lista.",
+            "",
+            "Preguntas:",
+            *preguntas,
+            "",
+            "Mensajes del estudiante:",
+            *([f"- {r}" for r in respuestas] or ["(el estudiante no respondió)"]),
+            "",
+            "Devuelve EXCLUSIVAMENTE un objeto JSON con un puntaje de 0 a 1 por pregunta, con la siguiente estructura:",
+            '{"puntajes": {"<número de pregunta>": <número de 0 a 1>}, '
+            '"feedback_general": "Un breve comentario sobre el desempeño del estudiante."}',
+        ]
+        return "\n".join(lineas)
+
+    async def _calificar_desde_historial(self, thread_id: str) -> float:
+        prompt_calificacion = await self._prompt_desde_historial(thread_id)
+        clave = cache_calificacion.clave(VERSION_PROMPT_CALIFICACION, "historial", normalizar_texto(prompt_calificacion))
+        resultado_json = await self._llamar_calificador(prompt_calificacion, clave)
+        return resultado_json.get("nota_final", 0)
+
+    async def _prompt_desde_historial(self, thread_id: str) -> str:
+        async with admision.slot():
+            messages_response = await client.beta.threads.messages.list(
+                thread_id=thread_id,
+                limit=10
+            )
+        # Construye el historial solo con bloques de texto
+        lines = []
+        for msg in reversed(messages_response.data):
+            texto = self.extraer_texto_de_mensaje(msg)
+            if texto:
+                lines.append(f"{msg.role}: {texto}")
+        conversation_history = "\n".join(lines)
+
+        return f"""
+        Eres un experto evaluador de materias universitarias. A continuación te proporciono el historial de una conversación.
+        Tu tarea es identificar las preguntas de la evaluación y las respuestas proporcionadas por el 'user'.
+        Basado en esto, proporciona una nota final del 0 al 10.
+
+        Historial de la Conversación:
+        ---
+        {conversation_history}
+        ---
+
+        Basado en el historial, devuelve EXCLUSIVAMENTE un objeto JSON con la siguiente estructura:
+        {{
+        "nota_final": <un número entero o flotante del 0 al 10>,
+        "feedback_general": "Un breve comentario sobre el desempeño del estudiante."
+        }}
+        """.strip()
@@ -0,0 +1,227 @@
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+from services.clasificador_local import clasificador_local
+from utils.metricas import metricas
+from utils.texto import tokenizar
+
+load_dotenv()
+
+# Directorio con un snapshot `<vector_store_id>.npz` por vector store de contenidos
+INDICES_HIBRIDOS_DIR = os.getenv("INDICES_HIBRIDOS_DIR", "embeddings/hibridos")
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Constante de la fusión por ranking recíproco (RRF)
+RRF_K = 60
+# Cantidad de candidatos de cada ranking que entran a la fusión
+CANDIDATOS_FUSION = 50
+# Campos de la metadata que se indexan junto con `text` para la búsqueda léxica
+CAMPOS_LEXICOS = ("subtopic_name", "topic_name", "unit_name", "bibliografia_referencia")
+
+
+def ruta_indice_hibrido(vector_store_id: str) -> str:
+    return os.path.join(INDICES_HIBRIDOS_DIR, f"{vector_store_id}.npz")
+
+
+def texto_lexico(entrada: dict) -> str:
+    metadata = entrada.get("metadata", {})
+    return " ".join([entrada["text"], *(str(metadata[c]) for c in CAMPOS_LEXICOS if metadata.get(c))])
+
+
+def guardar_indice_hibrido(ruta: str, entradas: List[dict], vectores: Optional[np.ndarray], modelo: str):
+    """
+    Guarda el índice invertido (en formato CSR: un tramo de `postings_docs`/`postings_tf`
+    por término) y los vectores de las entradas de un JSONL de contenidos.
+    """
+    frecuencias = [Counter(tokenizar(texto_lexico(e))) for e in entradas]
+    vocabulario = sorted(set().union(*frecuencias))
+    posiciones = {termino: i for i, termino in enumerate(vocabulario)}
+
+    postings: List[List[tuple]] = [[] for _ in vocabulario]
+    for doc, frecuencia in enumerate(frecuencias):
+        for termino, tf in frecuencia.items():
+            postings[posiciones[termino]].append((doc, tf))
+    indptr = np.cumsum([0] + [len(p) for p in postings])
+
+    extras = {}
+    if vectores is not None:
+        normas = np.linalg.norm(vectores, axis=1, keepdims=True)
+        extras["vectores"] = (vectores / np.maximum(normas, 1e-12)).astype(np.float16)
+
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    np.savez_compressed(
+        ruta,
+        vocabulario=np.array(vocabulario),
+        postings_indptr=indptr.astype(np.int64),
+        postings_docs=np.array([d for p in postings for d, _ in p], dtype=np.int32),
+        postings_tf=np.array([tf for p in postings for _, tf in p], dtype=np.uint16),
+        longitudes=np.array([sum(f.values()) for f in frecuencias], dtype=np.int32),
+        textos=np.array([e["text"] for e in entradas]),
+        metadata=np.array([json.dumps(e.get("metadata", {}), ensure_ascii=False) for e in entradas]),
+        modelo=np.array(modelo),
+        **extras,
+    )
+
+
+@dataclass
+class IndiceHibrido:
+    terminos: Dict[str, int]
+    idf: np.ndarray
+    postings_indptr: np.ndarray
+    postings_docs: np.ndarray
+    postings_tf: np.ndarray
+    normalizacion: np.ndarray   # k1 * (1 - b + b * longitud / longitud_promedio) por documento
+    textos: np.ndarray
+    metadata: List[dict]
+    vectores: Optional[np.ndarray]
+    modelo: str
+    mtime: float
+
+    @classmethod
+    def cargar(cls, ruta: str, mtime: float) -> "IndiceHibrido":
+        with np.load(ruta) as datos:
+            vocabulario = datos["vocabulario"]
+            indptr = datos["postings_indptr"]
+            longitudes = datos["longitudes"].astype(np.float32)
+            n = len(longitudes)
+            df = np.diff(indptr).astype(np.float32)
+            return cls(
+                terminos={str(t): i for i, t in enumerate(vocabulario)},
+                idf=np.log(1 + (n - df + 0.5) / (df + 0.5)),
+                postings_indptr=indptr,
+                postings_docs=datos["postings_docs"],
+                postings_tf=datos["postings_tf"].astype(np.float32),
+                normalizacion=BM25_K1 * (1 - BM25_B + BM25_B * longitudes / max(float(longitudes.mean()), 1.0)),
+                textos=datos["textos"],
+                metadata=[json.loads(m) for m in datos["metadata"]],
+                vectores=datos["vectores"].astype(np.float32) if "vectores" in datos.files else None,
+                modelo=str(datos["modelo"]),
+                mtime=mtime,
+            )
+
+    def bm25(self, consulta: str) -> np.ndarray:
+        scores = np.zeros(len(self.textos), dtype=np.float32)
+        for termino in set(tokenizar(consulta)):
+            t = self.terminos.get(termino)
+            if t is None:
+                continue
+            inicio, fin = self.postings_indptr[t], self.postings_indptr[t + 1]
+            docs = self.postings_docs[inicio:fin]
+            tf = self.postings_tf[inicio:fin]
+            scores[docs] += self.idf[t] * tf * (BM25_K1 + 1) / (tf + self.normalizacion[docs])
+        return scores
+
+    def buscar(self, consulta: str, vector: Optional[np.ndarray], n: int,
+               subtopic_id: Optional[int] = None) -> List[dict]:
+        """
+        Fusiona por RRF el ranking BM25 y (si hay vector de consulta) el de similitud
+        coseno. Devuelve hasta `n` documentos con sus posiciones en cada ranking; el `score`
+        es el valor RRF, no una similitud. Con `subtopic_id` solo se consideran los
+        documentos de ese subtema.
+        """
+        permitidos = None
+        if subtopic_id is not None:
+            permitidos = np.array([id_entero(m.get("subtopic_id")) == subtopic_id for m in self.metadata], dtype=bool)
+
+        rankings = {}
+        scores_bm25 = self.bm25(consulta)
+        if permitidos is not None:
+            scores_bm25[~permitidos] = 0.0
+        rankings["bm25"] = [int(d) for d in _mejores(scores_bm25, CANDIDATOS_FUSION) if scores_bm25[d] > 0]
+        if vector is not None and self.vectores is not None:
+            similitudes = self.vectores @ vector
+            if permitidos is not None:
+                similitudes[~permitidos] = -np.inf
+            rankings["denso"] = [int(d) for d in _mejores(similitudes, CANDIDATOS_FUSION)
+                                 if permitidos is None or permitidos[d]]
+
+        fusion: Dict[int, float] = {}
+        for ranking in rankings.values():
+            for posicion, doc in enumerate(ranking):
+                fusion[doc] = fusion.get(doc, 0.0) + 1.0 / (RRF_K + posicion + 1)
+
+        resultados = []
+        for doc in sorted(fusion, key=fusion.get, reverse=True)[:n]:
+            metadata = self.metadata[doc]
+            resultados.append({
+                "subtopic_id": id_entero(metadata.get("subtopic_id")),
+                "unit_id": id_entero(metadata.get("unit_id")),
+                "text": str(self.textos[doc]),
+                "score": fusion[doc],
+                "posiciones": {nombre: r.index(doc) + 1 for nombre, r in rankings.items() if doc in r},
+                "metadata": metadata,
+            })
+        return resultados
+
+
+def _mejores(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, len(scores))
+    if k == 0:
+        return np.array([], dtype=np.int64)
+    mejores = np.argpartition(-scores, k - 1)[:k]
+    return mejores[np.argsort(-scores[mejores])]
+
+
+def id_entero(valor) -> Optional[int]:
+    try:
+        return int(float(valor))
+    except (TypeError, ValueError):
+        return None
+
+
+class IndicesHibridos:
+    """
+    Índices híbridos (BM25 + vectores) de los contenidos de cada vector store, cargados
+    desde snapshots en disco y recargados si el archivo cambia. Los embeddings de las
+    consultas salen de la caché de `clasificador_local`.
+    """
+
+    def __init__(self, directorio: str):
+        self.directorio = directorio
+        self._indices: Dict[str, IndiceHibrido] = {}
+
+    async def obtener(self, vector_store_id: str) -> Optional[IndiceHibrido]:
+        ruta = os.path.join(self.directorio, f"{vector_store_id}.npz")
+        try:
+            mtime = os.stat(ruta).st_mtime
+        except FileNotFoundError:
+            return None
+        indice = self._indices.get(vector_store_id)
+        if indice is None or indice.mtime != mtime:
+            indice = await asyncio.to_thread(IndiceHibrido.cargar, ruta, mtime)
+            self._indices[vector_store_id] = indice
+            print(f"[indices_hibridos] Índice de {vector_store_id} cargado ({len(indice.textos)} documentos, "
+                  f"{len(indice.terminos)} términos).")
+        return indice
+
+    async def buscar(self, texto: str, vector_store_id: str, n: int,
+                     subtopic_id: Optional[int] = None) -> Optional[List[dict]]:
+        """
+        Devuelve los `n` mejores documentos, o None si no hay índice para el vector store.
+        Si no se puede calcular el embedding de la consulta se usa solo BM25.
+        """
+        indice = await self.obtener(vector_store_id)
+        if indice is None:
+            return None
+
+        vector = None
+        if indice.vectores is not None:
+            try:
+                vector = await clasificador_local.embedding(texto, indice.modelo)
+            except Exception as e:
+                metricas.contador("indices_hibridos.sin_embedding").incrementar()
+                print(f"[indices_hibridos] Búsqueda solo léxica, falló el embedding: {e}")
+
+        inicio = time.perf_counter()
+        resultados = indice.buscar(texto, vector, n, subtopic_id)
+        metricas.histograma("indices_hibridos.busqueda_s").observar(time.perf_counter() - inicio)
+        return resultados
+
+
+indices_hibridos = IndicesHibridos(directorio=INDICES_HIBRIDOS_DIR)
@@ -0,0 +1,61 @@
+# Registro de los handlers de la cola de trabajos. Se importa desde main.py antes de
+# iniciar los workers para que todos los tipos de job estén disponibles.
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.db_config import AsyncSessionLocal
+from services.evaluacion_service import EvaluacionService
+from services.job_queue_service import cola_trabajos
+from services.pool_preguntas_service import pool_preguntas
+from services.pregunta_service import PreguntaService
+from services.run_engine import run_engine
+from services.thread_service import ThreadService
+
+
+@cola_trabajos.handler("procesar_run", max_intentos=3)
+async def procesar_run(payload: dict):
+    async with AsyncSessionLocal() as db:
+        await ThreadService(db).procesar_run_en_background(
+            id=payload["thread_id"],
+            run_id=payload["run_id"],
+            asistente_id=payload["asistente_id"],
+            estudiante_id=payload["estudiante_id"],
+        )
+
+
+@cola_trabajos.handler_lote("registrar_pregunta", max_lote=50, ventana=0.2, max_intentos=5)
+async def registrar_preguntas(db: AsyncSession, payloads: list[dict]):
+    return await PreguntaService(db).registrar_lote(payloads)
+
+
+@cola_trabajos.handler("generar_preguntas", max_intentos=3)
+async def generar_preguntas(payload: dict):
+    await pool_preguntas.reponer(payload["subtema_id"])
+
+
+def _evento_calificacion(payload: dict, salida: dict) -> dict:
+    return {
+        "evento": "evaluacion_calificada",
+        "run_id": payload["run_id"],
+        "thread_id": payload["thread_id"],
+        "evaluation_id": payload["evaluation_id"],
+        **salida,
+    }
+
+
+async def calificacion_fallida(payload: dict, error: Exception):
+    # La evaluación queda pendiente; se avisa al estudiante y se libera el canal del run.
+    if payload.get("run_id"):
+        run_engine.notificar(payload["run_id"], _evento_calificacion(payload, {
+            "status": "error",
+            "error": "No se pudo calificar la evaluación. Intentá de nuevo más tarde.",
+        }))
+
+
+@cola_trabajos.handler("calificar_evaluacion", max_intentos=3, al_agotar=calificacion_fallida)
+async def calificar_evaluacion(payload: dict):
+    async with AsyncSessionLocal() as db:
+        salida = await EvaluacionService(db).calificar_en_segundo_plano(
+            thread_id=payload["thread_id"],
+            evaluation_id=payload["evaluation_id"],
+        )
+    if payload.get("run_id"):
+        run_engine.notificar(payload["run_id"], _evento_calificacion(payload, salida))
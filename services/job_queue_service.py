@@ -0,0 +1,283 @@
+import asyncio
+import contextvars
+import os
+import socket
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+from config.db_config import AsyncSessionLocal
+from models.job import Job
+from repositories.job_repository import JobRepository
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_LEASE_SEGUNDOS = float(os.getenv("JOB_LEASE_SEGUNDOS", "30"))
+JOB_INTERVALO_SONDEO = float(os.getenv("JOB_INTERVALO_SONDEO", "1.0"))
+# Cada cuánto se cierran los jobs abandonados sin intentos y se purgan los completados
+JOB_INTERVALO_MANTENIMIENTO = float(os.getenv("JOB_INTERVALO_MANTENIMIENTO", "300"))
+JOB_RETENCION_COMPLETADOS_DIAS = float(os.getenv("JOB_RETENCION_COMPLETADOS_DIAS", "7"))
+
+Handler = Callable[[dict], Awaitable[None]]
+# Se llama cuando un job agota sus intentos, con el payload y el último error
+AlAgotar = Callable[[dict, Exception], Awaitable[None]]
+# Recibe la sesión y los payloads del lote; devuelve los errores por índice de payload.
+# No debe confirmar la transacción: la cola la confirma junto con el cierre de los jobs.
+HandlerLote = Callable[[AsyncSession, List[dict]], Awaitable[Dict[int, Exception]]]
+
+
+@dataclass
+class ConfigLote:
+    handler: HandlerLote
+    max_lote: int
+    ventana: float
+
+
+class ColaTrabajos:
+    """
+    Cola de trabajos persistida en Postgres (tabla `job`) con semántica de lease/heartbeat.
+
+    Cada worker toma un job, lo ejecuta renovando el lease periódicamente y lo marca como
+    completado o fallido. Si el proceso muere, el lease vence y otro worker (o el mismo
+    proceso al reiniciar) retoma el job.
+    """
+
+    def __init__(self, workers: int, lease_segundos: float, intervalo_sondeo: float,
+                 intervalo_mantenimiento: float, retencion_completados_dias: float):
+        self.workers = workers
+        self.lease_segundos = lease_segundos
+        self.intervalo_sondeo = intervalo_sondeo
+        self.intervalo_mantenimiento = intervalo_mantenimiento
+        self.retencion_completados = timedelta(days=retencion_completados_dias)
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._handlers: Dict[str, Handler] = {}
+        self._lotes: Dict[str, ConfigLote] = {}
+        self._max_intentos: Dict[str, int] = {}
+        self._al_agotar: Dict[str, AlAgotar] = {}
+        self._hay_trabajo = asyncio.Event()
+        self._hay_lote: Dict[str, asyncio.Event] = {}
+        self._tareas: Set[asyncio.Task] = set()
+
+    def handler(self, tipo: str, max_intentos: int = 5, al_agotar: Optional[AlAgotar] = None):
+        """
+        Decorador para registrar la función que ejecuta los jobs de un tipo. `al_agotar` se
+        ejecuta cuando un job falla en su último intento.
+        """
+        def registrar(fn: Handler) -> Handler:
+            self._handlers[tipo] = fn
+            self._max_intentos[tipo] = max_intentos
+            if al_agotar is not None:
+                self._al_agotar[tipo] = al_agotar
+            return fn
+        return registrar
+
+    def handler_lote(self, tipo: str, max_lote: int = 50, ventana: float = 0.2, max_intentos: int = 5):
+        """
+        Decorador para registrar un handler que procesa los jobs de un tipo en lotes de hasta
+        `max_lote`. Al llegar trabajo se esperan `ventana` segundos para juntar más jobs.
+        Las escrituras del handler se confirman en la misma transacción que completa los
+        jobs, así un reintento tras una caída no las duplica.
+        """
+        def registrar(fn: HandlerLote) -> HandlerLote:
+            self._lotes[tipo] = ConfigLote(handler=fn, max_lote=max_lote, ventana=ventana)
+            self._max_intentos[tipo] = max_intentos
+            self._hay_lote[tipo] = asyncio.Event()
+            return fn
+        return registrar
+
+    def _lanzar(self, coro) -> asyncio.Task:
+        # Los jobs no heredan el contexto de la solicitud que los encoló.
+        tarea = asyncio.create_task(coro, context=contextvars.Context())
+        self._tareas.add(tarea)
+        tarea.add_done_callback(self._tareas.discard)
+        return tarea
+
+    async def encolar(self, tipo: str, payload: dict, ejecutar_local: bool = False) -> int:
+        """
+        Persiste un job nuevo. Con `ejecutar_local` el job se crea ya tomado por este proceso
+        y se ejecuta enseguida; el registro en la tabla solo sirve para retomarlo si el
+        proceso se cae antes de terminar.
+        """
+        if tipo not in self._handlers and tipo not in self._lotes:
+            raise ValueError(f"No hay un handler registrado para los jobs de tipo {tipo}")
+
+        job_data = {"tipo": tipo, "payload": payload, "max_intentos": self._max_intentos[tipo]}
+        if ejecutar_local:
+            job_data.update({
+                "estado": "en_curso",
+                "intentos": 1,
+                "worker_id": self.worker_id,
+                "lease_hasta": datetime.now(timezone.utc) + timedelta(seconds=self.lease_segundos),
+            })
+
+        async with AsyncSessionLocal() as db:
+            job = await JobRepository(db).create(job_data)
+
+        if ejecutar_local:
+            self._lanzar(self._ejecutar(job))
+        elif tipo in self._lotes:
+            self._hay_lote[tipo].set()
+        else:
+            self._hay_trabajo.set()
+        return job.job_id
+
+    async def iniciar(self):
+        await self._agotar_vencidos()
+        async with AsyncSessionLocal() as db:
+            liberados = await JobRepository(db).liberar_vencidos()
+        if liberados:
+            print(f"[cola_trabajos] Se retoman {liberados} jobs abandonados por workers caídos.")
+        self._lanzar(self._mantenimiento())
+        for n in range(self.workers):
+            self._lanzar(self._worker(n))
+        for tipo in self._lotes:
+            self._lanzar(self._worker_lote(tipo))
+
+    async def detener(self):
+        for tarea in list(self._tareas):
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        async with AsyncSessionLocal() as db:
+            await JobRepository(db).liberar_de_worker(self.worker_id)
+
+    async def _agotar_vencidos(self):
+        # Jobs cuyo worker se cayó o se colgó en el último intento: no se vuelven a tomar.
+        async with AsyncSessionLocal() as db:
+            agotados = await JobRepository(db).agotar_vencidos()
+        for job in agotados:
+            print(f"[cola_trabajos] El job {job.job_id} ({job.tipo}) agotó sus intentos con el lease vencido.")
+            await self._al_agotar_job(job, RuntimeError(job.last_error))
+
+    async def _mantenimiento(self):
+        while True:
+            await asyncio.sleep(self.intervalo_mantenimiento)
+            try:
+                await self._agotar_vencidos()
+                async with AsyncSessionLocal() as db:
+                    purgados = await JobRepository(db).purgar_completados(
+                        datetime.now(timezone.utc) - self.retencion_completados
+                    )
+                if purgados:
+                    print(f"[cola_trabajos] Se purgaron {purgados} jobs completados.")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[cola_trabajos] Error en el mantenimiento de la cola: {e}")
+
+    async def _al_agotar_job(self, job: Job, error: Exception):
+        if job.tipo not in self._al_agotar:
+            return
+        try:
+            await self._al_agotar[job.tipo](job.payload, error)
+        except Exception as e_agotar:
+            print(f"[cola_trabajos] Error al cerrar el job agotado {job.job_id} ({job.tipo}): {e_agotar}")
+
+    async def _worker(self, n: int):
+        tipos = list(self._handlers)
+        if not tipos:
+            return
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    jobs = await JobRepository(db).reclamar(tipos, self.worker_id, self.lease_segundos)
+                if not jobs:
+                    self._hay_trabajo.clear()
+                    try:
+                        await asyncio.wait_for(self._hay_trabajo.wait(), timeout=self.intervalo_sondeo)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._ejecutar(jobs[0])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[cola_trabajos] Error en el worker {n}: {e}")
+                await asyncio.sleep(self.intervalo_sondeo)
+
+    async def _worker_lote(self, tipo: str):
+        config = self._lotes[tipo]
+        hay_lote = self._hay_lote[tipo]
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    jobs = await JobRepository(db).reclamar([tipo], self.worker_id, self.lease_segundos,
+                                                            limite=config.max_lote)
+                if not jobs:
+                    hay_lote.clear()
+                    try:
+                        await asyncio.wait_for(hay_lote.wait(), timeout=self.intervalo_sondeo)
+                        # Llegó trabajo: se espera un poco para que el lote junte más jobs.
+                        await asyncio.sleep(config.ventana)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._ejecutar_lote(config, jobs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[cola_trabajos] Error en el worker de lotes {tipo}: {e}")
+                await asyncio.sleep(self.intervalo_sondeo)
+
+    async def _ejecutar_lote(self, config: ConfigLote, jobs: List[Job]):
+        job_ids = [job.job_id for job in jobs]
+        heartbeat = asyncio.create_task(self._heartbeat(*job_ids))
+        try:
+            async with AsyncSessionLocal() as db:
+                try:
+                    errores = await config.handler(db, [job.payload for job in jobs])
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    await db.rollback()
+                    errores = {i: e for i in range(len(jobs))}
+                completados = [job.job_id for i, job in enumerate(jobs) if i not in errores]
+                # Confirma en una sola transacción lo que escribió el handler y el cierre de los jobs.
+                await JobRepository(db).completar(completados)
+            for i, error in errores.items():
+                print(f"[cola_trabajos] Falló el job {jobs[i].job_id} ({jobs[i].tipo}): {error}")
+                async with AsyncSessionLocal() as db:
+                    await JobRepository(db).fallar(jobs[i].job_id, str(error),
+                                                   reintentar_en=min(60, 2 ** jobs[i].intentos))
+        finally:
+            heartbeat.cancel()
+
+    async def _ejecutar(self, job: Job):
+        heartbeat = asyncio.create_task(self._heartbeat(job.job_id))
+        try:
+            await self._handlers[job.tipo](job.payload)
+        except asyncio.CancelledError:
+            # Apagado del proceso: el job queda tomado y se retoma cuando se libera su lease.
+            raise
+        except Exception as e:
+            print(f"[cola_trabajos] Falló el job {job.job_id} ({job.tipo}): {e}")
+            async with AsyncSessionLocal() as db:
+                await JobRepository(db).fallar(job.job_id, str(e), reintentar_en=min(60, 2 ** job.intentos))
+            if job.intentos >= job.max_intentos:
+                await self._al_agotar_job(job, e)
+            return
+        finally:
+            heartbeat.cancel()
+
+        async with AsyncSessionLocal() as db:
+            await JobRepository(db).completar([job.job_id])
+
+    async def _heartbeat(self, *job_ids: int):
+        while True:
+            await asyncio.sleep(self.lease_segundos / 3)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await JobRepository(db).renovar_lease(list(job_ids), self.worker_id, self.lease_segundos)
+            except Exception as e:
+                print(f"[cola_trabajos] No se pudo renovar el lease de los jobs {list(job_ids)}: {e}")
+
+
+cola_trabajos = ColaTrabajos(
+    workers=JOB_WORKERS,
+    lease_segundos=JOB_LEASE_SEGUNDOS,
+    intervalo_sondeo=JOB_INTERVALO_SONDEO,
+    intervalo_mantenimiento=JOB_INTERVALO_MANTENIMIENTO,
+    retencion_completados_dias=JOB_RETENCION_COMPLETADOS_DIAS,
+)
@@ -0,0 +1,140 @@
+import asyncio
+import contextvars
+from typing import Dict, List, Optional, Set
+from sqlalchemy.ext.asyncio import AsyncSession
+from openai_client import client
+from config.db_config import AsyncSessionLocal
+from models.mensaje import Mensaje
+from repositories.mensaje_repository import MensajeRepository
+from services.archivo_service import ArchivoService
+from utils.admision import admision
+
+# Tamaño de página al traer mensajes de OpenAI (máximo permitido por la API)
+PAGINA_SINCRONIZACION = 100
+
+
+def archivos_de(mensajes) -> List[str]:
+    """
+    Devuelve los file_id de las imágenes de `mensajes` (filas o dicts con `partes`), en orden.
+    """
+    file_ids = []
+    for m in mensajes:
+        partes = m["partes"] if isinstance(m, dict) else m.partes
+        file_ids.extend(p["file_id"] for p in partes if p["type"] == "image_file")
+    return file_ids
+
+
+class MensajeService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.mensaje_repo = MensajeRepository(db)
+
+    async def get_mensajes(self, thread_id: str, limit: int = 30, before: Optional[str] = None,
+                           after: Optional[str] = None) -> List[Mensaje]:
+        """
+        Lee los mensajes del thread desde la copia local. `before`/`after` son ids de
+        mensaje y devuelven la página anterior/posterior a ese mensaje (scroll infinito).
+        """
+        antes_de = await self._id_local(before) if before else None
+        despues_de = await self._id_local(after) if after else None
+        return await self.mensaje_repo.get_by_thread(thread_id, limit, antes_de=antes_de, despues_de=despues_de)
+
+    async def _id_local(self, mensaje_id: str) -> int:
+        mensaje = await self.mensaje_repo.get_by_mensaje_id(mensaje_id)
+        if not mensaje:
+            raise ValueError(f"Mensaje con id {mensaje_id} no encontrado")
+        return mensaje.id
+
+    async def tiene_mensajes(self, thread_id: str) -> bool:
+        return await self.mensaje_repo.get_ultimo(thread_id) is not None
+
+    async def sincronizar(self, thread_id: str) -> List[dict]:
+        """
+        Trae de OpenAI los mensajes posteriores al último guardado (cursor `after`) y los
+        guarda en orden. Se detiene en el primer mensaje que todavía se está generando,
+        para retomarlo completo en la próxima sincronización. Devuelve los mensajes guardados.
+        """
+        ultimo = await self.mensaje_repo.get_ultimo(thread_id)
+        cursor = ultimo.mensaje_id if ultimo else None
+        guardados = []
+
+        while True:
+            params = {"thread_id": thread_id, "order": "asc", "limit": PAGINA_SINCRONIZACION}
+            if cursor:
+                params["after"] = cursor
+            async with admision.slot():
+                pagina = await client.beta.threads.messages.list(**params)
+
+            nuevos = []
+            incompleto = False
+            for m in pagina.data:
+                if m.status == "in_progress":
+                    incompleto = True
+                    break
+                nuevos.append({
+                    "mensaje_id": m.id,
+                    "thread_id": thread_id,
+                    "run_id": m.run_id,
+                    "rol": m.role,
+                    "partes": self._mapear_partes(m),
+                    "created_at": m.created_at,
+                })
+
+            await self.mensaje_repo.upsert_many(nuevos)
+            guardados.extend(nuevos)
+            if incompleto or not pagina.data or not pagina.has_more:
+                return guardados
+            cursor = pagina.data[-1].id
+
+    def _mapear_partes(self, m) -> list[dict]:
+        partes = []
+        for c in m.content:
+            if c.type == "text":
+                partes.append({"type": "text", "text": c.text.value})
+            elif c.type == "image_file":
+                if c.image_file.file_id:
+                    partes.append({"type": "image_file", "file_id": c.image_file.file_id})
+                else:
+                    print(f"WARN: Se encontró una referencia de archivo corrupta (file_id vacío) en el mensaje {m.id}. Se ignorará.")
+        return partes
+
+
+class SincronizadorMensajes:
+    """
+    Sincroniza la copia local de los mensajes cuando termina un run. Las sincronizaciones
+    de un mismo thread se ejecutan de a una, y las lecturas pueden esperar a la que esté
+    en curso para no devolver un historial sin la última respuesta.
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._pendientes: Dict[str, asyncio.Task] = {}
+        self._tareas: Set[asyncio.Task] = set()
+
+    def programar(self, thread_id: str):
+        tarea = asyncio.create_task(self._sincronizar(thread_id), context=contextvars.Context())
+        self._pendientes[thread_id] = tarea
+        self._tareas.add(tarea)
+        tarea.add_done_callback(self._tareas.discard)
+        tarea.add_done_callback(lambda t: self._pendientes.pop(thread_id, None) if self._pendientes.get(thread_id) is t else None)
+
+    async def esperar(self, thread_id: str):
+        tarea = self._pendientes.get(thread_id)
+        if tarea:
+            await asyncio.shield(tarea)
+
+    async def sincronizar(self, db: AsyncSession, thread_id: str) -> List[dict]:
+        async with self._locks.setdefault(thread_id, asyncio.Lock()):
+            return await MensajeService(db).sincronizar(thread_id)
+
+    async def _sincronizar(self, thread_id: str):
+        try:
+            async with AsyncSessionLocal() as db:
+                guardados = await self.sincronizar(db, thread_id)
+            # Las imágenes nuevas se bajan a la caché antes de que el frontend las pida.
+            await ArchivoService().precargar(archivos_de(guardados))
+        except Exception as e:
+            print(f"[sincronizador_mensajes] No se pudieron sincronizar los mensajes del thread {thread_id}: {e}")
+
+
+sincronizador_mensajes = SincronizadorMensajes()
@@ -0,0 +1,197 @@
+import os
+import re
+import time
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.db_config import AsyncSessionLocal
+from models.subtema import Subtema
+from openai_client import client
+from repositories.pregunta_generada_repository import PreguntaGeneradaRepository
+from services.banco_preguntas import banco_preguntas, id_pregunta
+from services.job_queue_service import cola_trabajos
+from utils.admision import admision
+from utils.metricas import metricas
+from utils.texto import normalizar_texto
+
+load_dotenv()
+
+# Por debajo de este mínimo de preguntas en el pool se encola una reposición
+POOL_PREGUNTAS_MINIMO = int(os.getenv("POOL_PREGUNTAS_MINIMO", "10"))
+# Cantidad de preguntas a la que se repone el pool de cada subtema
+POOL_PREGUNTAS_OBJETIVO = int(os.getenv("POOL_PREGUNTAS_OBJETIVO", "25"))
+# Tiempo mínimo entre dos pedidos de reposición del mismo subtema desde este proceso
+POOL_PREGUNTAS_REINTENTO = float(os.getenv("POOL_PREGUNTAS_REINTENTO", "120"))
+MODELO_GENERACION = "gpt-4o-mini"
+MIN_CARACTERES_PREGUNTA = 20
+MAX_CARACTERES_PREGUNTA = 1500
+
+_NUMERACION = re.compile(r"^\s*(?:\d+\s*[\.\)\-:]|[-*•])\s*")
+_CON_RESPUESTA = re.compile(r"\b(respuesta|solucion|resolucion)\s*:")
+
+
+def construir_prompt_generacion(subtema: str, subtema_id: int, cantidad: int, ejemplos: List[str]) -> str:
+    prompt = (
+        f"Genera {cantidad} preguntas tipo examen para el subtema \"{subtema}\" (ID {subtema_id}), "
+        "relacionadas con el tema indicado. "
+        "Las expresiones matemáticas (si las hay) deberán estar obligatoriamente "
+        "escritas en formato LaTeX, usando el entorno:\n\n"
+        "\\[\n\\begin{align*}\n...\n\\end{align*}\n\\]\n\n"
+        "No incluyas respuestas ni explicaciones. No uses numeración. "
+        "Separá cada pregunta con dos líneas en blanco.\n\n"
+    )
+
+    if ejemplos:
+        prompt += "Aquí algunos ejemplos del estilo esperado:\n\n" + "\n\n".join(ejemplos)
+
+    return prompt
+
+
+def extraer_preguntas_generadas(texto: str) -> List[str]:
+    """
+    Separa las preguntas por líneas en blanco. Un bloque LaTeX `\\[ ... \\]` pertenece a la
+    pregunta anterior aunque esté separado por una línea en blanco.
+    """
+    preguntas = []
+    buffer = ""
+    en_latex = False
+    separada = False
+
+    for linea in texto.splitlines():
+        linea = linea.strip()
+
+        if en_latex:
+            buffer += "\n" + linea
+            en_latex = not linea.startswith("\\]")
+            continue
+
+        if not linea:
+            separada = bool(buffer)
+            continue
+
+        if linea.startswith("\\["):
+            buffer = f"{buffer}\n{linea}" if buffer else linea
+            en_latex = not linea.endswith("\\]") or linea == "\\["
+        elif separada:
+            preguntas.append(buffer.strip())
+            buffer = linea
+        else:
+            buffer = f"{buffer}\n{linea}" if buffer else linea
+        separada = False
+
+    if buffer:
+        preguntas.append(buffer.strip())
+
+    return preguntas
+
+
+def validar_preguntas(textos: List[str], existentes: set) -> Dict[str, str]:
+    """
+    Filtra las preguntas generadas y devuelve las válidas como {hash: texto}. Se descartan
+    las muy cortas o largas, las que incluyen la respuesta, las de LaTeX desbalanceado y las
+    repetidas (entre sí o con `existentes`, un conjunto de hashes).
+    """
+    validas: Dict[str, str] = {}
+    for texto in textos:
+        texto = _NUMERACION.sub("", texto).strip()
+        if not MIN_CARACTERES_PREGUNTA <= len(texto) <= MAX_CARACTERES_PREGUNTA:
+            continue
+        if _CON_RESPUESTA.search(normalizar_texto(texto)):
+            continue
+        if texto.count("\\[") != texto.count("\\]") or texto.count("\\begin") != texto.count("\\end"):
+            continue
+        h = id_pregunta(texto, {})
+        if h in existentes or h in validas:
+            continue
+        validas[h] = texto
+    return validas
+
+
+class PoolPreguntas:
+    """
+    Mantiene en la tabla `pregunta_generada` un stock de preguntas generadas por subtema,
+    para completar evaluaciones cuando el banco local no alcanza sin esperar a la
+    generación. Al tomar preguntas, si el stock queda por debajo del mínimo se encola un
+    job `generar_preguntas` que lo repone en segundo plano.
+    """
+
+    def __init__(self, minimo: int, objetivo: int, reintento: float):
+        self.minimo = minimo
+        self.objetivo = objetivo
+        self.reintento = reintento
+        self._solicitadas: Dict[int, float] = {}
+
+    async def tomar(self, db: AsyncSession, subtema_id: int, n: int) -> List[Dict]:
+        repo = PreguntaGeneradaRepository(db)
+        tomadas = await repo.tomar(subtema_id, n) if n > 0 else []
+        metricas.contador("pool_preguntas.tomadas").incrementar(len(tomadas))
+        if len(tomadas) < n:
+            metricas.contador("pool_preguntas.insuficiente").incrementar()
+        if len(tomadas) < n or await repo.contar(subtema_id) < self.minimo:
+            await self.solicitar_reposicion(subtema_id)
+        return [{"id": p.hash, "text": p.texto} for p in tomadas]
+
+    async def solicitar_reposicion(self, subtema_id: int):
+        ahora = time.monotonic()
+        if ahora - self._solicitadas.get(subtema_id, float("-inf")) < self.reintento:
+            return
+        self._solicitadas[subtema_id] = ahora
+        try:
+            await cola_trabajos.encolar("generar_preguntas", {"subtema_id": subtema_id})
+            metricas.contador("pool_preguntas.reposiciones_solicitadas").incrementar()
+        except Exception as e:
+            self._solicitadas.pop(subtema_id, None)
+            print(f"[pool_preguntas] No se pudo encolar la reposición del subtema {subtema_id}: {e}")
+
+    async def generar(self, subtema: str, subtema_id: int, cantidad: int, ejemplos: List[str]) -> List[str]:
+        prompt = construir_prompt_generacion(subtema, subtema_id, cantidad, ejemplos)
+        with metricas.medir("pool_preguntas.generacion_s"):
+            async with admision.slot():
+                respuesta = await client.chat.completions.create(
+                    model=MODELO_GENERACION,
+                    messages=[{"role": "system", "content": "Sos un generador de preguntas de nivel universitario. "
+                                "No incluyas respuestas ni explicaciones. "
+                                "Separá cada pregunta con dos líneas en blanco."}, {"role": "user", "content": prompt}],
+                    temperature=0.7
+                )
+        raw_content = respuesta.choices[0].message.content
+        texto = "\n".join(p["text"] for p in raw_content if "text" in p) if isinstance(raw_content, list) else raw_content
+        return extraer_preguntas_generadas(texto or "")
+
+    async def reponer(self, subtema_id: int, nombre: Optional[str] = None):
+        """
+        Genera y valida preguntas hasta llevar el pool del subtema al objetivo.
+        """
+        async with AsyncSessionLocal() as db:
+            repo = PreguntaGeneradaRepository(db)
+            faltantes = self.objetivo - await repo.contar(subtema_id)
+            if faltantes <= 0:
+                return
+            if nombre is None:
+                subtema = await db.get(Subtema, subtema_id)
+                if subtema is None:
+                    raise ValueError(f"Subtema con id {subtema_id} no encontrado")
+                nombre = subtema.nombre
+            existentes = set(await repo.get_hashes(subtema_id))
+
+        existentes |= await banco_preguntas.ids(subtema_id)
+        ejemplos = [p["text"] for p in await banco_preguntas.muestrear(subtema_id, 3)]
+        # Se pide un margen extra: parte de lo generado puede no pasar la validación.
+        generadas = await self.generar(nombre, subtema_id, faltantes + max(2, faltantes // 5), ejemplos)
+        validas = validar_preguntas(generadas, existentes)
+        metricas.contador("pool_preguntas.descartadas").incrementar(len(generadas) - len(validas))
+
+        async with AsyncSessionLocal() as db:
+            insertadas = await PreguntaGeneradaRepository(db).agregar(
+                subtema_id, dict(list(validas.items())[:faltantes])
+            )
+        metricas.contador("pool_preguntas.generadas").incrementar(insertadas)
+        print(f"[pool_preguntas] Subtema {subtema_id}: {insertadas} preguntas nuevas "
+              f"({len(generadas) - len(validas)} descartadas).")
+
+
+pool_preguntas = PoolPreguntas(
+    minimo=POOL_PREGUNTAS_MINIMO,
+    objetivo=POOL_PREGUNTAS_OBJETIVO,
+    reintento=POOL_PREGUNTAS_REINTENTO,
+)
@@ -0,0 +1,155 @@
+import asyncio
+import contextvars
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+from config.db_config import AsyncSessionLocal
+from repositories.asistente_repository import AsistenteRepository
+from repositories.subtema_repository import SubtemaRepository
+from services.vector_store_service import VectorService
+from utils.metricas import metricas
+
+load_dotenv()
+
+# Segundos que se conserva una evaluación preparada a la espera de `iniciar_evaluacion`
+PREFETCH_EVALUACION_TTL = float(os.getenv("PREFETCH_EVALUACION_TTL", "90"))
+# Preguntas que se preparan (la cantidad por defecto de `iniciar_evaluacion`)
+PREFETCH_EVALUACION_PREGUNTAS = int(os.getenv("PREFETCH_EVALUACION_PREGUNTAS", "5"))
+# Tiempo máximo que `iniciar_evaluacion` espera una preparación todavía en curso
+PREFETCH_EVALUACION_ESPERA = float(os.getenv("PREFETCH_EVALUACION_ESPERA", "5"))
+PREFETCH_EVALUACION_MAX_ESTUDIANTES = int(os.getenv("PREFETCH_EVALUACION_MAX_ESTUDIANTES", "5000"))
+
+
+@dataclass
+class Especulacion:
+    subtema_id: int
+    unidad_id: int
+    subtema_nombre: Optional[str]
+    preguntas: List[Dict] = field(default_factory=list)
+
+
+@dataclass
+class Slot:
+    asistente_id: str
+    vence: float
+    tarea: asyncio.Task
+
+
+class PrefetchEvaluaciones:
+    """
+    Ejecución especulativa de `iniciar_evaluacion`. Cuando un mensaje del estudiante pide
+    una evaluación o ejercicios (`VectorService.es_pregunta_de_accion`), se clasifica el
+    mensaje y se buscan las preguntas en segundo plano, mientras el asistente todavía
+    procesa el run. El resultado queda en un slot por estudiante que vence a los `ttl`
+    segundos; `iniciar_evaluacion` lo consume y lo usa solo si coincide con el subtema que
+    pidió el asistente. Las preguntas preparadas no se marcan como servidas hasta que se usan.
+
+    Se preparan `n_preguntas`: si el asistente pide más, la especulación no alcanza aunque
+    el subtema coincida. Esos casos se cuentan aparte (`insuficientes`) y no como descartes,
+    para distinguir un límite bajo de una mala predicción del subtema.
+    """
+
+    def __init__(self, ttl: float, n_preguntas: int, espera: float, max_estudiantes: int):
+        self.ttl = ttl
+        self.n_preguntas = n_preguntas
+        self.espera = espera
+        self.max_estudiantes = max_estudiantes
+        self._slots: "OrderedDict[int, Slot]" = OrderedDict()
+
+    def especular(self, texto: str, asistente_id: str, estudiante_id: int) -> bool:
+        """
+        Si el mensaje pide una evaluación, lanza su preparación y devuelve True. No espera.
+        """
+        if not VectorService(None).es_pregunta_de_accion(texto):
+            return False
+        self._descartar(estudiante_id)
+        # Contexto limpio: la tarea no hereda el lugar de la solicitud en el control de admisión.
+        tarea = asyncio.create_task(self._preparar(texto, asistente_id, estudiante_id),
+                                    context=contextvars.Context())
+        self._slots[estudiante_id] = Slot(asistente_id=asistente_id, vence=time.monotonic() + self.ttl, tarea=tarea)
+        while len(self._slots) > self.max_estudiantes:
+            _, viejo = self._slots.popitem(last=False)
+            viejo.tarea.cancel()
+        metricas.contador("prefetch_evaluacion.lanzadas").incrementar()
+        return True
+
+    async def _preparar(self, texto: str, asistente_id: str, estudiante_id: int) -> Optional[Especulacion]:
+        try:
+            with metricas.medir("prefetch_evaluacion.preparacion_s"):
+                async with AsyncSessionLocal() as db:
+                    asistente = await AsistenteRepository(db).get_by_id(asistente_id=asistente_id)
+                    if asistente is None or not asistente.vs_evaluaciones_id:
+                        return None
+                    vector_service = VectorService(db)
+                    subtema_id, unidad_id = await vector_service.clasificar_consulta(
+                        texto, asistente.vs_evaluaciones_id, estudiante_id
+                    )
+                    nombre = await SubtemaRepository(db).get_nombre(subtema_id)
+                    preguntas = await vector_service.obtener_preguntas(
+                        subtema=nombre or texto, subtema_id=subtema_id, n=self.n_preguntas,
+                        vector_store_id=asistente.vs_evaluaciones_id, estudiante_id=estudiante_id,
+                        especulativo=True,
+                    )
+            return Especulacion(subtema_id=subtema_id, unidad_id=unidad_id, subtema_nombre=nombre,
+                                preguntas=preguntas)
+        except Exception as e:
+            # Ej. una acción sin tema de contexto: `iniciar_evaluacion` hará el camino normal.
+            metricas.contador("prefetch_evaluacion.errores").incrementar()
+            print(f"[prefetch_evaluacion] No se pudo preparar la evaluación: {e}")
+            return None
+
+    def _descartar(self, estudiante_id: int):
+        slot = self._slots.pop(estudiante_id, None)
+        if slot is not None:
+            slot.tarea.cancel()
+
+    async def tomar(self, estudiante_id: int, asistente_id: str) -> Optional[Especulacion]:
+        """
+        Consume el slot del estudiante. Devuelve la evaluación preparada, o None si no hay,
+        venció, es de otro asistente o no terminó de prepararse a tiempo.
+        """
+        slot = self._slots.pop(estudiante_id, None)
+        if slot is None:
+            metricas.contador("prefetch_evaluacion.sin_slot").incrementar()
+            return None
+        if slot.vence < time.monotonic() or slot.asistente_id != asistente_id:
+            slot.tarea.cancel()
+            metricas.contador("prefetch_evaluacion.vencidas").incrementar()
+            return None
+        try:
+            return await asyncio.wait_for(slot.tarea, timeout=self.espera)
+        except asyncio.TimeoutError:
+            metricas.contador("prefetch_evaluacion.demoradas").incrementar()
+            return None
+
+    def registrar_resultado(self, acierto: bool, insuficiente: bool = False):
+        if acierto:
+            metricas.contador("prefetch_evaluacion.aciertos").incrementar()
+        elif insuficiente:
+            metricas.contador("prefetch_evaluacion.insuficientes").incrementar()
+        else:
+            metricas.contador("prefetch_evaluacion.descartadas").incrementar()
+
+    def estado(self) -> dict:
+        aciertos = metricas.contador("prefetch_evaluacion.aciertos").valor
+        insuficientes = metricas.contador("prefetch_evaluacion.insuficientes").valor
+        lanzadas = metricas.contador("prefetch_evaluacion.lanzadas").valor
+        return {
+            "slots": len(self._slots),
+            "ttl": self.ttl,
+            "n_preguntas": self.n_preguntas,
+            "tasa_aciertos": round(aciertos / lanzadas, 4) if lanzadas else None,
+            # Subtema acertado pero el asistente pidió más de `n_preguntas`
+            "tasa_insuficientes": round(insuficientes / lanzadas, 4) if lanzadas else None,
+        }
+
+
+prefetch_evaluaciones = PrefetchEvaluaciones(
+    ttl=PREFETCH_EVALUACION_TTL,
+    n_preguntas=PREFETCH_EVALUACION_PREGUNTAS,
+    espera=PREFETCH_EVALUACION_ESPERA,
+    max_estudiantes=PREFETCH_EVALUACION_MAX_ESTUDIANTES,
+)
@@ -1,8 +1,16 @@
+import asyncio
+from datetime import datetime, timezone
+from repositories.asistente_repository import AsistenteRepository
 from repositories.pregunta_repository import PreguntaRepository
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from models.pregunta import Pregunta
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession
+from config.db_config import AsyncSessionLocal
+from services.contexto_estudiante import contexto_estudiantes
+from services.job_queue_service import cola_trabajos
 from services.vector_store_service import VectorService
+from utils.metricas import metricas
 
 
 class PreguntaService:
@@ -26,41 +34,100 @@ class PreguntaService:
         return await self.pregunta_repo.get_all()
 
     async def create_pregunta(self, pregunta_data: Dict[str, Any]) -> Pregunta:
-        return await self.pregunta_repo.create(pregunta_data)
+        pregunta = await self.pregunta_repo.create(pregunta_data)
+        contexto_estudiantes.actualizar(pregunta.estudiante_id, pregunta.subtema_id,
+                                        pregunta.unidad_id, pregunta.created_at)
+        return pregunta
 
     async def update_pregunta(self, pregunta_id: int, update_data: Dict[str, Any]) -> Pregunta:
         pregunta = await self.pregunta_repo.get_by_id(pregunta_id)
         if not pregunta:
             raise ValueError(f"No se puede actualizar, pregunta con id {pregunta_id} no encontrada")
-        return await self.pregunta_repo.update(pregunta, update_data)
+        pregunta = await self.pregunta_repo.update(pregunta, update_data)
+        contexto_estudiantes.invalidar(pregunta.estudiante_id)
+        return pregunta
 
     async def delete_pregunta(self, pregunta_id: int) -> None:
         pregunta = await self.pregunta_repo.get_by_id(pregunta_id)
         if not pregunta:
             raise ValueError(f"No se puede eliminar, pregunta con id {pregunta_id} no encontrada")
         await self.pregunta_repo.delete(pregunta)
+        contexto_estudiantes.invalidar(pregunta.estudiante_id)
+
+    async def encolar_registro(self, texto: str, asistente_id: str, estudiante_id: int) -> int:
+        """
+        Deja la pregunta en la cola de trabajos (job `registrar_pregunta`) para clasificarla y
+        grabarla en segundo plano. Una vez encolada, el registro sobrevive a un reinicio.
+        """
+        return await cola_trabajos.encolar("registrar_pregunta", {
+            "texto": texto,
+            "asistente_id": asistente_id,
+            "estudiante_id": estudiante_id,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        })
+
+    async def registrar_lote(self, payloads: List[dict]) -> Dict[int, Exception]:
+        """
+        Clasifica y graba un lote de preguntas encoladas con `encolar_registro`, con un único
+        INSERT para todo el lote (sin commit: lo confirma la cola de trabajos). Las preguntas
+        de cada estudiante se clasifican en orden, pasando la clasificación de una como
+        contexto de la siguiente; estudiantes distintos se clasifican en paralelo.
+        Devuelve los errores reintentables por índice de payload.
+        """
+        metricas.histograma("preguntas.tamano_lote").observar(len(payloads))
+        errores: Dict[int, Exception] = {}
+        filas: Dict[int, dict] = {}
 
-    async def insertar_y_clasificar_pregunta(self, texto: str, vector_store_id: str, estudiante_id: str, asistente_id: str):
+        asistente_repo = AsistenteRepository(self.db)
+        vs_por_asistente = {}
+        for asistente_id in {p["asistente_id"] for p in payloads}:
+            asistente = await asistente_repo.get_by_id(asistente_id=asistente_id)
+            vs_por_asistente[asistente_id] = asistente.vs_temas_id if asistente else None
 
-        print("DATA QUE ESTÁ LLEGANDO:")
-        print(texto)
-        print(vector_store_id)
-        print(estudiante_id)
-        print(asistente_id)
+        por_estudiante: Dict[int, List[int]] = {}
+        for i, p in enumerate(payloads):
+            por_estudiante.setdefault(p["estudiante_id"], []).append(i)
 
-        vector_service = VectorService(self.db)
-        subtema_id, unidad_id = await vector_service.clasificar_consulta(
-            texto=texto, vector_store_id=vector_store_id, estudiante_id=estudiante_id
-        )
+        async def clasificar_estudiante(indices: List[int]):
+            ultimos: Optional[List[int]] = None
+            async with AsyncSessionLocal() as db_propia:
+                vector_service = VectorService(db_propia)
+                for i in indices:
+                    p = payloads[i]
+                    vector_store_id = vs_por_asistente[p["asistente_id"]]
+                    if vector_store_id is None:
+                        print(f"ERROR: No se encuentra el asistente con ID {p['asistente_id']}; no se registra la pregunta.")
+                        continue
+                    try:
+                        subtema_id, unidad_id = await vector_service.clasificar_consulta(
+                            texto=p["texto"], vector_store_id=vector_store_id,
+                            estudiante_id=p["estudiante_id"], ultimos_ids=ultimos
+                        )
+                    except ValueError as e:
+                        # Sin clasificación posible (ej. acción sin contexto): no se reintenta.
+                        print(f"[registrar_pregunta] No se registra la pregunta: {e}")
+                        continue
+                    except Exception as e:
+                        errores[i] = e
+                        continue
+                    ultimos = [subtema_id, unidad_id]
+                    filas[i] = {
+                        "contenido": p["texto"], "subtema_id": subtema_id, "unidad_id": unidad_id,
+                        "estudiante_id": p["estudiante_id"], "asistente_id": p["asistente_id"],
+                        "created_at": datetime.fromisoformat(p["created_at"]),
+                    }
 
-        print("PREGUNTA CLASIFICADA.")
+        with metricas.medir("preguntas.clasificacion_lote_s"):
+            await asyncio.gather(*[clasificar_estudiante(indices) for indices in por_estudiante.values()])
 
-        pregunta_data = {
-            "contenido": texto, "subtema_id": subtema_id, "unidad_id": unidad_id,
-            "estudiante_id": estudiante_id, "asistente_id": asistente_id
-        }
+        await self.pregunta_repo.insert_many([filas[i] for i in sorted(filas)])
 
-        print(f"Pregunta: {pregunta_data}")
+        # El lote lo confirma la cola de trabajos: el contexto se actualiza recién si el commit
+        # sale bien, para no servir clasificaciones que no quedaron grabadas.
+        @event.listens_for(self.db.sync_session, "after_commit", once=True)
+        def actualizar_contexto(_session):
+            for i in sorted(filas):
+                f = filas[i]
+                contexto_estudiantes.actualizar(f["estudiante_id"], f["subtema_id"], f["unidad_id"], f["created_at"])
 
-        pregunta = await self.create_pregunta(pregunta_data=pregunta_data)
-        return pregunta
\ No newline at end of file
+        return errores
@@ -1,74 +1,34 @@
 # services/responses_service.py
 import asyncio
-import json
 from typing import AsyncIterator
 from tenacity import retry, stop_after_attempt, wait_exponential_jitter, retry_if_exception_type
 from openai import APIConnectionError, APIError, RateLimitError
 from openai_client import client
-from repositories.asistente_repository import AsistenteRepository
+from services.prefetch_evaluacion import prefetch_evaluaciones
 from services.pregunta_service import PreguntaService
-from services.evaluacion_service import EvaluacionService
-from config.db_config import AsyncSessionLocal
+from services.tool_dispatcher import despachador_tools
+from services.run_engine import ESTADOS_TERMINALES
+from services.run_service import persistencia_runs
+from services.mensaje_service import sincronizador_mensajes
+from utils.admision import admision
 
 RETRYABLE = (APIConnectionError, APIError, RateLimitError)
 
 class ChatServiceStream:
-    def __init__(self, db, semaphore: asyncio.Semaphore) -> None:
+    def __init__(self, db) -> None:
         self.db = db
-        self.semaphore = semaphore
 
     async def _registrar_y_clasificar(self, texto: str, asistente_id: str, estudiante_id: int):
         """
-        Registra y clasifica la pregunta. Ahora crea y gestiona su PROPIA sesión de BD.
+        Encola la clasificación y el registro de la pregunta (job `registrar_pregunta`),
+        que la cola de trabajos procesa en lotes.
         """
-        async with AsyncSessionLocal() as db_propia: 
-            try:
-                as_repo = AsistenteRepository(db=db_propia) 
-                asistente_db = await as_repo.get_by_id(asistente_id=asistente_id)
-                
-                if not asistente_db:
-                    print(f"ERROR: No se encuentra el asistente con ID {asistente_id} en _registrar_y_clasificar")
-                    return
-
-                pregunta_service = PreguntaService(db=db_propia) 
-                resultado = await pregunta_service.insertar_y_clasificar_pregunta(
-                    texto=texto,
-                    vector_store_id=asistente_db.vs_temas_id,
-                    estudiante_id=estudiante_id,
-                    asistente_id=asistente_id,
-                )
-
-                await db_propia.commit() 
-                print("INFO: Pregunta registrada y clasificada exitosamente en background.")
-                return resultado
-
-            except Exception as e:
-                await db_propia.rollback() 
-                print(f"ERROR: Falló _registrar_y_clasificar en background: {e}")
-
-    async def _resolver_tool_calls(self, tool_calls, *, thread_id: str, estudiante_id: int, asistente_id: str) -> list[dict]:
-        outputs = []
-        ev_svc = EvaluacionService(self.db)
-        for call in tool_calls:
-            nombre = call.function.name
-            args = json.loads(call.function.arguments)
-            if nombre == "iniciar_evaluacion":
-                salida = await ev_svc.iniciar_evaluacion(
-                    data=args,
-                    estudiante_id=estudiante_id,
-                    asistente_id=asistente_id
-                )
-                outputs.append({"tool_call_id": call.id, "output": json.dumps(salida)})
-            elif nombre == "calificar_evaluacion":
-                evaluation_id = args.get("evaluation_id")
-                salida = await ev_svc.calificar_evaluacion(
-                    thread_id=thread_id,
-                    evaluation_id=evaluation_id,
-                )
-                outputs.append({"tool_call_id": call.id, "output": json.dumps(salida)})
-            else:
-                outputs.append({"tool_call_id": call.id, "output": json.dumps({"error": f"Función {nombre} no soportada"})})
-        return outputs
+        try:
+            await PreguntaService(db=self.db).encolar_registro(
+                texto=texto, asistente_id=asistente_id, estudiante_id=estudiante_id
+            )
+        except Exception as e:
+            print(f"ERROR: No se pudo encolar el registro de la pregunta: {e}")
 
     @retry(
         retry=retry_if_exception_type(RETRYABLE),
@@ -85,13 +45,15 @@ class ChatServiceStream:
         truncation_last_messages: int = 8,
     ) -> AsyncIterator[str]:
         print("Entrando a enviar_mensaje_stream")
-        async with self.semaphore:
+        async with admision.slot(asistente_id=asistente_id, estudiante_id=estudiante_id):
             await client.beta.threads.messages.create(
                 thread_id=thread_id,
                 role="user",
                 content=texto
             )
             print("Mensaje creado")
+            # Si el estudiante pide una evaluación, se prepara mientras corre el run.
+            prefetch_evaluaciones.especular(texto, asistente_id, estudiante_id)
             reg_task = asyncio.create_task(
                 self._registrar_y_clasificar(texto=texto, asistente_id=asistente_id, estudiante_id=estudiante_id)
             )
@@ -102,10 +64,30 @@ class ChatServiceStream:
                 truncation_strategy={"type": "auto"},
                 tool_choice={"type": "file_search"}
             ) as stream:
+                run_id = None
+                primer_token = False
                 async for event in stream:
                     event_type = getattr(event, "event", None)
                     print(event) 
 
+                    # Registro del run en la tabla `run` (estado, tiempos y uso de tokens)
+                    if event_type == "thread.run.created":
+                        run_id = event.data.id
+                        persistencia_runs.registrar(run_id, thread_id, asistente_id, estudiante_id, event.data.status)
+                    elif run_id and event_type and event_type.startswith("thread.run.") and not event_type.startswith("thread.run.step"):
+                        persistencia_runs.actualizar_status(
+                            run_id,
+                            event.data.status,
+                            event.data.last_error.message if event.data.last_error else None,
+                            event.data.usage,
+                            terminal=event.data.status in ESTADOS_TERMINALES,
+                        )
+                        if event.data.status in ESTADOS_TERMINALES:
+                            sincronizador_mensajes.programar(thread_id)
+                    elif run_id and event_type == "thread.message.delta" and not primer_token:
+                        primer_token = True
+                        persistencia_runs.marcar_primer_token(run_id)
+
                     if event_type == "thread.message.delta":
                         delta = event.data.delta
                         if delta and delta.content:
@@ -117,7 +99,7 @@ class ChatServiceStream:
 
                     elif event_type == "thread.run.requires_action":
                         tool_calls = event.data.required_action.submit_tool_outputs.tool_calls
-                        tool_outputs = await self._resolver_tool_calls(
+                        tool_outputs = await despachador_tools.resolver(
                             tool_calls,
                             thread_id=thread_id,
                             estudiante_id=estudiante_id,
@@ -0,0 +1,311 @@
+import asyncio
+import contextvars
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Set
+from openai_client import client
+from services.run_service import persistencia_runs
+from services.mensaje_service import sincronizador_mensajes
+from services.tool_dispatcher import despachador_tools
+
+ESTADOS_ACTIVOS = {"queued", "in_progress", "requires_action", "cancelling"}
+ESTADOS_TERMINALES = {"completed", "failed", "cancelled", "expired", "incomplete"}
+
+# Tiempo que un run terminado permanece en el registro para responder consultas de estado
+TTL_RUN_TERMINADO = 600
+# Intervalo de respaldo cuando no hay stream al que engancharse (ej. run retomado tras un reinicio)
+INTERVALO_RESPALDO = 2.0
+# Tiempo máximo que el canal de eventos de un run terminado espera notificaciones pendientes
+ESPERA_NOTIFICACIONES = 120
+
+
+@dataclass
+class EstadoRun:
+    run_id: str
+    thread_id: str
+    asistente_id: str
+    estudiante_id: int
+    status: str = "queued"
+    last_error: Optional[str] = None
+    primer_token: bool = False
+    actualizado_en: float = field(default_factory=time.monotonic)
+    terminado: asyncio.Event = field(default_factory=asyncio.Event)
+    # Notificaciones (ej. una calificación en curso) que mantienen abierto el canal de eventos
+    retenciones: int = 0
+    canal_cerrado: bool = False
+    suscriptores: List[asyncio.Queue] = field(default_factory=list)
+
+    def a_evento(self) -> dict:
+        evento = {"evento": "status", "run_id": self.run_id, "thread_id": self.thread_id, "status": self.status}
+        if self.last_error:
+            evento["last_error"] = self.last_error
+        return evento
+
+
+class RunEngine:
+    """
+    Conduce cada run a partir del feed de eventos de streaming de OpenAI en lugar de
+    hacer polling con `runs.retrieve`. Mantiene un registro en memoria con el estado
+    de cada run, que es lo que consultan los endpoints de estado, y lo escribe en la
+    tabla `run` (write-through) junto con los tiempos y el uso de tokens.
+    """
+
+    def __init__(self):
+        self._runs: Dict[str, EstadoRun] = {}
+        self._run_por_thread: Dict[str, str] = {}
+        self._tareas: Set[asyncio.Task] = set()
+
+    # ----- REGISTRO -----
+
+    def obtener_estado(self, run_id: str) -> Optional[EstadoRun]:
+        return self._runs.get(run_id)
+
+    def conoce_thread(self, thread_id: str) -> bool:
+        return thread_id in self._run_por_thread
+
+    def run_activo(self, thread_id: str) -> Optional[EstadoRun]:
+        estado = self._runs.get(self._run_por_thread.get(thread_id, ""))
+        if estado and estado.status in ESTADOS_ACTIVOS:
+            return estado
+        return None
+
+    def _registrar(self, run_id: str, thread_id: str, asistente_id: str, estudiante_id: int, status: str,
+                   last_error: Optional[str] = None) -> EstadoRun:
+        estado = self._runs.get(run_id)
+        if estado is None:
+            estado = EstadoRun(run_id=run_id, thread_id=thread_id,
+                               asistente_id=asistente_id, estudiante_id=estudiante_id, status=status)
+            self._runs[run_id] = estado
+            persistencia_runs.registrar(run_id, thread_id, asistente_id, estudiante_id, status)
+        self._run_por_thread[thread_id] = run_id
+        self._actualizar(estado, status, last_error)
+        return estado
+
+    def _actualizar(self, estado: EstadoRun, status: str, last_error: Optional[str] = None, usage=None):
+        if estado.terminado.is_set():
+            return
+        cambio = status != estado.status
+        terminal = status in ESTADOS_TERMINALES
+        estado.status = status
+        estado.actualizado_en = time.monotonic()
+        if last_error:
+            estado.last_error = last_error
+        if cambio or terminal:
+            persistencia_runs.actualizar_status(estado.run_id, status, last_error, usage, terminal=terminal)
+        if cambio:
+            self._publicar(estado, estado.a_evento())
+        if terminal:
+            # Se actualiza la copia local de los mensajes antes de avisar que el run terminó,
+            # así la lectura del historial que dispara el aviso espera a esta sincronización.
+            sincronizador_mensajes.programar(estado.thread_id)
+            estado.terminado.set()
+            loop = asyncio.get_running_loop()
+            if estado.retenciones:
+                loop.call_later(ESPERA_NOTIFICACIONES, self._cerrar_canal, estado)
+            else:
+                self._cerrar_canal(estado)
+            loop.call_later(TTL_RUN_TERMINADO, self._olvidar, estado.run_id)
+
+    def _olvidar(self, run_id: str):
+        estado = self._runs.pop(run_id, None)
+        if estado and self._run_por_thread.get(estado.thread_id) == run_id:
+            del self._run_por_thread[estado.thread_id]
+
+    def _lanzar(self, coro):
+        # Contexto limpio: la tarea vive más que la solicitud que la creó y no debe heredar
+        # su lugar en el control de admisión.
+        tarea = asyncio.create_task(coro, context=contextvars.Context())
+        self._tareas.add(tarea)
+        tarea.add_done_callback(self._tareas.discard)
+        return tarea
+
+    # ----- SUSCRIPCIONES -----
+
+    def _publicar(self, estado: EstadoRun, evento: Optional[dict]):
+        # `None` indica a los suscriptores que el run terminó y no habrá más eventos.
+        for cola in estado.suscriptores:
+            cola.put_nowait(evento)
+
+    def _cerrar_canal(self, estado: EstadoRun):
+        if not estado.canal_cerrado:
+            estado.canal_cerrado = True
+            self._publicar(estado, None)
+
+    def retener(self, run_id: str) -> bool:
+        """
+        Anuncia una notificación pendiente para el run: su canal de eventos sigue abierto
+        después de que termine, hasta que llegue la notificación o pasen
+        ESPERA_NOTIFICACIONES segundos. Devuelve False si el run no se conduce acá.
+        """
+        estado = self._runs.get(run_id)
+        if estado is None or estado.canal_cerrado:
+            return False
+        estado.retenciones += 1
+        return True
+
+    def notificar(self, run_id: str, evento: dict) -> bool:
+        """
+        Publica un evento en el canal del run y libera una notificación pendiente.
+        Devuelve False si el canal ya se cerró o el run no está en este proceso.
+        """
+        estado = self._runs.get(run_id)
+        if estado is None or estado.canal_cerrado:
+            return False
+        self._publicar(estado, evento)
+        if estado.retenciones:
+            estado.retenciones -= 1
+            if estado.retenciones == 0 and estado.terminado.is_set():
+                self._cerrar_canal(estado)
+        return True
+
+    async def suscribir(self, run_id: str) -> AsyncIterator[dict]:
+        """
+        Emite el estado actual del run y luego cada transición a medida que ocurre,
+        hasta que el run llega a un estado terminal (y se entregan sus notificaciones pendientes).
+        """
+        estado = self._runs.get(run_id)
+        if estado is None:
+            return
+        yield estado.a_evento()
+        if estado.canal_cerrado:
+            return
+
+        cola: asyncio.Queue = asyncio.Queue()
+        estado.suscriptores.append(cola)
+        try:
+            while (evento := await cola.get()) is not None:
+                yield evento
+        finally:
+            estado.suscriptores.remove(cola)
+
+    # ----- CICLO DE VIDA DEL RUN -----
+
+    async def iniciar_run(self, *, thread_id: str, asistente_id: str, estudiante_id: int, **parametros) -> str:
+        """
+        Crea el run en modo streaming, espera únicamente el evento `thread.run.created`
+        para conocer su ID y deja el resto del stream a cargo de una tarea en segundo plano.
+        """
+        stream = await client.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=asistente_id,
+            stream=True,
+            **parametros
+        )
+        eventos = stream.__aiter__()
+        try:
+            async for event in eventos:
+                if event.event == "thread.run.created":
+                    break
+            else:
+                raise RuntimeError("El stream terminó antes de crear el run.")
+        except BaseException:
+            await stream.close()
+            raise
+
+        estado = self._registrar(event.data.id, thread_id, asistente_id, estudiante_id, event.data.status)
+        self._lanzar(self._conducir(estado, stream, eventos))
+        return estado.run_id
+
+    async def procesar(self, thread_id: str, run_id: str, asistente_id: str, estudiante_id: int) -> EstadoRun:
+        """
+        Espera a que un run llegue a un estado terminal. Si el run no está siendo conducido
+        por este proceso (por ejemplo, después de un reinicio), lo retoma.
+        """
+        estado = self._runs.get(run_id)
+        if estado is None:
+            estado = await self._retomar(thread_id, run_id, asistente_id, estudiante_id)
+        await estado.terminado.wait()
+        return estado
+
+    async def esperar(self, run_id: str, timeout: Optional[float] = None) -> Optional[EstadoRun]:
+        estado = self._runs.get(run_id)
+        if estado is None:
+            return None
+        await asyncio.wait_for(estado.terminado.wait(), timeout=timeout)
+        return estado
+
+    async def cancelar(self, thread_id: str, run_id: str):
+        await client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+
+    async def _retomar(self, thread_id: str, run_id: str, asistente_id: str, estudiante_id: int) -> EstadoRun:
+        run = await client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        estado = self._registrar(run.id, thread_id, asistente_id, estudiante_id, run.status,
+                                 run.last_error.message if run.last_error else None)
+        if run.status not in ESTADOS_TERMINALES:
+            self._lanzar(self._conducir_sin_stream(estado, run))
+        return estado
+
+    async def _conducir(self, estado: EstadoRun, stream, eventos):
+        """
+        Consume los eventos del run. Cuando el run pide acción, resuelve las tool calls y
+        continúa con el stream que devuelve `submit_tool_outputs`.
+        """
+        try:
+            while stream is not None:
+                siguiente = None
+                try:
+                    async for event in eventos:
+                        tipo = event.event
+                        if tipo.startswith("thread.run.") and not tipo.startswith("thread.run.step"):
+                            last_error = event.data.last_error.message if event.data.last_error else None
+                            self._actualizar(estado, event.data.status, last_error, event.data.usage)
+
+                        if tipo == "thread.message.delta" and not estado.primer_token:
+                            estado.primer_token = True
+                            persistencia_runs.marcar_primer_token(estado.run_id)
+
+                        if tipo == "thread.run.requires_action":
+                            siguiente = await self._enviar_tool_outputs(estado, event.data, stream=True)
+                            break
+
+                        if tipo == "error":
+                            print(f"[run_engine] Error en el stream del run {estado.run_id}: {event.data}")
+                finally:
+                    await stream.close()
+
+                stream = siguiente
+                eventos = siguiente.__aiter__() if siguiente is not None else None
+
+            if not estado.terminado.is_set():
+                # El stream se cortó sin un evento terminal: se reconcilia con una consulta.
+                run = await client.beta.threads.runs.retrieve(thread_id=estado.thread_id, run_id=estado.run_id)
+                await self._conducir_sin_stream(estado, run)
+
+        except Exception as e:
+            print(f"[run_engine] Error irrecuperable conduciendo el run {estado.run_id}: {e}")
+            self._actualizar(estado, "failed", str(e))
+
+    async def _conducir_sin_stream(self, estado: EstadoRun, run):
+        """
+        Respaldo para runs sin stream asociado. Si el run pide acción se vuelve al modo
+        streaming; si no, se consulta con un intervalo amplio.
+        """
+        try:
+            while True:
+                self._actualizar(estado, run.status, run.last_error.message if run.last_error else None, run.usage)
+                if run.status in ESTADOS_TERMINALES:
+                    return
+                if run.status == "requires_action":
+                    stream = await self._enviar_tool_outputs(estado, run, stream=True)
+                    await self._conducir(estado, stream, stream.__aiter__())
+                    return
+                await asyncio.sleep(INTERVALO_RESPALDO)
+                run = await client.beta.threads.runs.retrieve(thread_id=estado.thread_id, run_id=estado.run_id)
+        except Exception as e:
+            print(f"[run_engine] Error irrecuperable retomando el run {estado.run_id}: {e}")
+            self._actualizar(estado, "failed", str(e))
+
+    async def _enviar_tool_outputs(self, estado: EstadoRun, run, stream: bool):
+        outputs = await despachador_tools.resolver(
+            run.required_action.submit_tool_outputs.tool_calls,
+            thread_id=estado.thread_id,
+            estudiante_id=estado.estudiante_id,
+            asistente_id=estado.asistente_id,
+            run_id=estado.run_id
+        )
+        return await client.beta.threads.runs.submit_tool_outputs(
+            thread_id=estado.thread_id, run_id=estado.run_id, tool_outputs=outputs, stream=stream
+        )
+
+
+run_engine = RunEngine()
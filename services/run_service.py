@@ -0,0 +1,89 @@
+import asyncio
+import contextvars
+from datetime import datetime, timezone
+from typing import Dict, Optional, Set
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.db_config import AsyncSessionLocal
+from models.run import Run
+from repositories.run_repository import RunRepository
+
+
+class RunService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.run_repo = RunRepository(db)
+
+    async def get_run_by_id(self, run_id: str) -> Run:
+        run = await self.run_repo.get_by_id(run_id)
+        if not run:
+            raise ValueError(f"Run con id {run_id} no encontrado")
+        return run
+
+    async def registrar_run(self, run_id: str, data: dict) -> None:
+        await self.run_repo.upsert(run_id, data)
+
+    async def actualizar_run(self, run_id: str, data: dict) -> None:
+        await self.run_repo.update_campos(run_id, data)
+
+
+class PersistenciaRuns:
+    """
+    Escribe el estado de los runs en la tabla `run` sin bloquear a quien lo produce
+    (el motor de runs o el stream de chat). Las escrituras de un mismo run se aplican
+    en orden; un error de escritura se registra pero no interrumpe el run.
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._tareas: Set[asyncio.Task] = set()
+
+    def registrar(self, run_id: str, thread_id: str, asistente_id: str, estudiante_id: int, status: str):
+        self._programar(run_id, {
+            "status": status,
+            "thread_id": thread_id,
+            "asistente_id": asistente_id,
+            "estudiante_id": estudiante_id,
+            "created_at": datetime.now(timezone.utc),
+        }, alta=True)
+
+    def marcar_primer_token(self, run_id: str):
+        self._programar(run_id, {"primer_token_at": datetime.now(timezone.utc)})
+
+    def actualizar_status(self, run_id: str, status: str, last_error: Optional[str] = None, usage=None,
+                          terminal: bool = False):
+        data = {"status": status}
+        if last_error:
+            data["last_error"] = last_error[:255]
+        if usage is not None:
+            data.update({
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "total_tokens": usage.total_tokens,
+            })
+        if terminal:
+            data["completed_at"] = datetime.now(timezone.utc)
+        self._programar(run_id, data, ultimo=terminal)
+
+    def _programar(self, run_id: str, data: dict, alta: bool = False, ultimo: bool = False):
+        lock = self._locks.setdefault(run_id, asyncio.Lock())
+        tarea = asyncio.create_task(self._escribir(run_id, data, lock, alta, ultimo), context=contextvars.Context())
+        self._tareas.add(tarea)
+        tarea.add_done_callback(self._tareas.discard)
+
+    async def _escribir(self, run_id: str, data: dict, lock: asyncio.Lock, alta: bool, ultimo: bool):
+        async with lock:
+            try:
+                async with AsyncSessionLocal() as db:
+                    run_svc = RunService(db)
+                    if alta:
+                        await run_svc.registrar_run(run_id, data)
+                    else:
+                        await run_svc.actualizar_run(run_id, data)
+            except Exception as e:
+                print(f"[persistencia_runs] No se pudo guardar el run {run_id}: {e}")
+            finally:
+                if ultimo:
+                    self._locks.pop(run_id, None)
+
+
+persistencia_runs = PersistenciaRuns()
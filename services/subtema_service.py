@@ -2,6 +2,7 @@ from repositories.tema_repository import TemaRepository
 from typing import Dict, Any, List
 from models.tema import Tema
 from sqlalchemy.ext.asyncio import AsyncSession
+from services.clasificador_lexico import clasificador_lexico
 
 
 class SubtemaService:
@@ -20,16 +21,21 @@ class SubtemaService:
 
     async def create_subtema(self, subtema_data: Dict[str, Any]) -> Tema:
         # Agregar validaciones aquí si es necesario
-        return await self.subtema_repo.create(subtema_data)
+        creado = await self.subtema_repo.create(subtema_data)
+        clasificador_lexico.invalidar()
+        return creado
 
     async def update_subtema(self, tema_id: int, update_data: Dict[str, Any]) -> Tema:
         subtema = await self.subtema_repo.get_by_id(tema_id)
         if not subtema:
             raise ValueError(f"No se puede actualizar, tema con id {tema_id} no encontrado")
-        return await self.subtema_repo.update(subtema, update_data)
+        actualizado = await self.subtema_repo.update(subtema, update_data)
+        clasificador_lexico.invalidar()
+        return actualizado
 
     async def delete_subtema(self, tema_id: int) -> None:
         subtema = await self.subtema_repo.get_by_id(tema_id)
         if not subtema:
             raise ValueError(f"No se puede eliminar, tema con id {tema_id} no encontrado")
-        await self.subtema_repo.delete(subtema)
\ No newline at end of file
+        await self.subtema_repo.delete(subtema)
+        clasificador_lexico.invalidar()
\ No newline at end of file
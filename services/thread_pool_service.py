@@ -0,0 +1,113 @@
+import asyncio
+import contextvars
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from dotenv import load_dotenv
+from openai_client import client
+from config.db_config import AsyncSessionLocal
+from repositories.thread_pool_repository import ThreadPoolRepository
+from utils.admision import admision
+from utils.metricas import metricas
+
+load_dotenv()
+
+# Cuando el pool baja de THREAD_POOL_MINIMO se completa hasta THREAD_POOL_OBJETIVO
+THREAD_POOL_MINIMO = int(os.getenv("THREAD_POOL_MINIMO", "5"))
+THREAD_POOL_OBJETIVO = int(os.getenv("THREAD_POOL_OBJETIVO", "20"))
+THREAD_POOL_INTERVALO = float(os.getenv("THREAD_POOL_INTERVALO", "60"))
+# Los threads que pasan demasiado tiempo sin usarse se descartan y se reemplazan
+THREAD_POOL_MAX_DIAS = int(os.getenv("THREAD_POOL_MAX_DIAS", "30"))
+# Threads que se crean en paralelo al rellenar
+THREAD_POOL_CONCURRENCIA = 4
+
+
+class PoolThreads:
+    """
+    Mantiene en la tabla `thread_pool` una reserva de threads de OpenAI ya creados, para
+    que dar de alta el thread de un estudiante nuevo no espere una llamada a la API.
+    Un proceso en segundo plano repone la reserva cuando baja del mínimo.
+    """
+
+    def __init__(self, minimo: int, objetivo: int, intervalo: float, max_dias: int):
+        self.minimo = minimo
+        self.objetivo = max(objetivo, minimo)
+        self.intervalo = intervalo
+        self.max_dias = max_dias
+        self._revisar = asyncio.Event()
+        self._tarea: Optional[asyncio.Task] = None
+
+    async def iniciar(self):
+        if self.objetivo <= 0:
+            return
+        self._tarea = asyncio.create_task(self._reponer_periodicamente(), context=contextvars.Context())
+
+    async def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+
+    def avisar_consumo(self):
+        """
+        Lo llama quien reclamó un thread, para que el pool se revise sin esperar el intervalo.
+        """
+        metricas.contador("thread_pool.reclamados").incrementar()
+        self._revisar.set()
+
+    async def _reponer_periodicamente(self):
+        while True:
+            try:
+                await self._reponer()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[thread_pool] No se pudo reponer el pool de threads: {e}")
+            self._revisar.clear()
+            try:
+                await asyncio.wait_for(self._revisar.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _reponer(self):
+        async with AsyncSessionLocal() as db:
+            pool_repo = ThreadPoolRepository(db)
+            vencidos = await pool_repo.descartar_anteriores(
+                datetime.now(timezone.utc) - timedelta(days=self.max_dias)
+            )
+            disponibles = await pool_repo.contar()
+        for thread_id in vencidos:
+            await self._eliminar_thread(thread_id)
+        if disponibles >= self.minimo:
+            return
+
+        faltantes = self.objetivo - disponibles
+        limite = asyncio.Semaphore(THREAD_POOL_CONCURRENCIA)
+
+        async def crear():
+            async with limite, admision.slot():
+                return (await client.beta.threads.create()).id
+
+        resultados = await asyncio.gather(*[crear() for _ in range(faltantes)], return_exceptions=True)
+        creados = [r for r in resultados if isinstance(r, str)]
+        if creados:
+            async with AsyncSessionLocal() as db:
+                await ThreadPoolRepository(db).agregar(creados)
+            metricas.contador("thread_pool.creados").incrementar(len(creados))
+        errores = [r for r in resultados if isinstance(r, BaseException)]
+        if errores:
+            print(f"[thread_pool] Fallaron {len(errores)} de {faltantes} altas de threads: {errores[0]}")
+
+    async def _eliminar_thread(self, thread_id: str):
+        try:
+            async with admision.slot():
+                await client.beta.threads.delete(thread_id)
+        except Exception as e:
+            print(f"[thread_pool] No se pudo eliminar el thread vencido {thread_id}: {e}")
+
+
+pool_threads = PoolThreads(
+    minimo=THREAD_POOL_MINIMO,
+    objetivo=THREAD_POOL_OBJETIVO,
+    intervalo=THREAD_POOL_INTERVALO,
+    max_dias=THREAD_POOL_MAX_DIAS,
+)
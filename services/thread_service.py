@@ -1,19 +1,24 @@
 import asyncio
-import base64
-import binascii
 import logging
-import json
-from typing import Dict, Any, List
+from typing import AsyncIterator, Dict, Any, List
 from openai import APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
 from openai_client import client
 from sqlalchemy.ext.asyncio import AsyncSession
 from tenacity import retry, stop_after_attempt, wait_exponential_jitter, retry_if_exception_type, before_sleep_log
 from models.thread import Thread
 from repositories.asistente_repository import AsistenteRepository
+from repositories.run_repository import RunRepository
 from repositories.thread_repository import ThreadRepository
+from repositories.thread_pool_repository import ThreadPoolRepository
 from schemas.mensaje_schema import MensajeOut
-from services.evaluacion_service import EvaluacionService
+from services.archivo_service import ArchivoService, url_archivo
+from services.thread_pool_service import pool_threads
+from services.mensaje_service import MensajeService, archivos_de, sincronizador_mensajes
+from services.prefetch_evaluacion import prefetch_evaluaciones
 from services.pregunta_service import PreguntaService
+from utils.admision import admision
+from utils.metricas import metricas
+from services.run_engine import run_engine, ESTADOS_TERMINALES, INTERVALO_RESPALDO
 from fastapi import HTTPException
 
 RETRYABLE = (APIConnectionError, APITimeoutError,
@@ -28,7 +33,8 @@ class ThreadService:
         self.db = db
         self.thread_repo = ThreadRepository(db)
         self.asistente_repo = AsistenteRepository(db)
-        self.semaphore = asyncio.Semaphore(6)
+        self.run_repo = RunRepository(db)
+        self.thread_pool_repo = ThreadPoolRepository(db)
 
     # ----- CRUD -----
 
@@ -49,10 +55,18 @@ class ThreadService:
         return await self.thread_repo.get_all()
 
     async def create_thread(self, thread_data: dict) -> Thread:
-        thread_api = await client.beta.threads.create()
+        # El thread sale del pool de threads ya creados; el alta en `thread` confirma la
+        # transacción que lo quita del pool. Solo si el pool está vacío se llama a la API.
+        thread_id = await self.thread_pool_repo.reclamar()
+        if thread_id:
+            pool_threads.avisar_consumo()
+        else:
+            metricas.contador("thread_pool.vacio").incrementar()
+            async with admision.slot(estudiante_id=thread_data["alumnoId"]):
+                thread_id = (await client.beta.threads.create()).id
 
         thread_db = await self.thread_repo.create({
-            "id": thread_api.id,
+            "id": thread_id,
             "estudiante_id": thread_data["alumnoId"],
         }, asistente_id=thread_data["asistente_id"])
         return thread_db
@@ -71,17 +85,6 @@ class ThreadService:
                 f"No se puede eliminar, thread con id {id} no encontrado")
         await self.thread_repo.delete(thread)
 
-    # ----- HELPERS -----
-
-    def _to_base64(self, data: bytes | str) -> str:
-        if isinstance(data, bytes):
-            return base64.b64encode(data).decode()
-        try:
-            base64.b64decode(data, validate=True)
-            return data.strip()
-        except binascii.Error:
-            return base64.b64encode(data.encode("latin1")).decode()
-
     # ----- FUNCIONES PRINCIPALES -----
 
     @retry(
@@ -94,112 +97,41 @@ class ThreadService:
         Orquesta el flujo de interacción con el asistente:
 
         1. Crea un mensaje con `client.beta.threads.message.create`.
-        2. Llama a `VectorService.insertar_y_clasificar_pregunta` para clasificar la pregunta y
-        grabarla en la DB.
-        3. Inicia la ejecución de un run con `client.beta.threads.runs.create` con los parámetros
-        necesarios y le pasa las instrucciones específicas de cada asistente como instrucciones
-        adicionales.
-        4. Hace polling hasta obtener un status diferente a `queued` o `in_progress`.
-        5. Si run.status es `requires_action` llama a `procesar_tool_calls`.
-        6. Una vez resuelto, retorna la run.
+        2. Inicia la ejecución de un run a través de `run_engine`, que lo conduce con el feed
+        de eventos de streaming y resuelve las tool calls cuando el run pasa a `requires_action`.
+        3. Encola la clasificación y el registro de la pregunta (job `registrar_pregunta`).
+        4. Espera a que el run llegue a un estado terminal y retorna su estado.
         """
 
-        async with self.semaphore:
+        run_id = await self.enviar_mensaje_y_crear_run(
+            id=id,
+            texto=texto,
+            asistente_id=asistente_id,
+            estudiante_id=estudiante_id,
+            truncation_strategy={
+                "type": "last_messages",
+                "last_messages": 8
+            }
+        )
 
-            as_repo = AsistenteRepository(db=self.db)
+        estado = await run_engine.esperar(run_id)
 
-            msg_task = asyncio.create_task(
-                client.beta.threads.messages.create(
-                    thread_id=id, role='user', content=texto)
+        if estado.status != "completed":
+            print(f"Run terminated with status: {estado.status}")
+            error_message = estado.last_error or "An unexpected error occurred."
+            raise HTTPException(
+                status_code=500,
+                detail=f"Assistant error: The request could not be completed. Details: {error_message}"
             )
 
-            asistente_task = asyncio.create_task(
-                as_repo.get_by_id(asistente_id=asistente_id))
-
-            async def registrar_y_clasificar():
-                asistente_db = await asistente_task
-                if not asistente_db:
-                    raise ValueError(
-                        f"No se encuentra el asistente con ID {asistente_id}")
-                pregunta_service = PreguntaService(db=self.db)
-                return await pregunta_service.insertar_y_clasificar_pregunta(
-                    texto=texto,
-                    vector_store_id=asistente_db.vs_temas_id,
-                    estudiante_id=estudiante_id,
-                    asistente_id=asistente_id
-                )
-
-            registro_task = asyncio.create_task(registrar_y_clasificar())
-
-            run = None
-
-            try:
-
-                await msg_task
-                await asistente_task
-
-                run = await client.beta.threads.runs.create(
-                    thread_id=id,
-                    assistant_id=asistente_id,
-                    truncation_strategy={
-                        "type": "last_messages",
-                        "last_messages": 8
-                    },
-                    tool_choice={"type": "file_search"}
-                )
-
-                delay = 0.2
-                while True:  # Use an indefinite loop
-                    await asyncio.sleep(0.5)  # Consistent polling interval
-                    run = await client.beta.threads.runs.retrieve(
-                        thread_id=id,
-                        run_id=run.id
-                    )
-
-                    # Success Condition
-                    if run.status == "completed":
-                        print("Run completed successfully.")
-                        break
-
-                    if run.status == "requires_action":
-                        print("Run requires action.")
-                        run = await self.procesar_tool_calls(
-                            run=run,
-                            thread_id=id,
-                            estudiante_id=estudiante_id,
-                            asistente_id=asistente_id
-                            )
-                    
-                    if run.status in ["failed", "cancelled", "expired"]:
-                        print(f"Run terminated with status: {run.status}")
-                        error_message = "An unexpected error occurred."
-                        if run.last_error:
-                            error_message = run.last_error.message
-                            print(f"OpenAI Error: {error_message}")
-                        
-                        raise HTTPException(
-                            status_code=500,
-                            detail=f"Assistant error: The request could not be completed. Details: {error_message}"
-                        )
-                    
-                    print(f"Run still in progress with status: {run.status}")
-
-                return run
-
-            except Exception as e:
-                if not (run and run.status in ("completed", "requires_action")):
-                    registro_task.cancel()
-                raise e
+        return estado
 
-    @retry(
-    retry=retry_if_exception_type(RETRYABLE),
-    stop=stop_after_attempt(3),
-    wait=wait_exponential_jitter(max=30),
-    )
-    async def enviar_mensaje_y_crear_run(self, id: str, texto: str, asistente_id: str, estudiante_id: int) -> str:
+    async def enviar_mensaje_y_crear_run(self, id: str, texto: str, asistente_id: str, estudiante_id: int,
+                                         truncation_strategy: dict | None = None) -> str:
         """
         Paso 1 del flujo asincrónico: Orquesta las tareas iniciales, crea el mensaje, 
         inicia el run y devuelve su ID inmediatamente para la respuesta del endpoint.
+        El resto del run lo conduce `run_engine` en segundo plano.
         """
 
         print("DATA QUE ESTÁ LLEGANDO:")
@@ -208,63 +140,53 @@ class ThreadService:
         print(asistente_id)
         print(estudiante_id)
 
-        async with self.semaphore:
-            # --- Lógica de inicialización movida aquí ---
-            as_repo = AsistenteRepository(db=self.db)
+        # Los reintentos son por paso: reintentar todo duplicaría el mensaje en el thread.
+        await self._crear_mensaje_con_retry(id, texto, asistente_id, estudiante_id)
+
+        # Si el estudiante pide una evaluación, se prepara mientras corre el run.
+        prefetch_evaluaciones.especular(texto, asistente_id, estudiante_id)
 
-            # Creamos las tareas en paralelo como hacías antes
-            msg_task = asyncio.create_task(
-                client.beta.threads.messages.create(thread_id=id, role='user', content=texto)
+        run_id = await self._iniciar_run_con_retry(id, asistente_id, estudiante_id,
+                                                   truncation_strategy or {"type": "auto"})
+
+        # La clasificación y el registro de la pregunta quedan en la cola de trabajos, que
+        # los procesa en lotes; acá solo se espera el alta del job. El run ya existe: si el
+        # alta falla no se propaga el error, para que el cliente no reenvíe el mensaje.
+        try:
+            await PreguntaService(db=self.db).encolar_registro(
+                texto=texto, asistente_id=asistente_id, estudiante_id=estudiante_id
             )
-            asistente_task = asyncio.create_task(
-                as_repo.get_by_id(asistente_id=asistente_id)
+        except Exception as e:
+            metricas.contador("preguntas.registro_fallido").incrementar()
+            print(f"ERROR: No se pudo encolar el registro de la pregunta del run {run_id}: {e}")
+        return run_id
+            
+    @retry(
+    retry=retry_if_exception_type(RETRYABLE),
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(max=30),
+    )
+    async def _crear_mensaje_con_retry(self, thread_id: str, texto: str, asistente_id: str, estudiante_id: int):
+        async with admision.slot(asistente_id=asistente_id, estudiante_id=estudiante_id):
+            await client.beta.threads.messages.create(thread_id=thread_id, role='user', content=texto)
+
+    @retry(
+    retry=retry_if_exception_type(RETRYABLE),
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(max=30),
+    )
+    async def _iniciar_run_con_retry(self, thread_id: str, asistente_id: str, estudiante_id: int,
+                                     truncation_strategy: dict) -> str:
+        # El motor sigue conduciendo el run con el stream de eventos
+        async with admision.slot(asistente_id=asistente_id, estudiante_id=estudiante_id):
+            return await run_engine.iniciar_run(
+                thread_id=thread_id,
+                asistente_id=asistente_id,
+                estudiante_id=estudiante_id,
+                truncation_strategy=truncation_strategy,
+                tool_choice={"type": "file_search"}
             )
 
-            async def registrar_y_clasificar():
-                asistente_db = await asistente_task
-                if not asistente_db:
-                    raise ValueError(f"No se encuentra el asistente con ID {asistente_id}")
-                pregunta_service = PreguntaService(db=self.db)
-                return await pregunta_service.insertar_y_clasificar_pregunta(
-                    texto=texto,
-                    vector_store_id=asistente_db.vs_temas_id,
-                    estudiante_id=estudiante_id,
-                    asistente_id=asistente_id
-                )
-
-            registro_task = asyncio.create_task(registrar_y_clasificar())
-
-            run = None
-            try:
-                # Esperamos a que las tareas críticas para iniciar el run terminen
-                await msg_task
-                await asistente_task
-
-                # Ahora creamos el run
-                run = await client.beta.threads.runs.create(
-                    thread_id=id,
-                    assistant_id=asistente_id,
-                    truncation_strategy={
-                        "type": "auto"
-                    },
-                    tool_choice={"type": "file_search"}
-                )
-
-                # Esperamos a que la tarea de registro también termine antes de devolver la respuesta.
-                # Esto asegura que la pregunta se guarda antes de que el frontend pueda hacer algo más.
-                await registro_task
-
-                return run.id
-
-            except Exception as e:
-                # Si algo falla aquí (ej: crear el run), cancelamos la tarea de registro
-                # para no dejar datos inconsistentes.
-                if not (run and run.status in ("completed", "requires_action")):
-                    registro_task.cancel()
-                
-                # Relanzamos la excepción para que el endpoint la maneje
-                raise e
-            
     @retry(
     retry=retry_if_exception_type(RETRYABLE),
     stop=stop_after_attempt(3),
@@ -276,136 +198,125 @@ class ThreadService:
         """
         return await client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
 
-    retry(
-        retry=retry_if_exception_type(RETRYABLE),
-        stop=stop_after_attempt(3),
-        wait=wait_exponential_jitter(max=30),
-        before_sleep=lambda retry_state: logger.warning(
-            f'Reintentando función: {retry_state.fn.__name__},'
-            f'intento {retry_state.attempt_number} debido a: {retry_state.outcome.exception()}'
-        )
-    )
-    async def procesar_tool_calls(self, run, thread_id: str, estudiante_id: int, asistente_id: str):
+    async def get_mensajes(self, thread_id: str, limit: int = 30, before: str | None = None,
+                           after: str | None = None) -> list[MensajeOut]:
         """
-        Gestiona las llamadas a funciones externas desde la API de OpenAI. Si detecta el estado
-        `requires_action` procede a llamar a la función indicada en `call.function.name`.
+        Obtiene los mensajes desde la copia local del thread (tabla `mensaje`), que se
+        sincroniza con OpenAI cada vez que termina un run. Si el thread todavía no tiene
+        copia local se sincroniza antes de leer. Las imágenes se devuelven como URL del
+        endpoint `/files/{file_id}`, que las sirve desde la caché en disco.
         """
-        async with self.semaphore:
-            while run.status == "requires_action":
-                outputs = []
-                ev_svc = EvaluacionService(self.db)
-
-                for call in run.required_action.submit_tool_outputs.tool_calls:
-                    nombre = call.function.name
-                    args = json.loads(call.function.arguments)
-
-                    if nombre == "iniciar_evaluacion":
-                        print("--- ENTRAMOS A INICIAR EVALUACIÓN ---")
-                        salida = await ev_svc.iniciar_evaluacion(
-                            data=args,
-                            estudiante_id=estudiante_id,
-                            asistente_id=asistente_id
-                        )
-                        print("--- SALIDA DE INICIAR_EVALUACION AL ASISTENTE: ---")
-                        print(salida)
-                        outputs.append(
-                            {"tool_call_id": call.id, "output": json.dumps(salida)})
-                    elif nombre == "calificar_evaluacion":
-                        print("--- ENTRAMOS A CALIFICAR EVALUACIÓN ---")
-                        evaluation_id = args.get("evaluation_id")
-                        print(f"EVALUACION ID: {evaluation_id}")
-                        salida = await ev_svc.calificar_evaluacion(
-                            thread_id=thread_id,
-                            evaluation_id=evaluation_id,
-                        )
-                        print("--- SALIDA DE CALIFICAR_EVALUACION AL ASISTENTE ---")
-                        outputs.append(
-                            {"tool_call_id": call.id, "output": json.dumps(salida)})
-                    else:
-                        outputs.append({"tool_call_id": call.id, "output": json.dumps(
-                            {"error": f"Función {nombre} no soportada"}
-                        )})
+        with metricas.medir("mensajes.historial_s"):
+            return await self._get_mensajes(thread_id, limit, before, after)
 
-                run = await client.beta.threads.runs.submit_tool_outputs_and_poll(
-                    thread_id=thread_id, run_id=run.id, tool_outputs=outputs
-                )
-            return run
+    async def _get_mensajes(self, thread_id: str, limit: int, before: str | None,
+                            after: str | None) -> list[MensajeOut]:
+        await sincronizador_mensajes.esperar(thread_id)
+        mensaje_svc = MensajeService(self.db)
+        if not before and not after and not await mensaje_svc.tiene_mensajes(thread_id):
+            await sincronizador_mensajes.sincronizar(self.db, thread_id)
 
-    async def get_mensajes(self, thread_id: str) -> list[MensajeOut]:
-        """
-        Obtiene los mensajes desde la API de OpenAI y los mapea a una lista,
-        chequeando si contiene mensajes o si se trata solo de texto.
-        Incluye una verificación para ignorar archivos corruptos, que pueden
-        aparecer si falla el llamado interno al intérprete de código del LLM.
-        """
-        resp = await client.beta.threads.messages.list(thread_id=thread_id, limit=30)
-        mensajes: list[MensajeOut] = []
+        # 1. Lectura de la copia local y relevamiento de las imágenes referenciadas
+        filas = await mensaje_svc.get_mensajes(thread_id, limit=limit, before=before, after=after)
+
+        # 2. Descarga concurrente a la caché de las que falten (normalmente ya están,
+        # porque la sincronización las precarga al terminar el run)
+        disponibles = await ArchivoService().precargar(archivos_de(filas))
 
-        for m in resp.data:
+        # 3. Armado de la respuesta en orden, con un aviso en lugar de las imágenes que fallaron
+        mensajes: list[MensajeOut] = []
+        for m in filas:
             partes = []
-            for c in m.content:
-                if c.type == "text":
-                    partes.append({"type": "text", "text": c.text.value})
-                
-                elif c.type == "image_file":
-                    if c.image_file.file_id:
-                        try:
-                            raw = await client.files.content(c.image_file.file_id)
-                            b64 = self._to_base64(raw.content)
-                            partes.append(
-                                {"type": "image", "data_url": f"data:image/png;base64,{b64}"}
-                            )
-                        except Exception as e:
-                            print(f"ERROR: No se pudo procesar el file_id {c.image_file.file_id}. Error: {e}")
-                            partes.append({"type": "text", "text": "[Error: No se pudo cargar una imagen]"})
+            for p in m.partes:
+                if p["type"] == "text":
+                    partes.append({"type": "text", "text": p["text"]})
+
+                elif p["type"] == "image_file":
+                    if disponibles[p["file_id"]]:
+                        partes.append({"type": "image", "file_id": p["file_id"], "url": url_archivo(p["file_id"])})
                     else:
-                        print(f"WARN: Se encontró una referencia de archivo corrupta (file_id vacío) en el mensaje {m.id}. Se ignorará.")
+                        partes.append({"type": "text", "text": "[Error: No se pudo cargar una imagen]"})
 
-            mensajes.append(MensajeOut(id=m.id, rol=m.role,
+            mensajes.append(MensajeOut(id=m.mensaje_id, rol=m.rol,
                                         partes=partes, fecha=m.created_at))
-            
-        return sorted(mensajes, key=lambda x: x.fecha)
-    
+
+        return mensajes
+
     async def procesar_run_en_background(self, id: str, run_id: str, asistente_id: str, estudiante_id: int):
         """
-        Esta función se ejecuta en segundo plano. Contiene el bucle de polling
-        y orquesta el proceso hasta que el run llega a un estado terminal.
+        Espera en segundo plano a que el run llegue a un estado terminal. El run lo conduce
+        `run_engine` con el stream de eventos; si este proceso no lo conoce (por ejemplo,
+        tras un reinicio) el motor lo retoma. Se ejecuta como job `procesar_run` de la cola
+        de trabajos, por lo que un error se relanza para que el job se reintente.
+        """
+        try:
+            estado = await run_engine.procesar(
+                thread_id=id,
+                run_id=run_id,
+                asistente_id=asistente_id,
+                estudiante_id=estudiante_id
+            )
+            if estado.status == "completed":
+                print("BACKGROUND: Run completed successfully.")
+            else:
+                print(f"BACKGROUND: Run terminated with status: {estado.status}")
+                if estado.last_error:
+                    print(f"BACKGROUND: OpenAI Error: {estado.last_error}")
+        except Exception as e:
+            print(f"BACKGROUND: Error irrecuperable procesando el run {run_id}: {e}")
+            raise
+
+    async def get_estado_run(self, thread_id: str, run_id: str) -> dict:
+        """
+        Devuelve el estado de un run desde el registro en memoria de `run_engine`, que hace
+        de caché write-through de la tabla `run`. Si el run no está en memoria se lee la
+        tabla y solo se consulta a OpenAI si el run tampoco fue registrado ahí.
+        """
+        estado = run_engine.obtener_estado(run_id)
+        if estado and estado.thread_id == thread_id:
+            return {"status": estado.status, "run_id": estado.run_id}
+        run_db = await self.run_repo.get_by_id(run_id)
+        if run_db and run_db.thread_id == thread_id:
+            return {"status": run_db.status, "run_id": run_db.run_id}
+        run = await self._retrieve_run_with_retry(thread_id=thread_id, run_id=run_id)
+        return {"status": run.status, "run_id": run.id}
+
+    async def eventos_run(self, thread_id: str, run_id: str) -> AsyncIterator[dict]:
+        """
+        Emite las transiciones de estado de un run a medida que ocurren, alimentadas por
+        `run_engine`. Si el run no está registrado en este proceso y la tabla `run` no lo
+        tiene terminado, se consulta a OpenAI con un intervalo amplio y solo se emiten
+        los cambios de estado.
         """
+        estado = run_engine.obtener_estado(run_id)
+        if estado and estado.thread_id == thread_id:
+            async for evento in run_engine.suscribir(run_id):
+                yield evento
+            return
+
+        run_db = await self.run_repo.get_by_id(run_id)
+        if run_db and run_db.thread_id == thread_id and run_db.status in ESTADOS_TERMINALES:
+            yield {"evento": "status", "run_id": run_id, "thread_id": thread_id, "status": run_db.status}
+            return
+
+        ultimo_status = None
         while True:
-            try:
-                run = await self._retrieve_run_with_retry(thread_id=id, run_id=run_id)
-
-                if run.status == "completed":
-                    print("BACKGROUND: Run completed successfully.")
-                    break
-
-                if run.status == "requires_action":
-                    print("BACKGROUND: Run requires action.")
-                    run = await self.procesar_tool_calls(
-                        run=run,
-                        thread_id=id,
-                        estudiante_id=estudiante_id,
-                        asistente_id=asistente_id
-                    )
-
-                if run.status in ["failed", "cancelled", "expired"]:
-                    print(f"BACKGROUND: Run terminated with status: {run.status}")
-                    error_message = "An unexpected error occurred."
-                    if run.last_error:
-                        error_message = run.last_error.message
-                        print(f"BACKGROUND: OpenAI Error: {error_message}")
-                    # Aquí podrías registrar el fallo en tu base de datos si lo necesitas.
-                    break
-                
-                # Si el estado sigue siendo 'queued' o 'in_progress', simplemente esperamos.
-                await asyncio.sleep(0.5)
-
-            except Exception as e:
-                # Si los reintentos de _retrieve_run_with_retry fallan, el error final se atrapa aquí.
-                print(f"BACKGROUND: Error irrecuperable en el polling del run {run_id}: {e}")
-                break
+            run = await self._retrieve_run_with_retry(thread_id=thread_id, run_id=run_id)
+            if run.status != ultimo_status:
+                ultimo_status = run.status
+                yield {"evento": "status", "run_id": run.id, "thread_id": thread_id, "status": run.status}
+            if run.status in ESTADOS_TERMINALES:
+                return
+            await asyncio.sleep(INTERVALO_RESPALDO)
 
     async def cancelar_runs_pendientes(self, thread_id: str):
+        # Si el motor conduce los runs de este thread, el registro alcanza para saber si hay uno activo.
+        if run_engine.conoce_thread(thread_id):
+            activo = run_engine.run_activo(thread_id)
+            if activo and activo.status != "cancelling":
+                await run_engine.cancelar(thread_id=thread_id, run_id=activo.run_id)
+            return
+
         runs_resp = await client.beta.threads.runs.list(thread_id=thread_id, limit=1)
         if not runs_resp.data:
             return
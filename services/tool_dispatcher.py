@@ -0,0 +1,90 @@
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.db_config import AsyncSessionLocal
+from utils.metricas import metricas
+
+load_dotenv()
+
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "60"))
+
+
+@dataclass
+class ContextoTool:
+    thread_id: str
+    estudiante_id: int
+    asistente_id: str
+    # Solo se conoce cuando el run lo conduce `run_engine`
+    run_id: Optional[str] = None
+
+
+Tool = Callable[[AsyncSession, dict, ContextoTool], Awaitable[Any]]
+
+
+class DespachadorTools:
+    """
+    Registro de las funciones que los asistentes pueden invocar. Resuelve todas las tool
+    calls de un `requires_action` en paralelo, cada una con su propia sesión de BD y su
+    tiempo límite, y devuelve los outputs en el orden de las llamadas.
+    """
+
+    def __init__(self, timeout_default: float):
+        self.timeout_default = timeout_default
+        self._tools: Dict[str, Tuple[Tool, float]] = {}
+
+    def tool(self, nombre: str, timeout: Optional[float] = None):
+        """
+        Decorador para registrar la función que atiende la tool `nombre`. Recibe la sesión
+        de BD, los argumentos de la llamada y el contexto del run.
+        """
+        def registrar(fn: Tool) -> Tool:
+            self._tools[nombre] = (fn, timeout or self.timeout_default)
+            return fn
+        return registrar
+
+    async def resolver(self, tool_calls, *, thread_id: str, estudiante_id: int, asistente_id: str,
+                       run_id: Optional[str] = None) -> list[dict]:
+        """
+        Ejecuta las tool calls y devuelve la lista de outputs lista para enviar con
+        `submit_tool_outputs`. Una llamada que falla o vence devuelve un error al asistente
+        sin afectar a las demás.
+        """
+        contexto = ContextoTool(thread_id=thread_id, estudiante_id=estudiante_id, asistente_id=asistente_id,
+                                run_id=run_id)
+        async with asyncio.TaskGroup() as tg:
+            tareas = [tg.create_task(self._ejecutar(call, contexto)) for call in tool_calls]
+        return [tarea.result() for tarea in tareas]
+
+    async def _ejecutar(self, call, contexto: ContextoTool) -> dict:
+        nombre = call.function.name
+        registro = self._tools.get(nombre)
+        if registro is None:
+            return {"tool_call_id": call.id, "output": json.dumps({"error": f"Función {nombre} no soportada"})}
+
+        fn, timeout = registro
+        inicio = time.perf_counter()
+        try:
+            args = json.loads(call.function.arguments or "{}")
+            async with asyncio.timeout(timeout):
+                async with AsyncSessionLocal() as db:
+                    salida = await fn(db, args, contexto)
+        except TimeoutError:
+            print(f"[tools] La función {nombre} superó el tiempo límite de {timeout} segundos")
+            metricas.contador(f"tools.{nombre}.timeouts").incrementar()
+            salida = {"error": f"La función {nombre} no respondió a tiempo"}
+        except Exception as e:
+            print(f"[tools] Error al ejecutar la función {nombre}: {e}")
+            metricas.contador(f"tools.{nombre}.errores").incrementar()
+            salida = {"error": f"Error al ejecutar la función {nombre}: {e}"}
+        finally:
+            metricas.histograma(f"tools.{nombre}.latencia_s").observar(time.perf_counter() - inicio)
+
+        return {"tool_call_id": call.id, "output": json.dumps(salida)}
+
+
+despachador_tools = DespachadorTools(timeout_default=TOOL_TIMEOUT)
@@ -0,0 +1,74 @@
+# Registro de las tools que pueden invocar los asistentes. Se importa desde main.py para
+# que estén disponibles tanto en el motor de runs como en el chat por streaming.
+from sqlalchemy.ext.asyncio import AsyncSession
+from services.evaluacion_service import EvaluacionService
+from services.job_queue_service import cola_trabajos
+from services.run_engine import run_engine
+from services.tool_dispatcher import despachador_tools, ContextoTool
+
+
+@despachador_tools.tool("iniciar_evaluacion", timeout=60)
+async def iniciar_evaluacion(db: AsyncSession, args: dict, ctx: ContextoTool):
+    print("--- ENTRAMOS A INICIAR EVALUACIÓN ---")
+    salida = await EvaluacionService(db).iniciar_evaluacion(
+        data=args,
+        estudiante_id=ctx.estudiante_id,
+        asistente_id=ctx.asistente_id
+    )
+    print("--- SALIDA DE INICIAR_EVALUACION AL ASISTENTE: ---")
+    print(salida)
+    return salida
+
+
+@despachador_tools.tool("calificar_evaluacion", timeout=120)
+async def calificar_evaluacion(db: AsyncSession, args: dict, ctx: ContextoTool):
+    """
+    La calificación corre como job `calificar_evaluacion`, así el run no queda esperando
+    la corrección. La nota se guarda en la evaluación y se empuja al estudiante por el
+    canal de eventos del run (`evaluacion_calificada`). Si el run no lo conduce
+    `run_engine` (ej. el chat por streaming) no hay canal para avisar: se califica acá y
+    la nota va en la salida de la tool.
+    """
+    print("--- ENTRAMOS A CALIFICAR EVALUACIÓN ---")
+    evaluation_id = args.get("evaluation_id")
+    print(f"EVALUACION ID: {evaluation_id}")
+    if evaluation_id is None:
+        return {"error": "Falta evaluation_id"}
+    evaluacion = await EvaluacionService(db).get_evaluacion_by_id(int(evaluation_id))
+    if not evaluacion.pendiente:
+        return {"status": "calificado", "nota": evaluacion.nota}
+
+    if not ctx.run_id or not run_engine.retener(ctx.run_id):
+        salida = await EvaluacionService(db).calificar_evaluacion(
+            thread_id=ctx.thread_id,
+            evaluation_id=evaluacion.evaluacion_id,
+        )
+        print("--- SALIDA DE CALIFICAR_EVALUACION AL ASISTENTE ---")
+        return salida
+
+    payload = {
+        "thread_id": ctx.thread_id,
+        "evaluation_id": evaluacion.evaluacion_id,
+        "run_id": ctx.run_id,
+    }
+    try:
+        await cola_trabajos.encolar("calificar_evaluacion", payload, ejecutar_local=True)
+    except Exception as e:
+        # Sin job nadie libera la retención del run: se califica acá y se avisa igual por el canal.
+        print(f"[calificar_evaluacion] No se pudo encolar la calificación, se califica en línea: {e}")
+        salida = {"status": "error", "error": "No se pudo calificar la evaluación. Intentá de nuevo más tarde."}
+        try:
+            salida = await EvaluacionService(db).calificar_evaluacion(
+                thread_id=ctx.thread_id,
+                evaluation_id=evaluacion.evaluacion_id,
+            )
+            print("--- SALIDA DE CALIFICAR_EVALUACION AL ASISTENTE ---")
+            return salida
+        finally:
+            run_engine.notificar(ctx.run_id, {"evento": "evaluacion_calificada", **payload, **salida})
+    print("--- SALIDA DE CALIFICAR_EVALUACION AL ASISTENTE ---")
+    return {
+        "status": "calificando",
+        "evaluation_id": evaluacion.evaluacion_id,
+        "mensaje": "La evaluación se está corrigiendo; el estudiante verá su nota en unos segundos."
+    }
@@ -2,6 +2,7 @@ from repositories.unidad_repository import UnidadRepository
 from typing import Dict, Any, List
 from models.unidad import Unidad
 from sqlalchemy.ext.asyncio import AsyncSession
+from services.clasificador_lexico import clasificador_lexico
 
 class UnidadService:
     def __init__(self, db: AsyncSession):
@@ -19,16 +20,21 @@ class UnidadService:
 
     async def create_unidad(self, unidad_data: Dict[str, Any]) -> Unidad:
         # Agregar validaciones aquí si es necesario
-        return await self.unidad_repo.create(unidad_data)
+        creado = await self.unidad_repo.create(unidad_data)
+        clasificador_lexico.invalidar()
+        return creado
 
     async def update_unidad(self, unidad_id: int, update_data: Dict[str, Any]) -> Unidad:
         unidad = await self.unidad_repo.get_by_id(unidad_id)
         if not unidad:
             raise ValueError(f"No se puede actualizar, unidad con id {unidad_id} no encontrada")
-        return await self.unidad_repo.update(unidad, update_data)
+        actualizado = await self.unidad_repo.update(unidad, update_data)
+        clasificador_lexico.invalidar()
+        return actualizado
 
     async def delete_unidad(self, unidad_id: int) -> None:
         unidad = await self.unidad_repo.get_by_id(unidad_id)
         if not unidad:
             raise ValueError(f"No se puede eliminar, unidad con id {unidad_id} no encontrada")
-        await self.unidad_repo.delete(unidad)
\ No newline at end of file
+        await self.unidad_repo.delete(unidad)
+        clasificador_lexico.invalidar()
\ No newline at end of file
@@ -0,0 +1,143 @@
+import asyncio
+import os
+import time
+from typing import Dict, Optional
+from dotenv import load_dotenv
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+from openai_client import client
+from utils.admision import admision
+from utils.metricas import metricas
+
+load_dotenv()
+
+VS_TIMEOUT_INTENTO = float(os.getenv("VS_TIMEOUT_INTENTO", "3"))
+VS_DEADLINE = float(os.getenv("VS_DEADLINE", "5"))
+VS_INTENTOS = int(os.getenv("VS_INTENTOS", "3"))
+VS_UMBRAL_FALLOS = int(os.getenv("VS_UMBRAL_FALLOS", "5"))
+VS_TIEMPO_APERTURA = float(os.getenv("VS_TIEMPO_APERTURA", "30"))
+
+RETRYABLE = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+
+
+class CircuitoAbierto(Exception):
+    """
+    Se lanza sin llamar a OpenAI mientras un vector store acumula fallos recientes.
+    """
+
+
+class Circuito:
+    """
+    Circuit breaker de un vector store. Tras `umbral_fallos` fallos seguidos se abre y
+    rechaza las llamadas durante `tiempo_apertura` segundos; después deja pasar una
+    llamada de prueba, que lo cierra si sale bien o lo vuelve a abrir si falla.
+    """
+
+    def __init__(self, umbral_fallos: int, tiempo_apertura: float):
+        self.umbral_fallos = umbral_fallos
+        self.tiempo_apertura = tiempo_apertura
+        self.fallos = 0
+        self.abierto_hasta = 0.0
+        self._probando = False
+
+    @property
+    def estado(self) -> str:
+        if self.fallos < self.umbral_fallos:
+            return "cerrado"
+        return "abierto" if time.monotonic() < self.abierto_hasta else "semiabierto"
+
+    def permitir(self) -> bool:
+        estado = self.estado
+        if estado == "cerrado":
+            return True
+        if estado == "semiabierto" and not self._probando:
+            self._probando = True
+            return True
+        return False
+
+    def registrar_exito(self):
+        self.fallos = 0
+        self._probando = False
+
+    def registrar_fallo(self):
+        self.fallos += 1
+        self._probando = False
+        if self.fallos >= self.umbral_fallos:
+            self.abierto_hasta = time.monotonic() + self.tiempo_apertura
+
+    def liberar_prueba(self):
+        self._probando = False
+
+
+class VectorStoreGateway:
+    """
+    Acceso a `vector_stores.search` sobre el cliente async compartido, con un tiempo
+    límite total por llamada, reintentos con jitter dentro de ese límite y un circuit
+    breaker por vector store.
+    """
+
+    def __init__(self, timeout_intento: float, deadline: float, intentos: int,
+                 umbral_fallos: int, tiempo_apertura: float):
+        self.timeout_intento = timeout_intento
+        self.deadline = deadline
+        self.intentos = intentos
+        self.umbral_fallos = umbral_fallos
+        self.tiempo_apertura = tiempo_apertura
+        self._circuitos: Dict[str, Circuito] = {}
+        # Los reintentos los maneja el gateway, no el SDK
+        self._client = client.with_options(max_retries=0, timeout=timeout_intento)
+
+    def _circuito(self, vector_store_id: str) -> Circuito:
+        return self._circuitos.setdefault(vector_store_id, Circuito(self.umbral_fallos, self.tiempo_apertura))
+
+    async def search(self, *, vector_store_id: str, query: str, max_num_results: int,
+                     filters: Optional[dict] = None, deadline: Optional[float] = None):
+        circuito = self._circuito(vector_store_id)
+        if not circuito.permitir():
+            metricas.contador("vector_store.circuito_abierto").incrementar()
+            raise CircuitoAbierto(f"Vector store {vector_store_id} no disponible temporalmente")
+
+        params = {"vector_store_id": vector_store_id, "query": query, "max_num_results": max_num_results}
+        if filters is not None:
+            params["filters"] = filters
+
+        inicio = time.perf_counter()
+        try:
+            async with asyncio.timeout(deadline or self.deadline):
+                async for intento in AsyncRetrying(
+                    retry=retry_if_exception_type(RETRYABLE),
+                    stop=stop_after_attempt(self.intentos),
+                    wait=wait_exponential_jitter(initial=0.2, max=2, jitter=0.2),
+                    reraise=True,
+                ):
+                    with intento:
+                        if intento.retry_state.attempt_number > 1:
+                            metricas.contador("vector_store.reintentos").incrementar()
+                        async with admision.slot():
+                            resp = await self._client.vector_stores.search(**params)
+        except Exception as e:
+            # Solo las fallas del vector store abren el circuito; un 4xx o un rechazo del
+            # control de admisión no dicen nada de su disponibilidad.
+            if isinstance(e, (*RETRYABLE, TimeoutError)):
+                circuito.registrar_fallo()
+            metricas.contador("vector_store.errores").incrementar()
+            raise
+        finally:
+            # Si la llamada de prueba se canceló o falló por otra causa, otra puede probar.
+            circuito.liberar_prueba()
+            metricas.histograma("vector_store.search_s").observar(time.perf_counter() - inicio)
+
+        circuito.registrar_exito()
+        return resp
+
+    def estado(self) -> dict:
+        return {vs_id: c.estado for vs_id, c in self._circuitos.items()}
+
+
+vector_store_gateway = VectorStoreGateway(
+    timeout_intento=VS_TIMEOUT_INTENTO,
+    deadline=VS_DEADLINE,
+    intentos=VS_INTENTOS,
+    umbral_fallos=VS_UMBRAL_FALLOS,
+    tiempo_apertura=VS_TIEMPO_APERTURA,
+)
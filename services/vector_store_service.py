@@ -1,14 +1,26 @@
-import asyncio
+import os
 import re
 from typing import List, Dict, Optional, Set
 
-from openai import OpenAI
-from openai_client import client
+from dotenv import load_dotenv
 from sqlalchemy.ext.asyncio import AsyncSession
-
-sync_client = OpenAI()
-
+from services.banco_preguntas import banco_preguntas
+from services.pool_preguntas_service import pool_preguntas
+from services.cache_clasificacion import cache_clasificacion
+from services.clasificador_lexico import clasificador_lexico
+from services.clasificador_local import clasificador_local
+from services.contexto_estudiante import contexto_estudiantes
+from services.indice_hibrido import id_entero, indices_hibridos
+from services.vector_store_gateway import vector_store_gateway
+from utils.metricas import metricas
+
+load_dotenv()
+
+# Umbral sobre el score de `vector_stores.search`
 SCORE_MIN = 0.35
+# Umbral sobre la similitud coseno del clasificador local, que no es comparable con el
+# anterior. Calibrarlo con `python -m utils.benchmarks.clasificacion --calibrar-umbral`.
+SCORE_MIN_LOCAL = float(os.getenv("SCORE_MIN_LOCAL", "0.30"))
 SCORE_GAP = 0.01
 MAX_RESULTS = 3
 
@@ -34,6 +46,7 @@ class VectorService:
     def __init__(self, db: AsyncSession):
         self.db = db
         self.SCORE_MIN = SCORE_MIN
+        self.SCORE_MIN_LOCAL = SCORE_MIN_LOCAL
         self.SCORE_GAP = SCORE_GAP
         self.MAX_RESULTS = MAX_RESULTS
         self.GENERIC_FOLLOWUP_TOKENS = GENERIC_FOLLOWUP_TOKENS
@@ -75,19 +88,27 @@ class VectorService:
         
         return False
 
-    async def clasificar_consulta(self, texto: str, vector_store_id: str, estudiante_id: int) -> List[int]:
-        from services.pregunta_service import PreguntaService
+    async def clasificar_consulta(self, texto: str, vector_store_id: str, estudiante_id: int,
+                                  ultimos_ids: Optional[List[int]] = None) -> List[int]:
+        """
+        Devuelve [subtema_id, unidad_id] de la consulta. `ultimos_ids` permite indicar el
+        contexto del estudiante cuando su pregunta anterior todavía no está grabada (por
+        ejemplo, si ambas se registran en el mismo lote); si no, se lee de la DB.
+        """
+        # El contexto se lee recién cuando hace falta un fallback, sobre la misma sesión: una
+        # tarea lanzada de antemano podía seguir usando `self.db` después de retornar.
+        contexto: List[Optional[List[int]]] = []
 
         async def get_last_ids() -> Optional[List[int]]:
-            ps = PreguntaService(self.db)
-            ultima = await ps.get_ultima_pregunta_by_estudiante(estudiante_id=estudiante_id)
-            return None if ultima is None else [ultima.subtema_id, ultima.unidad_id]
-
-        last_ids_task = asyncio.create_task(get_last_ids())
+            if ultimos_ids is not None:
+                return ultimos_ids
+            if not contexto:
+                contexto.append(await contexto_estudiantes.obtener(self.db, estudiante_id))
+            return contexto[0]
 
         # Esta función entrega los ID de tema y unidad de la última pregunta existente en la DB
         async def try_fallback_if_any(reason: str) -> Optional[List[int]]:
-            ids = await last_ids_task
+            ids = await get_last_ids()
             if ids is not None:
                 print(f"[clasificar_consulta] Fallback por {reason}.")
             return ids
@@ -102,6 +123,11 @@ class VectorService:
             if (fb := await try_fallback_if_any("follow-up genérico")) is not None:
                 return fb
         
+        # CLASIFICACIÓN LÉXICA: la consulta nombra literalmente un único subtema (sin red)
+        if (lexico := await clasificador_lexico.clasificar(texto, vector_store_id)) is not None:
+            metricas.contador("clasificacion.lexica").incrementar()
+            return list(lexico)
+
         # FILTRO 3 (NUEVO): Pregunta de acción contextual
         if self.es_pregunta_de_accion(texto):
             if (fb := await try_fallback_if_any("pregunta de acción")) is not None:
@@ -109,24 +135,41 @@ class VectorService:
             # Si no hay contexto previo, una acción no tiene sentido.
             raise ValueError("Se solicitó una acción (ej. ejercicio) sin un tema de contexto previo.")
             
-        # --- BÚSQUEDA VECTORIAL (Si pasa todos los filtros) ---
-        vector_task = asyncio.create_task(asyncio.to_thread(
-            sync_client.vector_stores.search,
-            vector_store_id=vector_store_id, query=texto, max_num_results=self.MAX_RESULTS
-        ))
+        # --- CACHÉ DE CLASIFICACIONES (misma consulta, mismo vector store) ---
+        if (cacheado := cache_clasificacion.obtener(vector_store_id, texto)) is not None:
+            return cacheado
+
+        # --- CLASIFICACIÓN LOCAL (snapshot de embeddings de los subtemas) ---
+        local = await clasificador_local.clasificar(texto, vector_store_id)
+        if local is not None:
+            subtopic_int, unit_int, score = local
+            if score >= self.SCORE_MIN_LOCAL:
+                metricas.contador("clasificacion.local").incrementar()
+                cache_clasificacion.guardar(vector_store_id, texto, [subtopic_int, unit_int])
+                return [subtopic_int, unit_int]
+            print(f"[clasificar_consulta] Score local bajo ({score:.3f}).")
+            metricas.contador("clasificacion.local_score_bajo").incrementar()
+            if (fb := await try_fallback_if_any("score bajo")) is not None:
+                return fb
+            # Sin contexto previo: se prueba con la búsqueda remota antes que devolver un resultado dudoso.
 
+        # --- BÚSQUEDA VECTORIAL REMOTA (si no hay índice local o su resultado es dudoso) ---
+        metricas.contador("clasificacion.remota").incrementar()
         try:
-            resp = await asyncio.wait_for(vector_task, timeout=5)
+            resp = await vector_store_gateway.search(
+                vector_store_id=vector_store_id, query=texto, max_num_results=self.MAX_RESULTS
+            )
             hits = resp.data or []
         except Exception as e:
-            print(f"[clasificar_consulta] Error/timeout en vector store: {e}")
-            if (fb := await last_ids_task) is not None:
+            # Incluye `CircuitoAbierto`: mientras el vector store falla se usa directamente el fallback.
+            print(f"[clasificar_consulta] Error/timeout en vector store: {e!r}")
+            if (fb := await get_last_ids()) is not None:
                 return fb
             raise
 
         if not hits:
             print("[clasificar_consulta] Sin resultados del vector store.")
-            if (fb := await last_ids_task) is not None:
+            if (fb := await get_last_ids()) is not None:
                 return fb
             raise ValueError("No hay resultados y no existe última pregunta para fallback.")
 
@@ -140,101 +183,94 @@ class VectorService:
             # Si los IDs son 0 o inválidos, lo consideramos un mal resultado.
             if subtopic_int == 0 or unit_int == 0:
                 print(f"[clasificar_consulta] IDs inválidos en los atributos.")
-                if (fb := await last_ids_task) is not None:
+                if (fb := await get_last_ids()) is not None:
                     return fb
                 # Si no hay fallback, es un error porque los IDs son incorrectos.
                 raise ValueError("Resultado con IDs inválidos y sin fallback.")
         except Exception as e:
             print(f"[clasificar_consulta] Atributos faltantes/mal tipeados ({e}).")
-            if (fb := await last_ids_task) is not None:
+            if (fb := await get_last_ids()) is not None:
                 return fb
             raise
 
+        cache_clasificacion.guardar(vector_store_id, texto, [subtopic_int, unit_int])
         return [subtopic_int, unit_int]
 
-    async def obtener_preguntas(self, subtema: str, subtema_id: int, n: int, vector_store_id: str) -> List[Dict]:
-        filters = {"key": "subtopic_id", "type": "eq", "value": str(subtema_id)}
-
-        rsp = await asyncio.to_thread(
-            sync_client.vector_stores.search,
-            vector_store_id=vector_store_id,
-            query=f"{subtema}",
-            max_num_results=n,
-            filters=filters
-        )
-        docs = rsp.data
-        preguntas = [{"id": d.attributes.get("question_id"), "text": d.content[0].text if d.content else ""} for d in docs]
-        
-        faltantes = n - len(preguntas)
-        if faltantes > 0 or len(preguntas) == 0:
-            ejemplos = [p["text"] for p in preguntas] if preguntas else []
-            prompt = self._construir_prompt_generacion(subtema, subtema_id, faltantes, ejemplos)
-
-            respuesta = await client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "system", "content": "Sos un generador de preguntas de nivel universitario. "
-                            "No incluyas respuestas ni explicaciones. "
-                            "Separá cada pregunta con dos líneas en blanco."}, {"role": "user", "content": prompt}],
-                temperature=0.7
-            )
-            raw_content = respuesta.choices[0].message.content
-            texto = "\n".join(p["text"] for p in raw_content if "text" in p) if isinstance(raw_content, list) else raw_content
-            nuevas_preguntas_textos = self._extraer_preguntas_generadas(texto)
-            preguntas.extend([{"id": f"gen-{i}", "text": pregunta_generada} for i, pregunta_generada in enumerate(nuevas_preguntas_textos, start=1)])
+    async def buscar_contenidos(self, texto: str, vector_store_id: str, n: int = MAX_RESULTS,
+                                subtopic_id: Optional[int] = None) -> List[Dict]:
+        """
+        Busca en los contenidos del vector store con el índice híbrido local (BM25 + vectores).
+        Si el vector store no tiene snapshot local, o el snapshot no devuelve nada (p. ej.
+        porque es anterior a la última carga), usa `vector_stores.search`. Con `subtopic_id`
+        solo devuelve documentos de ese subtema.
+
+        El `score` depende del camino: en el índice local es el valor de la fusión RRF (suma
+        de 1 / (RRF_K + posición), del orden de 0.01-0.03), que solo sirve para ordenar; en
+        el remoto es el score de similitud de OpenAI. No se deben comparar ni usar con el
+        mismo umbral.
+        """
+        try:
+            resultados = await indices_hibridos.buscar(texto, vector_store_id, n, subtopic_id)
+        except Exception as e:
+            print(f"[buscar_contenidos] Error en el índice híbrido de {vector_store_id}: {e!r}")
+            resultados = None
+        if resultados:
+            metricas.contador("busqueda_contenidos.local").incrementar()
+            return resultados
+
+        metricas.contador("busqueda_contenidos.remota").incrementar()
+        params = {}
+        if subtopic_id is not None:
+            params["filters"] = {"key": "subtopic_id", "type": "eq", "value": str(subtopic_id)}
+        rsp = await vector_store_gateway.search(vector_store_id=vector_store_id, query=texto,
+                                                max_num_results=n, **params)
+        return [
+            {
+                "subtopic_id": id_entero((d.attributes or {}).get("subtopic_id")),
+                "unit_id": id_entero((d.attributes or {}).get("unit_id")),
+                "text": d.content[0].text if d.content else "",
+                "score": d.score,
+                "metadata": d.attributes or {},
+            }
+            for d in rsp.data
+        ]
+
+    async def obtener_preguntas(self, subtema: str, subtema_id: int, n: int, vector_store_id: str,
+                                estudiante_id: Optional[int] = None, especulativo: bool = False) -> List[Dict]:
+        """
+        Arma las preguntas de una evaluación sin esperar a la generación:
+        1. Preguntas del banco local que el estudiante todavía no recibió (si el subtema no
+           está en el banco, se buscan en el vector store de evaluaciones).
+        2. Si no alcanzan, preguntas ya generadas del pool del subtema.
+        3. Si aún faltan, preguntas del banco que el estudiante ya recibió.
+        Solo si no se consiguió ninguna se generan en el momento.
+        Con `especulativo` solo se hace el paso 1, sin marcar las preguntas como servidas: los
+        pasos siguientes consumen el pool o generan preguntas.
+        """
+        preguntas = await banco_preguntas.muestrear(subtema_id, n, estudiante_id, repetir=False,
+                                                    marcar=not especulativo)
+        if preguntas:
+            metricas.contador("obtener_preguntas.banco_local").incrementar()
+        elif await banco_preguntas.cantidad(subtema_id) == 0:
+            metricas.contador("obtener_preguntas.vector_store").incrementar()
+            docs = await self.buscar_contenidos(subtema, vector_store_id, n, subtopic_id=subtema_id)
+            preguntas = [{"id": d["metadata"].get("question_id"), "text": d["text"]} for d in docs]
+
+        if especulativo:
+            return preguntas[:n]
+        if len(preguntas) < n:
+            preguntas += await pool_preguntas.tomar(self.db, subtema_id, n - len(preguntas))
+        if len(preguntas) < n:
+            preguntas += await banco_preguntas.muestrear(subtema_id, n - len(preguntas), estudiante_id,
+                                                         excluir=frozenset(p["id"] for p in preguntas))
+
+        if not preguntas:
+            # Subtema sin banco ni pool todavía: la reposición ya quedó encolada.
+            metricas.contador("obtener_preguntas.generacion_en_linea").incrementar()
+            textos = await pool_preguntas.generar(subtema, subtema_id, n, [])
+            preguntas = [{"id": f"gen-{i}", "text": t} for i, t in enumerate(textos, start=1)]
 
         print("--- PREGUNTAS OBTENIDAS --- ")
         print(preguntas)
         
         return preguntas[:n]
-
-    def _construir_prompt_generacion(self, subtema: str, subtema_id: int, cantidad: int, ejemplos: List[str]) -> str:
-        prompt = (
-            f"Genera {cantidad} preguntas tipo examen para el subtema \"{subtema}\" (ID {subtema_id}), "
-            "relacionadas con el tema indicado. "
-            "Las expresiones matemáticas (si las hay) deberán estar obligatoriamente "
-            "escritas en formato LaTeX, usando el entorno:\n\n"
-            "\\[\n\\begin{align*}\n...\n\\end{align*}\n\\]\n\n"
-            "No incluyas respuestas ni explicaciones. No uses numeración. "
-            "Separá cada pregunta con dos líneas en blanco.\n\n"
-        )
-
-        if ejemplos:
-            prompt += "Aquí algunos ejemplos del estilo esperado:\n\n" + "\n\n".join(ejemplos)
-
-        return prompt
-
-    def _extraer_preguntas_generadas(self, texto: str) -> List[str]:
-        preguntas = []
-        buffer = ""
-        dentro_de_pregunta = False
-
-        for linea in texto.splitlines():
-            linea = linea.strip()
-
-            if not linea:
-                continue
-
-            if not dentro_de_pregunta and not linea.startswith("\\["):
-                if buffer:
-                    preguntas.append(buffer.strip())
-                    buffer = ""
-                buffer = linea
-                dentro_de_pregunta = True
-
-            elif linea.startswith("\\["):
-                buffer += "\n" + linea
-                dentro_de_pregunta = True
-
-            elif linea.startswith("\\]"):
-                buffer += "\n" + linea
-                preguntas.append(buffer.strip())
-                buffer = ""
-                dentro_de_pregunta = False
-
-            else:
-                buffer += "\n" + linea
-
-        if buffer:
-            preguntas.append(buffer.strip())
-
-        return preguntas
\ No newline at end of file
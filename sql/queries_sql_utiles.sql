@@ -244,4 +244,36 @@ INSERT INTO tema (tema_id, nombre, unidad_id) VALUES
 
 -- INSERT asistente de Matemática - Ingreso
 INSERT INTO asistente(asistente_id, nombre, instructions, materia_id)
-VALUES ('asst_3KJfRBTDM0hNa6IQAgc9t818', 'Tutor Virtual de Matemática - Ingreso', '', 2);
\ No newline at end of file
+VALUES ('asst_3KJfRBTDM0hNa6IQAgc9t818', 'Tutor Virtual de Matemática - Ingreso', '', 2);
+
+-- Columnas agregadas a la tabla run (create_all no altera tablas existentes)
+ALTER TABLE run ADD COLUMN IF NOT EXISTS thread_id VARCHAR(100) REFERENCES thread(id);
+ALTER TABLE run ADD COLUMN IF NOT EXISTS estudiante_id INTEGER REFERENCES estudiante(estudiante_id);
+ALTER TABLE run ADD COLUMN IF NOT EXISTS asistente_id VARCHAR(100) REFERENCES asistente(asistente_id);
+ALTER TABLE run ADD COLUMN IF NOT EXISTS primer_token_at TIMESTAMPTZ;
+ALTER TABLE run ADD COLUMN IF NOT EXISTS completed_at TIMESTAMPTZ;
+ALTER TABLE run ADD COLUMN IF NOT EXISTS prompt_tokens INTEGER;
+ALTER TABLE run ADD COLUMN IF NOT EXISTS completion_tokens INTEGER;
+ALTER TABLE run ADD COLUMN IF NOT EXISTS total_tokens INTEGER;
+CREATE INDEX IF NOT EXISTS ix_run_thread_id ON run (thread_id);
+CREATE INDEX IF NOT EXISTS ix_run_estudiante_id ON run (estudiante_id);
+
+-- Índice para leer la última pregunta de un estudiante (contexto de clasificación)
+CREATE INDEX IF NOT EXISTS ix_pregunta_estudiante_id_pregunta_id ON pregunta (estudiante_id, pregunta_id);
+
+-- Claves de respuestas y resultado por ítem de evaluación (si la tabla ya existía)
+ALTER TABLE evaluacion_item ADD COLUMN IF NOT EXISTS tipo VARCHAR(30);
+ALTER TABLE evaluacion_item ADD COLUMN IF NOT EXISTS opciones JSON;
+ALTER TABLE evaluacion_item ADD COLUMN IF NOT EXISTS clave JSON;
+ALTER TABLE evaluacion_item ADD COLUMN IF NOT EXISTS puntaje DOUBLE PRECISION;
+ALTER TABLE evaluacion_item ADD COLUMN IF NOT EXISTS respuesta JSON;
+
+-- La copia local de los mensajes se borra junto con su thread (si la tabla ya existía)
+ALTER TABLE mensaje DROP CONSTRAINT IF EXISTS mensaje_thread_id_fkey;
+ALTER TABLE mensaje ADD CONSTRAINT mensaje_thread_id_fkey
+    FOREIGN KEY (thread_id) REFERENCES thread(id) ON DELETE CASCADE;
+
+-- Los runs registrados sobreviven al borrado de su thread (quedan sin thread_id)
+ALTER TABLE run DROP CONSTRAINT IF EXISTS run_thread_id_fkey;
+ALTER TABLE run ADD CONSTRAINT run_thread_id_fkey
+    FOREIGN KEY (thread_id) REFERENCES thread(id) ON DELETE SET NULL;
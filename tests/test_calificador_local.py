@@ -0,0 +1,61 @@
+import pytest
+from services.calificador_local import es_cerrado, extraer_elecciones, puntaje
+
+
+@pytest.mark.parametrize("mensaje, esperado", [
+    ("1) b", {1}),
+    ("1) a, c", {0, 2}),
+    ("1: a y d", {0, 3}),
+    ("1) b e i", {1, 8}),       # "e" como conector
+    ("1) a, e", {0, 4}),        # "e" como opción
+    ("1) a e", {0, 4}),
+    ("1) a y e", {0, 4}),
+    ("1) a/b", {0, 1}),
+    ("pregunta 1 - c", {2}),
+])
+def test_respuesta_numerada(mensaje, esperado):
+    assert extraer_elecciones([mensaje], {1: 10}) == {1: esperado}
+
+
+def test_varias_respuestas_en_un_mensaje():
+    elecciones = extraer_elecciones(["1) a\n2) b, c\n3) d"], {1: 4, 2: 4, 3: 4})
+    assert elecciones == {1: {0}, 2: {1, 2}, 3: {3}}
+
+
+def test_texto_libre_no_es_eleccion():
+    assert extraer_elecciones(["1) a mi me da 3"], {1: 4}) == {}
+
+
+def test_ignora_letras_fuera_de_las_opciones_e_items_abiertos():
+    assert extraer_elecciones(["1) a, f\n2) b"], {1: 3}) == {1: {0}}
+
+
+def test_ultima_respuesta_reemplaza_a_la_anterior():
+    assert extraer_elecciones(["1) a", "1) c"], {1: 4}) == {1: {2}}
+
+
+def test_solo_letras_con_un_unico_item_cerrado():
+    assert extraer_elecciones(["b"], {2: 4}) == {2: {1}}
+    assert extraer_elecciones(["b"], {1: 4, 2: 4}) == {}
+
+
+def test_es_cerrado():
+    assert es_cerrado("single_choice", ["x", "y"], [0])
+    assert not es_cerrado("single_choice", ["x", "y"], None)
+    assert not es_cerrado("match_drag_drop", ["x"], [0])
+    assert not es_cerrado("multiple_choice", [], [0])
+
+
+@pytest.mark.parametrize("tipo, clave, elegidas, esperado", [
+    ("single_choice", [1], {1}, 1.0),
+    ("single_choice", [1], {0}, 0.0),
+    ("single_choice", [1], {0, 1}, 0.0),
+    ("multiple_choice", [0, 2], {0, 2}, 1.0),
+    ("multiple_choice", [0, 2], {0}, 0.5),
+    ("multiple_choice", [0, 2], {0, 1}, 0.0),
+    ("multiple_choice", [0, 2], {1, 3}, 0.0),   # no baja de 0
+    ("multiple_choice", [0, 1, 2], {0, 1, 3}, 1 / 3),
+    ("multiple_choice", [], set(), 1.0),
+])
+def test_puntaje(tipo, clave, elegidas, esperado):
+    assert puntaje(tipo, clave, elegidas) == pytest.approx(esperado)
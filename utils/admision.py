@@ -0,0 +1,194 @@
+import asyncio
+import math
+import os
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Deque, Optional, Tuple
+from dotenv import load_dotenv
+from utils.metricas import metricas
+
+load_dotenv()
+
+ADMISION_MAX_GLOBAL = int(os.getenv("ADMISION_MAX_GLOBAL", "6"))
+ADMISION_MAX_ASISTENTE = int(os.getenv("ADMISION_MAX_ASISTENTE", "6"))
+ADMISION_MAX_ESTUDIANTE = int(os.getenv("ADMISION_MAX_ESTUDIANTE", "2"))
+ADMISION_MAX_COLA = int(os.getenv("ADMISION_MAX_COLA", "50"))
+ADMISION_TIMEOUT_COLA = float(os.getenv("ADMISION_TIMEOUT_COLA", "15"))
+
+# Marca las tareas que ya tienen un lugar, para que las llamadas anidadas
+# (ej. una tool call dentro de un run admitido) no vuelvan a hacer cola.
+_admitido: ContextVar[bool] = ContextVar("admision_admitido", default=False)
+
+
+class AdmisionRechazada(Exception):
+    """
+    Se lanza cuando la cola de espera está llena o la espera supera el límite.
+    Se traduce a un 429 con el header `Retry-After`.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Demasiadas solicitudes en curso. Reintentar en {retry_after} segundos.")
+        self.retry_after = retry_after
+
+
+@dataclass
+class Ticket:
+    asistente_id: Optional[str] = None
+    estudiante_id: Optional[int] = None
+    liberado: bool = False
+
+
+class ControlAdmision:
+    """
+    Controla la concurrencia de todas las llamadas a OpenAI del proceso, con límites
+    global, por asistente y por estudiante, y una cola de espera acotada.
+    """
+
+    def __init__(self, max_global: int, max_asistente: int, max_estudiante: int,
+                 max_cola: int, timeout_cola: float):
+        self.max_global = max_global
+        self.max_asistente = max_asistente
+        self.max_estudiante = max_estudiante
+        self.max_cola = max_cola
+        self.timeout_cola = timeout_cola
+        self._activos = 0
+        self._por_asistente: Counter = Counter()
+        self._por_estudiante: Counter = Counter()
+        self._esperando: Deque[Tuple[Ticket, asyncio.Future]] = deque()
+
+    def _hay_lugar(self, ticket: Ticket) -> bool:
+        if self._activos >= self.max_global:
+            return False
+        if ticket.asistente_id is not None and self._por_asistente[ticket.asistente_id] >= self.max_asistente:
+            return False
+        if ticket.estudiante_id is not None and self._por_estudiante[ticket.estudiante_id] >= self.max_estudiante:
+            return False
+        return True
+
+    def _ocupar(self, ticket: Ticket):
+        self._activos += 1
+        if ticket.asistente_id is not None:
+            self._por_asistente[ticket.asistente_id] += 1
+        if ticket.estudiante_id is not None:
+            self._por_estudiante[ticket.estudiante_id] += 1
+
+    def _despertar(self):
+        # Se recorre la cola en orden; un ticket bloqueado por su límite de asistente o
+        # estudiante no impide que pasen los que vienen detrás.
+        for entrada in list(self._esperando):
+            if self._activos >= self.max_global:
+                break
+            ticket, futuro = entrada
+            if futuro.done():
+                self._esperando.remove(entrada)
+            elif self._hay_lugar(ticket):
+                self._esperando.remove(entrada)
+                self._ocupar(ticket)
+                futuro.set_result(None)
+
+    def _retry_after(self) -> int:
+        espera_tipica = metricas.histograma("admision.espera_cola_s").percentil(50)
+        return max(1, math.ceil(espera_tipica))
+
+    async def adquirir(self, asistente_id: Optional[str] = None, estudiante_id: Optional[int] = None) -> Ticket:
+        ticket = Ticket(asistente_id=asistente_id, estudiante_id=estudiante_id)
+
+        if not self._esperando and self._hay_lugar(ticket):
+            self._ocupar(ticket)
+            metricas.histograma("admision.espera_cola_s").observar(0.0)
+            metricas.contador("admision.admitidos").incrementar()
+            return ticket
+
+        if len(self._esperando) >= self.max_cola:
+            metricas.contador("admision.rechazados_cola_llena").incrementar()
+            raise AdmisionRechazada(self._retry_after())
+
+        futuro = asyncio.get_running_loop().create_future()
+        entrada = (ticket, futuro)
+        self._esperando.append(entrada)
+        # Los que esperan adelante pueden estar bloqueados por su propio límite: si este
+        # ticket tiene lugar, se lo admite ya en vez de esperar a la próxima liberación.
+        self._despertar()
+        inicio = time.monotonic()
+        try:
+            await asyncio.wait_for(futuro, timeout=self.timeout_cola)
+        except BaseException as e:
+            if futuro.done() and not futuro.cancelled() and futuro.exception() is None:
+                # El lugar se otorgó justo cuando vencía la espera: se devuelve.
+                self.liberar(ticket)
+            elif entrada in self._esperando:
+                self._esperando.remove(entrada)
+            if isinstance(e, asyncio.TimeoutError):
+                metricas.contador("admision.rechazados_timeout").incrementar()
+                raise AdmisionRechazada(self._retry_after()) from None
+            raise
+
+        metricas.histograma("admision.espera_cola_s").observar(time.monotonic() - inicio)
+        metricas.contador("admision.admitidos").incrementar()
+        return ticket
+
+    def liberar(self, ticket: Ticket):
+        if ticket.liberado:
+            return
+        ticket.liberado = True
+        self._activos -= 1
+        if ticket.asistente_id is not None:
+            self._por_asistente[ticket.asistente_id] -= 1
+            if self._por_asistente[ticket.asistente_id] <= 0:
+                del self._por_asistente[ticket.asistente_id]
+        if ticket.estudiante_id is not None:
+            self._por_estudiante[ticket.estudiante_id] -= 1
+            if self._por_estudiante[ticket.estudiante_id] <= 0:
+                del self._por_estudiante[ticket.estudiante_id]
+        self._despertar()
+
+    @contextmanager
+    def admitido(self):
+        """
+        Marca el contexto actual como admitido. Lo usan quienes adquieren el ticket en un
+        lugar y ejecutan el trabajo en otro (ej. el generador de una StreamingResponse).
+        """
+        token = _admitido.set(True)
+        try:
+            yield
+        finally:
+            _admitido.reset(token)
+
+    @asynccontextmanager
+    async def slot(self, asistente_id: Optional[str] = None, estudiante_id: Optional[int] = None):
+        if _admitido.get():
+            yield
+            return
+        ticket = await self.adquirir(asistente_id=asistente_id, estudiante_id=estudiante_id)
+        try:
+            with self.admitido():
+                yield
+        finally:
+            self.liberar(ticket)
+
+    def estado(self) -> dict:
+        return {
+            "activos": self._activos,
+            "en_cola": len(self._esperando),
+            "por_asistente": dict(self._por_asistente),
+            "por_estudiante": len(self._por_estudiante),
+            "limites": {
+                "global": self.max_global,
+                "asistente": self.max_asistente,
+                "estudiante": self.max_estudiante,
+                "cola": self.max_cola,
+                "timeout_cola": self.timeout_cola,
+            },
+        }
+
+
+admision = ControlAdmision(
+    max_global=ADMISION_MAX_GLOBAL,
+    max_asistente=ADMISION_MAX_ASISTENTE,
+    max_estudiante=ADMISION_MAX_ESTUDIANTE,
+    max_cola=ADMISION_MAX_COLA,
+    timeout_cola=ADMISION_TIMEOUT_COLA,
+)
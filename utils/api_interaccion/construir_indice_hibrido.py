@@ -0,0 +1,55 @@
+"""
+Genera el snapshot del índice híbrido (BM25 + vectores) de los contenidos de un vector
+store, que usa `VectorService.buscar_contenidos` para buscar sin llamar a la API (hoy,
+las preguntas de evaluación de los subtemas que no están en el banco local).
+
+Recibe los mismos JSONL que se cargan al vector store con `cargar_embeddings_vs.py`; se
+debe volver a correr cada vez que se recarga el vector store.
+
+Uso (desde la raíz del repo):
+    python -m utils.api_interaccion.construir_indice_hibrido \
+        --vector-store-id vs_... --jsonl ./utils/embeddings/fde/temas/temasfde.jsonl
+"""
+import argparse
+import json
+import numpy as np
+from openai import OpenAI
+from dotenv import load_dotenv
+from services.clasificador_local import MODELO_EMBEDDINGS
+from services.indice_hibrido import guardar_indice_hibrido, ruta_indice_hibrido
+
+load_dotenv()
+
+TAMANO_LOTE = 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vector-store-id", required=True)
+    parser.add_argument("--jsonl", required=True, nargs="+")
+    parser.add_argument("--sin-embeddings", action="store_true", help="Solo el índice BM25")
+    args = parser.parse_args()
+
+    entradas = []
+    for ruta in args.jsonl:
+        with open(ruta, encoding="utf-8") as f:
+            entradas.extend(json.loads(linea) for linea in f if linea.strip())
+
+    modelo = entradas[0]["metadata"].get("embedding_model", MODELO_EMBEDDINGS)
+    vectores = None
+    if not args.sin_embeddings:
+        client = OpenAI()
+        textos = [e["text"] for e in entradas]
+        lista = []
+        for i in range(0, len(textos), TAMANO_LOTE):
+            resp = client.embeddings.create(model=modelo, input=textos[i:i + TAMANO_LOTE])
+            lista.extend(d.embedding for d in resp.data)
+        vectores = np.asarray(lista, dtype=np.float32)
+
+    ruta = ruta_indice_hibrido(args.vector_store_id)
+    guardar_indice_hibrido(ruta, entradas, vectores, modelo)
+    print(f"Índice híbrido con {len(entradas)} documentos guardado en {ruta}")
+
+
+if __name__ == "__main__":
+    main()
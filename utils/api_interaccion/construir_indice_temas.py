@@ -0,0 +1,57 @@
+"""
+Genera el snapshot local de embeddings de los subtemas de un vector store, que usa
+`ClasificadorLocal` para clasificar consultas sin llamar a `vector_stores.search`.
+
+Se debe volver a correr cada vez que se recarga el vector store con un JSONL de temas:
+al cambiar el snapshot, el servidor descarta las clasificaciones cacheadas de ese vector store.
+
+Uso (desde la raíz del repo):
+    python -m utils.api_interaccion.construir_indice_temas \
+        --vector-store-id vs_... --jsonl ./utils/embeddings/fde/temas/temasfde.jsonl
+"""
+import argparse
+import json
+import numpy as np
+from openai import OpenAI
+from dotenv import load_dotenv
+from services.clasificador_local import MODELO_EMBEDDINGS, guardar_indice, ruta_indice
+
+load_dotenv()
+
+TAMANO_LOTE = 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vector-store-id", required=True)
+    parser.add_argument("--jsonl", required=True)
+    args = parser.parse_args()
+
+    with open(args.jsonl, encoding="utf-8") as f:
+        entradas = [json.loads(linea) for linea in f if linea.strip()]
+
+    # Cada subtema tiene el modelo de embeddings con el que se cargó al vector store
+    modelo = entradas[0]["metadata"].get("embedding_model", MODELO_EMBEDDINGS)
+    textos = [e["text"] for e in entradas]
+
+    client = OpenAI()
+    vectores = []
+    for i in range(0, len(textos), TAMANO_LOTE):
+        resp = client.embeddings.create(model=modelo, input=textos[i:i + TAMANO_LOTE])
+        vectores.extend(d.embedding for d in resp.data)
+
+    ruta = ruta_indice(args.vector_store_id)
+    guardar_indice(
+        ruta,
+        vectores=np.asarray(vectores, dtype=np.float32),
+        subtopic_ids=np.array([int(float(e["metadata"]["subtopic_id"])) for e in entradas]),
+        unit_ids=np.array([int(float(e["metadata"]["unit_id"])) for e in entradas]),
+        textos=np.array(textos),
+        modelo=modelo,
+        subtopic_names=np.array([e["metadata"].get("subtopic_name", "") for e in entradas]),
+    )
+    print(f"Índice con {len(textos)} subtemas guardado en {ruta}")
+
+
+if __name__ == "__main__":
+    main()
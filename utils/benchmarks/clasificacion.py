@@ -0,0 +1,529 @@
+"""
+Mide la precisión y la latencia de las estrategias de clasificación de consultas usando
+las preguntas etiquetadas con `subtopic_id`/`unit_id` de los JSONL del repo.
+
+Estrategias:
+    lexica           autómata de nombres de subtemas/temas (`clasificador_lexico`)
+    local            similitud coseno contra los embeddings de los temas (`IndiceTemas`)
+    remota_simulada  el ranking de `local` con la latencia de `vector_stores.search` simulada
+    cacheada         `local` detrás de una `CacheClasificacion` (sirve con --repeticiones > 1)
+    combinada        `lexica` y, si no resuelve, `local` (el orden de `clasificar_consulta`)
+    pipeline         `VectorService.clasificar_consulta` real (filtros, léxica, caché, local con
+                     SCORE_MIN_LOCAL y búsqueda remota por el gateway) con el cliente remoto
+                     simulado y la taxonomía del corpus en lugar de la DB
+
+Las estrategias vectoriales necesitan embeddings: se piden a OpenAI la primera vez y se
+guardan en --cache-embeddings, así las corridas siguientes no usan la red. La latencia de
+`local` no incluye el cálculo del embedding de la consulta.
+
+Uso (desde la raíz del repo):
+    python -m utils.benchmarks.clasificacion --corpus fde --estrategias lexica local combinada
+    python -m utils.benchmarks.clasificacion --salida tmp/bench_clasificacion.json
+    python -m utils.benchmarks.clasificacion --estrategias local --calibrar-umbral
+
+Con --calibrar-umbral se agrega, para la estrategia `local`, la cobertura y la precisión
+top-1 de cada umbral de similitud coseno y el menor umbral que alcanza
+--precision-objetivo (el valor para SCORE_MIN_LOCAL de `clasificar_consulta`).
+"""
+import argparse
+import asyncio
+import glob
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from contextlib import ExitStack, redirect_stdout
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from unittest.mock import patch
+import numpy as np
+from services.cache_clasificacion import CacheClasificacion
+from services.clasificador_lexico import ClasificadorLexico, armar_automata, resolver
+from services.clasificador_local import MODELO_EMBEDDINGS, ClasificadorLocal, IndiceTemas, guardar_indice
+from utils.metricas import Histograma
+
+# Preguntas etiquetadas y JSONL de temas (el que se carga al vector store) de cada materia.
+# Matemática II no tiene JSONL de temas: se usan los subtemas que nombran sus preguntas.
+CORPUS = {
+    "fde": (["utils/embeddings/fde/preguntas/*.jsonl"], "utils/embeddings/fde/temas/temasfde.jsonl"),
+    "matematica_i": (["utils/embeddings/matematica_i/preguntas/*.jsonl"],
+                     "utils/embeddings/matematica_i/temas/temasmate_i.jsonl"),
+    "matematica_ii": (["embeddings/preguntas/Matemática II/*.jsonl"], None),
+}
+TAMANO_LOTE_EMBEDDINGS = 100
+
+
+@dataclass
+class Ejemplo:
+    texto: str
+    subtopic_id: int
+    unit_id: int
+
+
+@dataclass
+class Tema:
+    texto: str
+    subtopic_id: int
+    unit_id: int
+    subtopic_name: str
+    topic_name: Optional[str]
+
+
+def _leer_jsonl(ruta: str) -> List[dict]:
+    with open(ruta, encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+
+def cargar_corpus(patrones: List[str], temas_jsonl: Optional[str]) -> tuple[List[Ejemplo], List[Tema]]:
+    entradas = [e for patron in patrones for ruta in sorted(glob.glob(patron)) for e in _leer_jsonl(ruta)]
+    ejemplos = [
+        Ejemplo(texto=e["text"], subtopic_id=int(float(e["metadata"]["subtopic_id"])),
+                unit_id=int(float(e["metadata"]["unit_id"])))
+        for e in entradas
+    ]
+    if temas_jsonl:
+        temas = [
+            Tema(texto=e["text"], subtopic_id=int(float(e["metadata"]["subtopic_id"])),
+                 unit_id=int(float(e["metadata"]["unit_id"])), subtopic_name=e["metadata"].get("subtopic_name", ""),
+                 topic_name=e["metadata"].get("topic_name"))
+            for e in _leer_jsonl(temas_jsonl)
+        ]
+    else:
+        por_subtema = {}
+        for e in entradas:
+            m = e["metadata"]
+            nombre = m.get("subtopic_name", "")
+            por_subtema.setdefault(int(float(m["subtopic_id"])), Tema(
+                texto=nombre, subtopic_id=int(float(m["subtopic_id"])), unit_id=int(float(m["unit_id"])),
+                subtopic_name=nombre, topic_name=None,
+            ))
+        temas = list(por_subtema.values())
+    return ejemplos, temas
+
+
+class EmbeddingsEnDisco:
+    """
+    Embeddings por (modelo, texto) guardados en un .npz, para no volver a pedirlos a OpenAI.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._vectores: Dict[tuple[str, str], np.ndarray] = {}
+        if os.path.exists(ruta):
+            with np.load(ruta) as datos:
+                for modelo, texto, vector in zip(datos["modelos"], datos["textos"], datos["vectores"]):
+                    self._vectores[(str(modelo), str(texto))] = vector
+
+    async def asegurar(self, textos: List[str], modelo: str):
+        faltantes = list(dict.fromkeys(t for t in textos if (modelo, t) not in self._vectores))
+        if not faltantes:
+            return
+        # Se importa acá: el cliente exige OPENAI_API_KEY y las corridas con caché no lo necesitan.
+        from openai_client import client
+        for i in range(0, len(faltantes), TAMANO_LOTE_EMBEDDINGS):
+            lote = faltantes[i:i + TAMANO_LOTE_EMBEDDINGS]
+            resp = await client.embeddings.create(model=modelo, input=lote)
+            for texto, dato in zip(lote, resp.data):
+                vector = np.asarray(dato.embedding, dtype=np.float32)
+                self._vectores[(modelo, texto)] = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        self._guardar()
+
+    def _guardar(self):
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        claves = list(self._vectores)
+        np.savez(self.ruta, modelos=np.array([m for m, _ in claves]), textos=np.array([t for _, t in claves]),
+                 vectores=np.stack([self._vectores[c] for c in claves]))
+
+    def vector(self, texto: str, modelo: str) -> np.ndarray:
+        return self._vectores[(modelo, texto)]
+
+
+class Estrategia(ABC):
+    nombre = ""
+
+    async def preparar(self, ejemplos: List[Ejemplo], temas: List[Tema]):
+        pass
+
+    @abstractmethod
+    async def clasificar(self, texto: str) -> List[int]:
+        """
+        Devuelve los subtopic_id candidatos, del más probable al menos probable.
+        """
+
+    def extras(self) -> dict:
+        return {}
+
+    async def cerrar(self):
+        """
+        Libera lo que haya tomado `preparar`; se llama aunque `preparar` haya fallado.
+        """
+
+
+class EstrategiaLexica(Estrategia):
+    nombre = "lexica"
+
+    async def preparar(self, ejemplos, temas):
+        self.automata = armar_automata(
+            (t.subtopic_id, t.subtopic_name, t.topic_name, t.unit_id) for t in temas
+        )
+
+    async def clasificar(self, texto):
+        candidato, _ = resolver(self.automata, texto)
+        return [] if candidato is None else [candidato[0]]
+
+
+class EstrategiaLocal(Estrategia):
+    nombre = "local"
+
+    def __init__(self, embeddings: EmbeddingsEnDisco, modelo: str, k: int):
+        self.embeddings = embeddings
+        self.modelo = modelo
+        self.k = k
+
+    async def preparar(self, ejemplos, temas):
+        await self.embeddings.asegurar([t.texto for t in temas] + [e.texto for e in ejemplos], self.modelo)
+        self.indice = IndiceTemas(
+            vectores=np.stack([self.embeddings.vector(t.texto, self.modelo) for t in temas]),
+            subtopic_ids=np.array([t.subtopic_id for t in temas]),
+            unit_ids=np.array([t.unit_id for t in temas]),
+            textos=np.array([t.texto for t in temas]),
+            modelo=self.modelo, mtime=0.0,
+        )
+
+    async def clasificar(self, texto):
+        resultados = self.indice.buscar(self.embeddings.vector(texto, self.modelo), k=self.k)
+        return list(dict.fromkeys(subtopic_id for subtopic_id, _, _ in resultados))
+
+
+class EstrategiaRemotaSimulada(EstrategiaLocal):
+    """
+    Sin red: la calidad del ranking se aproxima con el índice local (mismo modelo de
+    embeddings que el vector store) y se suma la latencia observada de `vector_stores.search`.
+    """
+    nombre = "remota_simulada"
+
+    def __init__(self, embeddings, modelo, k, latencia_min: float, latencia_max: float):
+        super().__init__(embeddings, modelo, k)
+        self.latencia_min = latencia_min
+        self.latencia_max = latencia_max
+
+    async def clasificar(self, texto):
+        await asyncio.sleep(random.uniform(self.latencia_min, self.latencia_max))
+        return await super().clasificar(texto)
+
+
+class EstrategiaCacheada(Estrategia):
+    nombre = "cacheada"
+
+    def __init__(self, interna: Estrategia):
+        self.interna = interna
+        self.cache = CacheClasificacion(max_entradas=10_000, ttl=3600)
+        self.aciertos = 0
+        self.consultas = 0
+
+    async def preparar(self, ejemplos, temas):
+        await self.interna.preparar(ejemplos, temas)
+
+    async def clasificar(self, texto):
+        self.consultas += 1
+        # La caché guarda solo el mejor resultado, como en `clasificar_consulta`.
+        ids = self.cache.obtener("bench", texto)
+        if ids is not None:
+            self.aciertos += 1
+            return [ids[0]]
+        resultado = await self.interna.clasificar(texto)
+        if resultado:
+            self.cache.guardar("bench", texto, [resultado[0], 0])
+        return resultado
+
+    def extras(self):
+        return {"tasa_aciertos_cache": self.aciertos / self.consultas if self.consultas else 0.0}
+
+
+class EstrategiaCombinada(Estrategia):
+    nombre = "combinada"
+
+    def __init__(self, lexica: EstrategiaLexica, vectorial: Estrategia):
+        self.lexica = lexica
+        self.vectorial = vectorial
+        self.resueltas_lexica = 0
+        self.consultas = 0
+
+    async def preparar(self, ejemplos, temas):
+        await self.lexica.preparar(ejemplos, temas)
+        await self.vectorial.preparar(ejemplos, temas)
+
+    async def clasificar(self, texto):
+        self.consultas += 1
+        resultado = await self.lexica.clasificar(texto)
+        if resultado:
+            self.resueltas_lexica += 1
+            return resultado
+        return await self.vectorial.clasificar(texto)
+
+    def extras(self):
+        return {"fraccion_lexica": self.resueltas_lexica / self.consultas if self.consultas else 0.0}
+
+
+class ClasificadorLocalSinRed(ClasificadorLocal):
+    # Los embeddings de las consultas salen del archivo del benchmark, no de OpenAI.
+    def __init__(self, directorio: str, embeddings: EmbeddingsEnDisco):
+        super().__init__(directorio=directorio, max_cache=0)
+        self.embeddings_en_disco = embeddings
+
+    async def embedding(self, texto: str, modelo: str = MODELO_EMBEDDINGS) -> np.ndarray:
+        return self.embeddings_en_disco.vector(texto, modelo)
+
+
+class ClasificadorLexicoSinDB(ClasificadorLexico):
+    # La taxonomía sale de los temas del corpus, no de la DB.
+    def __init__(self, temas: List[Tema]):
+        super().__init__()
+        self.temas = temas
+
+    async def _construir(self, vector_store_id, indice):
+        return armar_automata((t.subtopic_id, t.subtopic_name, t.topic_name, t.unit_id) for t in self.temas)
+
+
+class SinContexto:
+    # Cada consulta del corpus se trata como la primera del estudiante: no hay fallback.
+    async def obtener(self, db, estudiante_id):
+        return None
+
+
+class ClienteRemotoSimulado:
+    """
+    Reemplaza al cliente de OpenAI dentro del `VectorStoreGateway`: `vector_stores.search`
+    rankea con el índice local y tarda la latencia remota simulada.
+    """
+
+    def __init__(self, indice: IndiceTemas, embeddings: EmbeddingsEnDisco, modelo: str,
+                 latencia_min: float, latencia_max: float):
+        self.indice = indice
+        self.embeddings = embeddings
+        self.modelo = modelo
+        self.latencia_min = latencia_min
+        self.latencia_max = latencia_max
+        self.vector_stores = self
+
+    async def search(self, *, vector_store_id: str, query: str, max_num_results: int, filters=None):
+        await asyncio.sleep(random.uniform(self.latencia_min, self.latencia_max))
+        resultados = self.indice.buscar(self.embeddings.vector(query, self.modelo), k=max_num_results)
+        return SimpleNamespace(data=[
+            SimpleNamespace(score=score, content=[],
+                            attributes={"subtopic_id": str(subtopic_id), "unit_id": str(unit_id)})
+            for subtopic_id, unit_id, score in resultados
+        ])
+
+
+class EstrategiaPipeline(Estrategia):
+    """
+    Corre `VectorService.clasificar_consulta` tal como en producción, con sus dependencias
+    reemplazadas solo donde harían falta red o DB.
+    """
+    nombre = "pipeline"
+    vector_store_id = "bench"
+
+    def __init__(self, embeddings: EmbeddingsEnDisco, modelo: str, latencia_min: float, latencia_max: float):
+        self.embeddings = embeddings
+        self.modelo = modelo
+        self.latencia_min = latencia_min
+        self.latencia_max = latencia_max
+        self.directorio = None
+        self.parches = ExitStack()
+        self.sin_resultado = 0
+
+    async def preparar(self, ejemplos, temas):
+        # Se importa acá: el servicio arrastra la configuración de la DB, que las demás
+        # estrategias no necesitan.
+        from services import clasificador_lexico as modulo_lexico
+        from services import vector_store_service
+        from services.vector_store_gateway import VectorStoreGateway
+
+        await self.embeddings.asegurar([t.texto for t in temas] + [e.texto for e in ejemplos], self.modelo)
+        # Los logs del servicio no se mezclan con el JSON de resultados.
+        self.parches.enter_context(redirect_stdout(io.StringIO()))
+        self.directorio = tempfile.mkdtemp(prefix="bench_pipeline_")
+        guardar_indice(
+            os.path.join(self.directorio, f"{self.vector_store_id}.npz"),
+            vectores=np.stack([self.embeddings.vector(t.texto, self.modelo) for t in temas]),
+            subtopic_ids=np.array([t.subtopic_id for t in temas]),
+            unit_ids=np.array([t.unit_id for t in temas]),
+            textos=np.array([t.texto for t in temas]),
+            modelo=self.modelo,
+            subtopic_names=np.array([t.subtopic_name for t in temas]),
+        )
+        local = ClasificadorLocalSinRed(self.directorio, self.embeddings)
+        gateway = VectorStoreGateway(timeout_intento=10.0, deadline=10.0, intentos=1,
+                                     umbral_fallos=5, tiempo_apertura=30.0)
+        gateway._client = ClienteRemotoSimulado(await local.obtener_indice(self.vector_store_id), self.embeddings,
+                                                self.modelo, self.latencia_min, self.latencia_max)
+
+        self.parches.enter_context(patch.multiple(
+            vector_store_service,
+            clasificador_lexico=ClasificadorLexicoSinDB(temas),
+            clasificador_local=local,
+            vector_store_gateway=gateway,
+            contexto_estudiantes=SinContexto(),
+            cache_clasificacion=CacheClasificacion(max_entradas=10_000, ttl=3600),
+        ))
+        self.parches.enter_context(patch.object(modulo_lexico, "clasificador_local", local))
+        self.servicio = vector_store_service.VectorService(None)
+
+    async def clasificar(self, texto):
+        try:
+            subtopic_id, _ = await self.servicio.clasificar_consulta(texto, self.vector_store_id, estudiante_id=0)
+        except Exception:
+            # Sin resultado y sin contexto para el fallback (ej. una acción sin tema).
+            self.sin_resultado += 1
+            return []
+        return [subtopic_id]
+
+    def extras(self):
+        return {"sin_resultado": self.sin_resultado}
+
+    async def cerrar(self):
+        self.parches.close()
+        if self.directorio:
+            shutil.rmtree(self.directorio, ignore_errors=True)
+
+
+def crear_estrategias(nombres: List[str], args) -> List[Estrategia]:
+    embeddings = EmbeddingsEnDisco(args.cache_embeddings)
+    fabricas = {
+        "lexica": lambda: EstrategiaLexica(),
+        "local": lambda: EstrategiaLocal(embeddings, args.modelo, args.k),
+        "remota_simulada": lambda: EstrategiaRemotaSimulada(embeddings, args.modelo, args.k,
+                                                             args.latencia_remota_min, args.latencia_remota_max),
+        "cacheada": lambda: EstrategiaCacheada(EstrategiaLocal(embeddings, args.modelo, args.k)),
+        "combinada": lambda: EstrategiaCombinada(EstrategiaLexica(), EstrategiaLocal(embeddings, args.modelo, args.k)),
+        "pipeline": lambda: EstrategiaPipeline(embeddings, args.modelo,
+                                               args.latencia_remota_min, args.latencia_remota_max),
+    }
+    return [fabricas[nombre]() for nombre in nombres]
+
+
+async def medir(estrategia: Estrategia, ejemplos: List[Ejemplo], repeticiones: int, concurrencia: int) -> dict:
+    latencias = Histograma()
+    top1 = top3 = con_resultado = 0
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def una(ejemplo: Ejemplo):
+        nonlocal top1, top3, con_resultado
+        async with semaforo:
+            inicio = time.perf_counter()
+            candidatos = await estrategia.clasificar(ejemplo.texto)
+            latencias.observar(time.perf_counter() - inicio)
+        con_resultado += bool(candidatos)
+        top1 += candidatos[:1] == [ejemplo.subtopic_id]
+        top3 += ejemplo.subtopic_id in candidatos[:3]
+
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        await asyncio.gather(*(una(e) for e in ejemplos))
+    total_s = time.perf_counter() - inicio
+
+    consultas = len(ejemplos) * repeticiones
+    return {
+        "consultas": consultas,
+        "top1": top1 / consultas,
+        "top3": top3 / consultas,
+        "cobertura": con_resultado / consultas,
+        # Precisión sobre las consultas a las que la estrategia dio alguna respuesta
+        "precision_top1": top1 / con_resultado if con_resultado else 0.0,
+        "latencia_s": {clave: latencias.resumen()[clave] for clave in ("promedio", "p50", "p95", "p99", "max")},
+        "throughput_qps": consultas / total_s if total_s else 0.0,
+        **estrategia.extras(),
+    }
+
+
+UMBRALES = [round(0.15 + 0.025 * i, 3) for i in range(19)]
+
+
+def calibrar_umbral(estrategia: EstrategiaLocal, ejemplos: List[Ejemplo], objetivo: float) -> dict:
+    """
+    Con el mejor resultado de cada consulta, mide qué fracción supera cada umbral
+    (cobertura) y qué fracción de esas es correcta (precisión).
+    """
+    mejores = []
+    for ejemplo in ejemplos:
+        subtopic_id, _, score = estrategia.indice.buscar(estrategia.embeddings.vector(ejemplo.texto, estrategia.modelo), k=1)[0]
+        mejores.append((score, subtopic_id == ejemplo.subtopic_id))
+
+    por_umbral = {}
+    for umbral in UMBRALES:
+        aceptadas = [correcta for score, correcta in mejores if score >= umbral]
+        por_umbral[str(umbral)] = {
+            "cobertura": len(aceptadas) / len(mejores) if mejores else 0.0,
+            "precision_top1": sum(aceptadas) / len(aceptadas) if aceptadas else 0.0,
+        }
+    recomendado = next((u for u in UMBRALES if por_umbral[str(u)]["precision_top1"] >= objetivo
+                        and por_umbral[str(u)]["cobertura"] > 0), None)
+    return {"precision_objetivo": objetivo, "recomendado": recomendado, "umbrales": por_umbral}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", nargs="+", choices=sorted(CORPUS), default=sorted(CORPUS))
+    parser.add_argument("--preguntas", nargs="+", help="JSONL etiquetados (globs); reemplaza a --corpus")
+    parser.add_argument("--temas", help="JSONL de temas para usar con --preguntas")
+    parser.add_argument("--estrategias", nargs="+",
+                        default=["lexica", "local", "remota_simulada", "cacheada", "combinada", "pipeline"],
+                        choices=["lexica", "local", "remota_simulada", "cacheada", "combinada", "pipeline"])
+    parser.add_argument("--repeticiones", type=int, default=2)
+    parser.add_argument("--concurrencia", type=int, default=1)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--modelo", default=MODELO_EMBEDDINGS)
+    parser.add_argument("--latencia-remota-min", type=float, default=0.25)
+    parser.add_argument("--latencia-remota-max", type=float, default=0.9)
+    parser.add_argument("--cache-embeddings", default="tmp/bench_clasificacion_embeddings.npz")
+    parser.add_argument("--salida", help="Archivo donde guardar el JSON además de imprimirlo")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--calibrar-umbral", action="store_true",
+                        help="Barrido de umbrales de similitud para la estrategia local")
+    parser.add_argument("--precision-objetivo", type=float, default=0.9)
+    args = parser.parse_args()
+    random.seed(args.semilla)
+
+    corpus = {"personalizado": (args.preguntas, args.temas)} if args.preguntas else {c: CORPUS[c] for c in args.corpus}
+    resultados = {
+        "fecha": datetime.now(timezone.utc).isoformat(),
+        "parametros": vars(args),
+        "corpus": {},
+    }
+    for nombre, (patrones, temas_jsonl) in corpus.items():
+        ejemplos, temas = cargar_corpus(patrones, temas_jsonl)
+        por_estrategia = {}
+        for estrategia in crear_estrategias(args.estrategias, args):
+            try:
+                try:
+                    await estrategia.preparar(ejemplos, temas)
+                except Exception as e:
+                    # Típicamente: faltan embeddings en la caché y no hay acceso a OpenAI.
+                    por_estrategia[estrategia.nombre] = {"omitida": str(e)}
+                    continue
+                por_estrategia[estrategia.nombre] = await medir(estrategia, ejemplos, args.repeticiones,
+                                                                args.concurrencia)
+                if args.calibrar_umbral and estrategia.nombre == "local":
+                    por_estrategia[estrategia.nombre]["umbral"] = calibrar_umbral(estrategia, ejemplos,
+                                                                                  args.precision_objetivo)
+            finally:
+                await estrategia.cerrar()
+        resultados["corpus"][nombre] = {"preguntas": len(ejemplos), "subtemas": len(temas), "estrategias": por_estrategia}
+
+    salida = json.dumps(resultados, indent=2, ensure_ascii=False)
+    if args.salida:
+        os.makedirs(os.path.dirname(args.salida) or ".", exist_ok=True)
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(salida)
+    print(salida)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""
+Compara la latencia de armar un historial con imágenes descargándolas una por una
+(como hacía `get_mensajes` antes) contra la precarga concurrente de `ArchivoService`.
+
+La descarga de OpenAI se simula con una latencia configurable, y una fracción de los
+archivos falla, para medir también el costo de los timeouts.
+
+Uso (desde la raíz del repo):
+    python -m utils.benchmarks.historial_imagenes --imagenes 8 --repeticiones 20
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+from utils.cache_archivos import cache_archivos
+from services.archivo_service import ArchivoService
+from utils.metricas import Histograma
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"0" * 20_000
+
+
+class ArchivoServiceSimulado(ArchivoService):
+    def __init__(self, latencia_min: float, latencia_max: float, fallas: float, **kwargs):
+        super().__init__(**kwargs)
+        self.latencia_min = latencia_min
+        self.latencia_max = latencia_max
+        self.fallas = fallas
+
+    async def _descargar_openai(self, file_id: str) -> tuple[bytes, str]:
+        if random.random() < self.fallas:
+            # Un archivo que no responde: solo lo corta el timeout
+            await asyncio.sleep(3600)
+        await asyncio.sleep(random.uniform(self.latencia_min, self.latencia_max))
+        return PNG + file_id.encode(), "image/png"
+
+
+async def secuencial(svc: ArchivoService, file_ids: list[str]):
+    for file_id in file_ids:
+        try:
+            await asyncio.wait_for(svc.obtener(file_id), timeout=svc.timeout)
+        except Exception:
+            pass
+
+
+async def concurrente(svc: ArchivoService, file_ids: list[str]):
+    await svc.precargar(file_ids)
+
+
+async def medir(estrategia, svc: ArchivoService, imagenes: int, repeticiones: int) -> dict:
+    hist = Histograma()
+    for r in range(repeticiones):
+        # file_ids nuevos en cada repetición: se mide siempre con la caché fría
+        file_ids = [f"file-bench{random.getrandbits(48):x}{i}" for i in range(imagenes)]
+        inicio = time.perf_counter()
+        await estrategia(svc, file_ids)
+        hist.observar(time.perf_counter() - inicio)
+    return hist.resumen()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--imagenes", type=int, default=8)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--latencia-min", type=float, default=0.15)
+    parser.add_argument("--latencia-max", type=float, default=0.6)
+    parser.add_argument("--fallas", type=float, default=0.05)
+    parser.add_argument("--concurrencia", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=2.0)
+    args = parser.parse_args()
+
+    cache_archivos.directorio = tempfile.mkdtemp(prefix="bench_cache_archivos_")
+    svc = ArchivoServiceSimulado(args.latencia_min, args.latencia_max, args.fallas,
+                                 concurrencia=args.concurrencia, timeout=args.timeout)
+    resultados = {
+        "parametros": vars(args),
+        "secuencial": await medir(secuencial, svc, args.imagenes, args.repeticiones),
+        "concurrente": await medir(concurrente, svc, args.imagenes, args.repeticiones),
+    }
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+from utils.metricas import metricas
+
+load_dotenv()
+
+CACHE_ARCHIVOS_DIR = os.getenv("CACHE_ARCHIVOS_DIR", os.path.join(tempfile.gettempdir(), "cache_archivos"))
+CACHE_ARCHIVOS_MAX_MB = float(os.getenv("CACHE_ARCHIVOS_MAX_MB", "512"))
+
+# Las claves se usan como nombre de archivo: solo se aceptan ids simples (ej. file-AbC123)
+_CLAVE_VALIDA = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+Cargador = Callable[[], Awaitable[Tuple[bytes, str]]]
+
+
+@dataclass
+class EntradaCache:
+    digest: str
+    tamano: int
+    media_type: str
+    ruta: str
+
+
+class CacheArchivos:
+    """
+    Caché en disco direccionada por contenido. Cada clave (ej. un file_id de OpenAI)
+    apunta al sha256 de su contenido, que se guarda una sola vez en `blobs/`. Cuando
+    el total supera `max_bytes` se eliminan los contenidos usados hace más tiempo.
+    """
+
+    def __init__(self, directorio: str, max_bytes: int):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self._refs: Dict[str, EntradaCache] = {}
+        self._blobs: "OrderedDict[str, int]" = OrderedDict()
+        self._claves_por_blob: Dict[str, Set[str]] = {}
+        self._bytes = 0
+        self._en_curso: Dict[str, asyncio.Future] = {}
+        self._cargado = False
+        self._lock_carga = asyncio.Lock()
+
+    def _ruta_blob(self, digest: str) -> str:
+        return os.path.join(self.directorio, "blobs", digest[:2], digest)
+
+    def _ruta_ref(self, clave: str) -> str:
+        return os.path.join(self.directorio, "refs", clave)
+
+    def _leer_indice(self) -> Tuple[List[Tuple[str, int]], List[Tuple[str, str, str]]]:
+        # Lee el índice de disco (en un thread, sin tocar el estado): devuelve los blobs en
+        # orden LRU inicial, según la fecha de modificación, y las refs (clave, digest, media_type).
+        os.makedirs(os.path.join(self.directorio, "refs"), exist_ok=True)
+        os.makedirs(os.path.join(self.directorio, "blobs"), exist_ok=True)
+        blobs = []
+        for sub in os.scandir(os.path.join(self.directorio, "blobs")):
+            if sub.is_dir():
+                blobs.extend((e.stat().st_mtime, e.name, e.stat().st_size) for e in os.scandir(sub.path) if e.is_file())
+        refs = []
+        for e in os.scandir(os.path.join(self.directorio, "refs")):
+            try:
+                with open(e.path) as f:
+                    ref = json.load(f)
+            except (OSError, ValueError):
+                continue
+            refs.append((e.name, ref["digest"], ref["media_type"]))
+        return [(digest, tamano) for _, digest, tamano in sorted(blobs)], refs
+
+    async def _cargar_indice(self):
+        # Las primeras solicitudes llegan juntas (ej. la precarga): el índice se lee una sola vez.
+        async with self._lock_carga:
+            if self._cargado:
+                return
+            blobs, refs = await asyncio.to_thread(self._leer_indice)
+            for digest, tamano in blobs:
+                self._blobs[digest] = tamano
+                self._bytes += tamano
+            for clave, digest, media_type in refs:
+                if digest in self._blobs:
+                    self._indexar(clave, digest, media_type)
+            self._cargado = True
+
+    def _indexar(self, clave: str, digest: str, media_type: str) -> EntradaCache:
+        entrada = EntradaCache(digest=digest, tamano=self._blobs[digest], media_type=media_type,
+                               ruta=self._ruta_blob(digest))
+        self._refs[clave] = entrada
+        self._claves_por_blob.setdefault(digest, set()).add(clave)
+        return entrada
+
+    def _guardar(self, clave: str, contenido: bytes, media_type: str) -> str:
+        digest = hashlib.sha256(contenido).hexdigest()
+        ruta = self._ruta_blob(digest)
+        if not os.path.exists(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            self._escribir_atomico(ruta, contenido)
+        self._escribir_atomico(self._ruta_ref(clave),
+                               json.dumps({"digest": digest, "media_type": media_type}).encode())
+        return digest
+
+    def _escribir_atomico(self, ruta: str, contenido: bytes):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(ruta))
+        with os.fdopen(fd, "wb") as f:
+            f.write(contenido)
+        os.replace(tmp, ruta)
+
+    def _desalojar(self, conservar: str):
+        while self._bytes > self.max_bytes and len(self._blobs) > 1:
+            digest, tamano = next(iter(self._blobs.items()))
+            if digest == conservar:
+                self._blobs.move_to_end(digest)
+                continue
+            del self._blobs[digest]
+            self._bytes -= tamano
+            for clave in self._claves_por_blob.pop(digest, set()):
+                self._refs.pop(clave, None)
+                self._borrar(self._ruta_ref(clave))
+            self._borrar(self._ruta_blob(digest))
+            metricas.contador("cache_archivos.desalojos").incrementar()
+
+    def _borrar(self, ruta: str):
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+
+    def obtener_local(self, clave: str) -> Optional[EntradaCache]:
+        entrada = self._refs.get(clave)
+        if entrada:
+            self._blobs.move_to_end(entrada.digest)
+        return entrada
+
+    async def obtener(self, clave: str, cargar: Cargador) -> EntradaCache:
+        """
+        Devuelve la entrada de `clave`. Si no está en caché se obtiene con `cargar`, que
+        devuelve (contenido, media_type); las solicitudes simultáneas de una misma clave
+        comparten una sola descarga.
+        """
+        if not _CLAVE_VALIDA.match(clave):
+            raise ValueError(f"Clave de archivo inválida: {clave}")
+        if not self._cargado:
+            await self._cargar_indice()
+
+        entrada = self.obtener_local(clave)
+        if entrada:
+            metricas.contador("cache_archivos.aciertos").incrementar()
+            return entrada
+
+        if clave in self._en_curso:
+            return await asyncio.shield(self._en_curso[clave])
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._en_curso[clave] = futuro
+        try:
+            metricas.contador("cache_archivos.fallos").incrementar()
+            contenido, media_type = await cargar()
+            digest = await asyncio.to_thread(self._guardar, clave, contenido, media_type)
+            if digest not in self._blobs:
+                self._blobs[digest] = len(contenido)
+                self._bytes += len(contenido)
+            self._blobs.move_to_end(digest)
+            entrada = self._indexar(clave, digest, media_type)
+            self._desalojar(conservar=digest)
+            futuro.set_result(entrada)
+            return entrada
+        except asyncio.CancelledError:
+            # Si se cancela quien descargaba (ej. por timeout), los demás reciben un error
+            # común en lugar de una cancelación que no les corresponde.
+            futuro.set_exception(RuntimeError(f"Se canceló la descarga de {clave}"))
+            futuro.exception()
+            raise
+        except Exception as e:
+            futuro.set_exception(e)
+            # Evita el aviso de excepción no recuperada cuando nadie más esperaba la descarga.
+            futuro.exception()
+            raise
+        finally:
+            del self._en_curso[clave]
+
+    def estado(self) -> dict:
+        return {
+            "archivos": len(self._refs),
+            "contenidos": len(self._blobs),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+cache_archivos = CacheArchivos(
+    directorio=CACHE_ARCHIVOS_DIR,
+    max_bytes=int(CACHE_ARCHIVOS_MAX_MB * 1024 * 1024),
+)
@@ -0,0 +1,83 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict
+
+# Cantidad de observaciones recientes que se guardan para calcular percentiles
+MUESTRAS_HISTOGRAMA = 2048
+
+
+class Contador:
+    def __init__(self):
+        self.valor = 0
+
+    def incrementar(self, n: int = 1):
+        self.valor += n
+
+
+class Histograma:
+    """
+    Histograma en memoria. Guarda el total de observaciones y una ventana de las
+    más recientes para calcular percentiles sin crecer indefinidamente.
+    """
+
+    def __init__(self):
+        self.cantidad = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+        self._muestras: Deque[float] = deque(maxlen=MUESTRAS_HISTOGRAMA)
+
+    def observar(self, valor: float):
+        self.cantidad += 1
+        self.suma += valor
+        self.maximo = max(self.maximo, valor)
+        self._muestras.append(valor)
+
+    def percentil(self, p: float) -> float:
+        if not self._muestras:
+            return 0.0
+        ordenadas = sorted(self._muestras)
+        idx = min(len(ordenadas) - 1, int(round(p / 100 * (len(ordenadas) - 1))))
+        return ordenadas[idx]
+
+    def resumen(self) -> dict:
+        return {
+            "cantidad": self.cantidad,
+            "promedio": self.suma / self.cantidad if self.cantidad else 0.0,
+            "p50": self.percentil(50),
+            "p95": self.percentil(95),
+            "p99": self.percentil(99),
+            "max": self.maximo,
+        }
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._contadores: Dict[str, Contador] = {}
+        self._histogramas: Dict[str, Histograma] = {}
+
+    def contador(self, nombre: str) -> Contador:
+        return self._contadores.setdefault(nombre, Contador())
+
+    def histograma(self, nombre: str) -> Histograma:
+        return self._histogramas.setdefault(nombre, Histograma())
+
+    @contextmanager
+    def medir(self, nombre: str):
+        """
+        Registra en el histograma `nombre` la duración (en segundos) del bloque.
+        """
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histograma(nombre).observar(time.perf_counter() - inicio)
+
+    def snapshot(self) -> dict:
+        return {
+            "contadores": {nombre: c.valor for nombre, c in sorted(self._contadores.items())},
+            "histogramas": {nombre: h.resumen() for nombre, h in sorted(self._histogramas.items())},
+        }
+
+
+metricas = RegistroMetricas()
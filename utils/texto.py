@@ -0,0 +1,19 @@
+import re
+import unicodedata
+from typing import List
+
+
+def normalizar_texto(texto: str) -> str:
+    """
+    Minúsculas, sin tildes y con los espacios colapsados.
+    """
+    sin_tildes = unicodedata.normalize("NFKD", texto.lower())
+    sin_tildes = "".join(c for c in sin_tildes if not unicodedata.combining(c))
+    return " ".join(sin_tildes.split())
+
+
+def tokenizar(texto: str) -> List[str]:
+    """
+    Palabras alfanuméricas del texto normalizado.
+    """
+    return re.findall(r"[a-z0-9]+", normalizar_texto(texto))
@@ -13,8 +13,16 @@ Salida (JSONL): una línea por pregunta, con:
   "title": "<str>",
   "statement": "<str>",        # enunciado con TeX
   "type": "<multiple_choice|match_drag_drop|single_choice|open_or_numeric>",
-  "options": ["<str>", ...]    # si hay opciones; None si no hay
+  "options": ["<str>", ...],   # si hay opciones; None si no hay
+  "answer_key": [<int>, ...],  # índices (desde 0) de las opciones correctas, si el export las marca; None si no
+  "metadata": {...}            # campos para la metadata del JSONL de preguntas (ver abajo)
 }
+
+El JSONL de preguntas que se carga al vector store y al banco (`{"text", "metadata"}`, con
+unidad y subtema) se arma a mano a partir de esta salida. Para que el banco corrija sin LLM
+las preguntas de opciones, `metadata` ya trae `type`, `options` y `answer_key` con los
+nombres que lee el banco (`question_type`, `options`, `answer_key`): hay que copiarla tal
+cual en la metadata de cada pregunta. Si falta, la pregunta se corrige con LLM.
 """
 
 import re
@@ -73,7 +81,7 @@ def guess_type(qdiv):
         return "multiple_choice"
     if qdiv.find("ul", class_="match"):
         return "match_drag_drop"
-    if qdiv.find("input", attrs={"type": "radio"}):
+    if qdiv.find("input", attrs={"type": "radio"}) or qdiv.find(class_="truefalse"):
         return "single_choice"
     return "open_or_numeric"
 
@@ -94,6 +102,50 @@ def extract_multichoice(qdiv):
             out.append(clean_spaces(li.get_text(" ", strip=True)))
     return out
 
+def extract_truefalse(qdiv):
+    """
+    Opciones de las preguntas verdadero/falso (<div class="truefalse">), en el orden del export.
+    """
+    tf = qdiv.find(class_="truefalse")
+    if not tf:
+        return []
+    labels = [clean_spaces(l.get_text(" ", strip=True)) for l in tf.find_all("label")]
+    return [l for l in labels if l] or ["Verdadero", "Falso"]
+
+def _is_correct(tag) -> bool:
+    classes = tag.get("class") or []
+    return "correct" in classes and "incorrect" not in classes
+
+def extract_answer_key(qdiv, options):
+    """
+    Índices de las opciones correctas si el export las marca: <li class="correct"> en la
+    lista de opciones, o el texto de <div class="rightanswer"> ("La respuesta correcta es: ...").
+    Devuelve None si no hay marcas.
+    """
+    ul = qdiv.find("ul", class_="multichoice")
+    if ul:
+        items = ul.find_all("li", recursive=False)
+        key = [i for i, li in enumerate(items) if _is_correct(li) or li.find(class_="correct")]
+        if key:
+            return key
+    right = qdiv.find("div", class_="rightanswer")
+    if right and options:
+        text = clean_spaces(text_with_tex(right)).lower()
+        text = re.sub(r"^.*?(son|es)\s*:\s*", "", text)
+        # El texto es la lista de opciones correctas separadas por ", ": cada opción tiene que
+        # ser un elemento completo de la lista (así "2" no coincide con "x^2 + 2"). Se prueban
+        # primero las más largas, que pueden contener a las cortas.
+        rest = f", {text}, "
+        key = []
+        for i in sorted(range(len(options)), key=lambda i: -len(options[i])):
+            item = f", {options[i].lower()}, "
+            if options[i] and item in rest:
+                key.append(i)
+                rest = rest.replace(item, ", ", 1)
+        if key:
+            return sorted(key)
+    return None
+
 def extract_match(qdiv):
     """
     Extrae estructura de preguntas tipo “relacionar/arrastrar” (<ul class="match">)
@@ -122,6 +174,15 @@ def extract_match(qdiv):
         rows.append(f"[TODAS LAS OPCIONES]: {', '.join(sorted(opts_union))}")
     return rows
 
+def metadata_banco(qtype, options, answer_key):
+    """
+    Campos de la metadata que usa el banco de preguntas para corregir localmente. Solo las
+    preguntas de opciones con clave marcada en el export; el resto, vacío.
+    """
+    if qtype not in ("multiple_choice", "single_choice") or not options or not answer_key:
+        return {}
+    return {"question_type": qtype, "options": options, "answer_key": answer_key}
+
 def extract_question(qdiv, idx):
     qid, qname = find_leading_comment(qdiv)
 
@@ -136,9 +197,10 @@ def extract_question(qdiv, idx):
     # Opciones según tipo
     options = None
     if qtype == "multiple_choice" or qtype == "single_choice":
-        options = extract_multichoice(qdiv)
+        options = extract_multichoice(qdiv) or extract_truefalse(qdiv)
     elif qtype == "match_drag_drop":
         options = extract_match(qdiv)
+    answer_key = extract_answer_key(qdiv, options) if qtype in ("multiple_choice", "single_choice") else None
 
     return {
         "index": idx + 1,
@@ -148,6 +210,8 @@ def extract_question(qdiv, idx):
         "statement": statement or title,
         "type": qtype,
         "options": options if options else None,
+        "answer_key": answer_key,
+        "metadata": metadata_banco(qtype, options, answer_key),
     }
 
 def main():